@@ -0,0 +1,413 @@
+#BACKEND - BÚSQUEDA DE TEXTO EN LAS NOTAS DE LAS SESIONES
+
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+
+import pandas as pd
+
+from functions import execute_query
+
+COLUMNAS_RESULTADOS = ['id_sesion', 'fecha', 'nombre_paciente', 'rango', 'fragmento']
+RESULTADOS_POR_BUSQUEDA = 20
+
+# "postgres" (columna tsvector + GIN) o "local" (índice invertido en memoria y en disco)
+BACKEND_BUSQUEDA = os.getenv("BUSQUEDA_SESIONES_BACKEND", "postgres").lower()
+DIRECTORIO_INDICE = os.getenv("BUSQUEDA_SESIONES_DIR", ".indice_sesiones")
+
+
+class BusquedaSesionesPostgres:
+    """
+    Búsqueda de texto completo sobre notas y temas usando la columna generada
+    sesiones.busqueda (tsvector en español con índice GIN, ver sql/006).
+
+    Los temas pesan más que las notas en el ranking. Como la columna se mantiene
+    sola en la base, indexar_sesion no necesita hacer nada.
+    """
+
+    def indexar_sesion(self, dni_psicologo, sesion):
+        """La base actualiza la columna generada al insertar; no hay nada que hacer."""
+        return True
+
+    def indexar_sesiones(self, dni_psicologo, sesiones):
+        """La base actualiza la columna generada al insertar; no hay nada que hacer."""
+        return True
+
+    def filtro_sql(self, dni_psicologo, consulta):
+        """Condición SQL (sobre el alias 's' de sesiones) y sus parámetros para filtrar por la consulta."""
+        return "s.busqueda @@ websearch_to_tsquery('spanish', %s)", [consulta.strip()]
+
+    def buscar(self, dni_psicologo, consulta, limite=RESULTADOS_POR_BUSQUEDA):
+        """
+        Busca sesiones del psicólogo que coincidan con la consulta.
+
+        La consulta acepta la sintaxis de buscador web: palabras sueltas, "frases
+        entre comillas", OR y -exclusiones.
+
+        Args:
+            dni_psicologo (str): DNI del psicólogo (solo se buscan sus sesiones).
+            consulta (str): Texto a buscar.
+            limite (int, optional): Cantidad máxima de resultados.
+
+        Returns:
+            pandas.DataFrame: Columnas de COLUMNAS_RESULTADOS ordenadas por relevancia;
+                'fragmento' tiene las coincidencias resaltadas en **negrita**.
+        """
+        if not consulta or not consulta.strip():
+            return pd.DataFrame(columns=COLUMNAS_RESULTADOS)
+
+        # El resaltado (ts_headline) es costoso: se calcula solo para las filas ya rankeadas y limitadas
+        query = """
+        SELECT r.id_sesion, r.fecha, r.nombre_paciente, r.rango,
+               ts_headline('spanish',
+                           coalesce(s.temas_principales_desarrollados, '') || ' — ' || coalesce(s.notas_de_la_sesion, ''),
+                           r.q,
+                           'StartSel=**, StopSel=**, MaxWords=30, MinWords=10, MaxFragments=2, FragmentDelimiter=" … "'
+               ) AS fragmento
+        FROM (
+            SELECT s.id_sesion, t.fecha, p.nombre AS nombre_paciente,
+                   ts_rank(s.busqueda, q) AS rango, q
+            FROM sesiones s
+            JOIN turnos t ON s.id_turno = t.id_turnos
+            JOIN pacientes p ON t.dni_paciente = p.dni_paciente,
+                 websearch_to_tsquery('spanish', %s) AS q
+            WHERE t.dni_psicologo = %s
+              AND s.busqueda @@ q
+            ORDER BY rango DESC, t.fecha DESC
+            LIMIT %s
+        ) r
+        JOIN sesiones s ON s.id_sesion = r.id_sesion
+        ORDER BY r.rango DESC, r.fecha DESC
+        """
+        try:
+            df = execute_query(query, conn=None, is_select=True, params=(consulta.strip(), dni_psicologo, limite))
+            if df is None or df.empty:
+                return pd.DataFrame(columns=COLUMNAS_RESULTADOS)
+            return df[COLUMNAS_RESULTADOS]
+        except Exception as e:
+            print(f"Error en la búsqueda de sesiones: {e}")
+            return pd.DataFrame(columns=COLUMNAS_RESULTADOS)
+
+
+# --- BACKEND LOCAL: ÍNDICE INVERTIDO EN PROCESO ---
+
+PALABRAS_VACIAS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aun bien cada como con contra cual cuando de del desde
+donde dos el ella ellas ello ellos en entre era eran es esa esas ese eso esos esta estaba estan estar este esto
+estos fue fueron ha habia han hasta hay la las le les lo los mas me mi mis mucho muy nada ni no nos o otra otras
+otro otros para pero poco por porque que se sea ser si sin sobre su sus tambien tan tanto te tiene tienen todo
+todos tu un una unas uno unos y ya yo
+""".split())
+
+# Sufijos del español, de más largo a más corto (stemming liviano por eliminación de sufijos)
+SUFIJOS = sorted("""
+amientos imientos amiento imiento aciones uciones adoras adores ancias encias amente idades ismos istas
+acion ucion adora ador ancia encia mente idad ismo ista ivas ivos osas osos ando iendo aron ieron aban
+ados idos adas idas able ible iva ivo osa oso ado ido ada ida ar er ir es as os a o e s
+""".split(), key=len, reverse=True)
+LARGO_MINIMO_RAIZ = 3
+
+PATRON_PALABRA = re.compile(r"\w+")
+PATRON_CONSULTA = re.compile(r'(-?)"([^"]+)"|(\S+)')
+
+
+def plegar_acentos(texto):
+    """Pasa a minúsculas y quita tildes y diéresis ('Pánico' -> 'panico')."""
+    descompuesto = unicodedata.normalize("NFKD", texto.lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+def raiz(palabra):
+    """Devuelve la raíz de una palabra ya plegada quitando el sufijo más largo posible."""
+    for sufijo in SUFIJOS:
+        if palabra.endswith(sufijo) and len(palabra) - len(sufijo) >= LARGO_MINIMO_RAIZ:
+            return palabra[:-len(sufijo)]
+    return palabra
+
+
+def tokenizar(texto):
+    """Convierte un texto en la lista de raíces indexables (sin palabras vacías)."""
+    return [raiz(p) for p in PATRON_PALABRA.findall(plegar_acentos(texto or ""))
+            if p not in PALABRAS_VACIAS and not p.isdigit()]
+
+
+def parsear_consulta(consulta):
+    """
+    Interpreta la consulta con la misma sintaxis que websearch_to_tsquery:
+    palabras (AND), "frases" (sus palabras deben aparecer), OR entre grupos y -exclusiones.
+
+    Returns:
+        list: Grupos alternativos (OR); cada uno es (raíces requeridas, raíces excluidas).
+    """
+    grupos = [(set(), set())]
+    for excluir_frase, frase, palabra in PATRON_CONSULTA.findall(consulta):
+        if palabra and palabra.upper() == "OR":
+            grupos.append((set(), set()))
+            continue
+        excluir = bool(excluir_frase) or (palabra or "").startswith("-")
+        raices = tokenizar(frase or palabra.lstrip("-"))
+        (grupos[-1][1] if excluir else grupos[-1][0]).update(raices)
+    return [g for g in grupos if g[0]]
+
+
+def huella_sesion(temas, notas):
+    """Hash del texto de una sesión, igual al que calcula la base en _sincronizar (detecta ediciones)."""
+    return hashlib.md5(f"{temas or ''}\x1f{notas or ''}".encode("utf-8")).hexdigest()
+
+
+def fragmento(temas, notas, consulta, palabras_contexto=12):
+    """Fragmento del texto alrededor de la primera coincidencia, con las coincidencias en **negrita**."""
+    terminos = set().union(*(g[0] for g in parsear_consulta(consulta)))
+    palabras = f"{temas or ''} — {notas or ''}".split()
+    marcadas = [raiz(plegar_acentos(re.sub(r"\W", "", p))) in terminos for p in palabras]
+    primera = marcadas.index(True) if True in marcadas else 0
+    desde = max(0, primera - palabras_contexto)
+    hasta = min(len(palabras), primera + palabras_contexto)
+    texto = " ".join(f"**{p}**" if m else p for p, m in zip(palabras[desde:hasta], marcadas[desde:hasta]))
+    return ("… " if desde > 0 else "") + texto + (" …" if hasta < len(palabras) else "")
+
+
+class IndiceSesiones:
+    """
+    Índice invertido de las sesiones de un psicólogo.
+
+    postings: raíz -> {id_sesion: [frecuencia en temas, frecuencia en notas]}
+    documentos: id_sesion -> {'fecha', 'huella'}
+
+    No guarda el texto de las sesiones: el nombre del paciente y el fragmento de
+    los resultados se leen de la base solo para los mejores resultados.
+    """
+
+    def __init__(self):
+        self.postings = {}
+        self.documentos = {}
+
+    def agregar(self, id_sesion, fecha, temas, notas):
+        """Agrega (o reemplaza) una sesión en el índice."""
+        id_sesion = int(id_sesion)
+        if id_sesion in self.documentos:
+            self.quitar([id_sesion])
+        self.documentos[id_sesion] = {'fecha': str(fecha) if fecha is not None else None,
+                                      'huella': huella_sesion(temas, notas)}
+        for campo, texto in ((0, temas), (1, notas)):
+            for termino in tokenizar(texto):
+                frecuencias = self.postings.setdefault(termino, {}).setdefault(id_sesion, [0, 0])
+                frecuencias[campo] += 1
+
+    def quitar(self, ids):
+        """Quita varias sesiones del índice con una sola pasada por los postings."""
+        ids = {int(i) for i in ids} & self.documentos.keys()
+        if not ids:
+            return
+        for id_sesion in ids:
+            del self.documentos[id_sesion]
+        for termino in list(self.postings):
+            apariciones = self.postings[termino]
+            for id_sesion in ids & apariciones.keys():
+                del apariciones[id_sesion]
+            if not apariciones:
+                del self.postings[termino]
+
+    def ids_coincidentes(self, consulta):
+        """IDs de las sesiones que cumplen la consulta (unión de los grupos OR)."""
+        coincidentes = set()
+        for requeridas, excluidas in parsear_consulta(consulta):
+            # Se intersecta empezando por la raíz menos frecuente
+            listas = sorted((self.postings.get(t, {}) for t in requeridas), key=len)
+            ids = set(listas[0]) if listas else set()
+            for apariciones in listas[1:]:
+                ids.intersection_update(apariciones)
+            for termino in excluidas:
+                ids.difference_update(self.postings.get(termino, {}))
+            coincidentes |= ids
+        return coincidentes
+
+    def puntuar(self, ids, consulta):
+        """Puntaje tf-idf con los temas pesando el doble que las notas."""
+        terminos = set().union(*(g[0] for g in parsear_consulta(consulta)))
+        total = max(len(self.documentos), 1)
+        puntajes = dict.fromkeys(ids, 0.0)
+        for termino in terminos:
+            apariciones = self.postings.get(termino, {})
+            idf = math.log(1 + total / (1 + len(apariciones)))
+            for id_sesion in ids:
+                if id_sesion in apariciones:
+                    en_temas, en_notas = apariciones[id_sesion]
+                    puntajes[id_sesion] += idf * (1 + math.log(2 * en_temas + en_notas))
+        return puntajes
+
+    def a_dict(self):
+        return {'postings': self.postings, 'documentos': self.documentos}
+
+    @classmethod
+    def desde_dict(cls, datos):
+        indice = cls()
+        indice.postings = {t: {int(i): f for i, f in ap.items()} for t, ap in datos['postings'].items()}
+        indice.documentos = {int(i): d for i, d in datos['documentos'].items()}
+        return indice
+
+
+class BusquedaSesionesLocal:
+    """
+    Búsqueda en un índice invertido en proceso, con la misma API que BusquedaSesionesPostgres.
+
+    Cada psicólogo tiene su índice en DIRECTORIO_INDICE/<dni>.json.gz con los postings
+    ya tokenizados y, por sesión, solo la fecha y una huella del texto. Al abrirlo (y
+    cada SEGUNDOS_RESINCRONIZACION) se compara contra las huellas que calcula la base:
+    se reindexan las sesiones nuevas o editadas y se quitan las borradas. Las sesiones
+    guardadas desde la aplicación se agregan con indexar_sesiones, con una sola escritura
+    del archivo por guardado.
+    """
+
+    SEGUNDOS_RESINCRONIZACION = 300
+
+    def __init__(self, directorio=DIRECTORIO_INDICE):
+        self.directorio = directorio
+        self._indices = {}
+        self._sincronizados = {}
+        self._lock = threading.Lock()
+
+    def _ruta(self, dni_psicologo):
+        return os.path.join(self.directorio, f"{dni_psicologo}.json.gz")
+
+    def _guardar(self, dni_psicologo, indice):
+        os.makedirs(self.directorio, exist_ok=True)
+        temporal = self._ruta(dni_psicologo) + ".tmp"
+        with gzip.open(temporal, "wt", encoding="utf-8") as archivo:
+            json.dump(indice.a_dict(), archivo, ensure_ascii=False, separators=(",", ":"))
+        os.replace(temporal, self._ruta(dni_psicologo))
+
+    def _sincronizar(self, dni_psicologo, indice):
+        """
+        Pone el índice al día con la base: agrega sesiones nuevas, reindexa las editadas
+        y quita las borradas. La base devuelve solo id, fecha y huella de cada sesión;
+        el texto se trae únicamente para las que cambiaron.
+
+        Returns:
+            bool: True si el índice cambió (hay que persistirlo).
+        """
+        query_huellas = """
+        SELECT s.id_sesion, t.fecha,
+               md5(coalesce(s.temas_principales_desarrollados, '') || chr(31) ||
+                   coalesce(s.notas_de_la_sesion, '')) AS huella
+        FROM sesiones s
+        JOIN turnos t ON s.id_turno = t.id_turnos
+        WHERE t.dni_psicologo = %s
+        """
+        df = execute_query(query_huellas, conn=None, is_select=True, params=(dni_psicologo,))
+        if df is None:
+            return False
+        en_base = dict(zip(df['id_sesion'].astype(int).tolist(), df['huella'].tolist()))
+
+        borradas = indice.documentos.keys() - en_base.keys()
+        cambiadas = [i for i, huella in en_base.items()
+                     if indice.documentos.get(i, {}).get('huella') != huella]
+        indice.quitar(borradas)
+        if cambiadas:
+            query_textos = """
+            SELECT s.id_sesion, t.fecha, s.temas_principales_desarrollados, s.notas_de_la_sesion
+            FROM sesiones s
+            JOIN turnos t ON s.id_turno = t.id_turnos
+            WHERE t.dni_psicologo = %s AND s.id_sesion = ANY(%s)
+            """
+            df_textos = execute_query(query_textos, conn=None, is_select=True, params=(dni_psicologo, cambiadas))
+            if df_textos is None:
+                return bool(borradas)
+            for fila in df_textos.itertuples(index=False):
+                indice.agregar(fila.id_sesion, fila.fecha,
+                               fila.temas_principales_desarrollados, fila.notas_de_la_sesion)
+        return bool(borradas or cambiadas)
+
+    def _indice(self, dni_psicologo):
+        with self._lock:
+            indice = self._indices.get(dni_psicologo)
+            if indice is None:
+                ruta = self._ruta(dni_psicologo)
+                if os.path.exists(ruta):
+                    with gzip.open(ruta, "rt", encoding="utf-8") as archivo:
+                        indice = IndiceSesiones.desde_dict(json.load(archivo))
+                else:
+                    indice = IndiceSesiones()
+                self._indices[dni_psicologo] = indice
+
+            if time.monotonic() - self._sincronizados.get(dni_psicologo, float("-inf")) > self.SEGUNDOS_RESINCRONIZACION:
+                if self._sincronizar(dni_psicologo, indice):
+                    self._guardar(dni_psicologo, indice)
+                self._sincronizados[dni_psicologo] = time.monotonic()
+            return indice
+
+    def indexar_sesiones(self, dni_psicologo, sesiones):
+        """
+        Agrega sesiones recién guardadas al índice y lo persiste una sola vez.
+
+        Args:
+            sesiones (list): Dicts con 'id_sesion', 'notas_de_la_sesion',
+                'temas_principales_desarrollados' y opcionalmente 'fecha'.
+        """
+        try:
+            indice = self._indice(dni_psicologo)
+            with self._lock:
+                for sesion in sesiones:
+                    indice.agregar(sesion['id_sesion'], sesion.get('fecha'),
+                                   sesion.get('temas_principales_desarrollados'), sesion.get('notas_de_la_sesion'))
+                self._guardar(dni_psicologo, indice)
+            return True
+        except Exception as e:
+            print(f"Error al indexar las sesiones: {e}")
+            return False
+
+    def indexar_sesion(self, dni_psicologo, sesion):
+        """Agrega una sesión recién guardada al índice (ver indexar_sesiones)."""
+        return self.indexar_sesiones(dni_psicologo, [sesion])
+
+    def filtro_sql(self, dni_psicologo, consulta):
+        """Condición SQL (sobre el alias 's' de sesiones) que restringe a los IDs coincidentes."""
+        return "s.id_sesion = ANY(%s)", [sorted(self._indice(dni_psicologo).ids_coincidentes(consulta))]
+
+    def buscar(self, dni_psicologo, consulta, limite=RESULTADOS_POR_BUSQUEDA):
+        """Misma interfaz y mismas columnas que BusquedaSesionesPostgres.buscar."""
+        if not consulta or not consulta.strip():
+            return pd.DataFrame(columns=COLUMNAS_RESULTADOS)
+
+        indice = self._indice(dni_psicologo)
+        puntajes = indice.puntuar(indice.ids_coincidentes(consulta), consulta)
+        mejores = sorted(puntajes, key=lambda i: (puntajes[i], indice.documentos[i]['fecha'] or ""), reverse=True)[:limite]
+        if not mejores:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADOS)
+
+        # Nombre y texto se leen de la base solo para los mejores resultados
+        query = """
+        SELECT s.id_sesion, t.fecha, p.nombre AS nombre_paciente,
+               s.temas_principales_desarrollados, s.notas_de_la_sesion
+        FROM sesiones s
+        JOIN turnos t ON s.id_turno = t.id_turnos
+        JOIN pacientes p ON t.dni_paciente = p.dni_paciente
+        WHERE t.dni_psicologo = %s AND s.id_sesion = ANY(%s)
+        """
+        df = execute_query(query, conn=None, is_select=True, params=(dni_psicologo, mejores))
+        if df is None or df.empty:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADOS)
+
+        df['id_sesion'] = df['id_sesion'].astype(int)
+        df['rango'] = df['id_sesion'].map(puntajes)
+        df['fragmento'] = [fragmento(f.temas_principales_desarrollados, f.notas_de_la_sesion, consulta)
+                           for f in df.itertuples(index=False)]
+        orden = {id_sesion: posicion for posicion, id_sesion in enumerate(mejores)}
+        return df.sort_values('id_sesion', key=lambda ids: ids.map(orden))[COLUMNAS_RESULTADOS].reset_index(drop=True)
+
+
+_buscador = None
+
+
+def obtener_buscador_sesiones():
+    """Devuelve el backend de búsqueda configurado en BUSQUEDA_SESIONES_BACKEND (una instancia por proceso)."""
+    global _buscador
+    if _buscador is None:
+        _buscador = BusquedaSesionesLocal() if BACKEND_BUSQUEDA == "local" else BusquedaSesionesPostgres()
+    return _buscador
@@ -0,0 +1,481 @@
+#BACKEND - EXPORTACIÓN DE TURNOS EN FORMATO iCalendar (.ics)
+
+import calendar
+import hashlib
+import hmac
+import os
+import re
+from datetime import date, datetime, time, timedelta, timezone
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from functions import connect_to_supabase, execute_values_query, MINUTOS_POR_SLOT
+
+FILAS_POR_LOTE = 500         # Filas que trae el cursor del servidor en cada viaje
+
+PRODID = "-//Mindlink//Agenda de Turnos//ES"
+
+# Zona horaria de la agenda: los turnos se guardan en hora local sin zona
+ZONA_AGENDA = os.getenv("AGENDA_TZ", "America/Argentina/Buenos_Aires")
+
+
+def escapar_texto_ics(texto):
+    """Escapa un texto según RFC 5545 (barras, punto y coma, comas y saltos de línea)."""
+    return (str(texto)
+            .replace("\\", "\\\\")
+            .replace(";", "\\;")
+            .replace(",", "\\,")
+            .replace("\r\n", "\\n")
+            .replace("\n", "\\n"))
+
+
+def plegar_linea_ics(linea):
+    """
+    Pliega una línea de contenido a 75 octetos como exige RFC 5545
+    (las continuaciones empiezan con un espacio). Devuelve la línea con CRLF final.
+    """
+    datos = linea.encode("utf-8")
+    if len(datos) <= 75:
+        return linea + "\r\n"
+
+    partes = []
+    actual = ""
+    limite = 75
+    for caracter in linea:
+        if len((actual + caracter).encode("utf-8")) > limite:
+            partes.append(actual)
+            actual = caracter
+            limite = 74  # El espacio inicial de la continuación cuenta como octeto
+        else:
+            actual += caracter
+    partes.append(actual)
+    return "\r\n ".join(partes) + "\r\n"
+
+
+def _formato_fecha_hora(valor):
+    return valor.strftime("%Y%m%dT%H%M%S")
+
+
+def _formato_utc(valor):
+    """Hora local de la agenda (sin zona) -> fecha-hora UTC de RFC 5545 ('...Z')."""
+    return _formato_fecha_hora(valor.replace(tzinfo=ZoneInfo(ZONA_AGENDA)).astimezone(timezone.utc)) + "Z"
+
+
+def generar_ics_turnos(dni_psicologo, nombre_calendario="Agenda de Turnos"):
+    """
+    Genera el calendario .ics de los turnos de un psicólogo línea por línea.
+
+    Usa un cursor del lado del servidor (cursor con nombre) que trae las filas en
+    lotes de FILAS_POR_LOTE, así un historial de varios años nunca se carga
+    completo en memoria. La conexión se cierra al terminar de consumir el generador.
+    Los horarios se emiten en UTC (sufijo Z), convertidos desde ZONA_AGENDA, para
+    que los clientes en otra zona horaria muestren la hora correcta.
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+        nombre_calendario (str, optional): Nombre que mostrará el cliente de calendario.
+
+    Yields:
+        str: Líneas del archivo .ics ya plegadas y terminadas en CRLF.
+    """
+    conn = connect_to_supabase()
+    if conn is None:
+        return
+
+    try:
+        yield plegar_linea_ics("BEGIN:VCALENDAR")
+        yield plegar_linea_ics("VERSION:2.0")
+        yield plegar_linea_ics(f"PRODID:{PRODID}")
+        yield plegar_linea_ics("CALSCALE:GREGORIAN")
+        yield plegar_linea_ics("METHOD:PUBLISH")
+        yield plegar_linea_ics(f"X-WR-CALNAME:{escapar_texto_ics(nombre_calendario)}")
+
+        cursor = conn.cursor(name="ics_turnos")
+        cursor.itersize = FILAS_POR_LOTE
+        # La duración de cada turno es la de su slot en la plantilla de horarios del psicólogo
+        cursor.execute("""
+            SELECT t.id_turnos, (t.fecha + t.hora) AS inicio, p.nombre,
+                   coalesce(h.duracion_slot, %s) AS duracion
+            FROM turnos t
+            JOIN pacientes p ON t.dni_paciente = p.dni_paciente
+            LEFT JOIN LATERAL (
+                SELECT duracion_slot
+                FROM horarios_psicologo
+                WHERE dni_psicologo = t.dni_psicologo
+                  AND dia_semana = extract(isodow FROM t.fecha)::int - 1
+                  AND t.hora >= hora_inicio AND t.hora < hora_fin
+                LIMIT 1
+            ) h ON true
+            WHERE t.dni_psicologo = %s
+            ORDER BY t.fecha, t.hora
+        """, (MINUTOS_POR_SLOT, dni_psicologo))
+
+        marca_generacion = _formato_fecha_hora(datetime.now(timezone.utc)) + "Z"
+
+        for id_turno, inicio, nombre_paciente, duracion in cursor:
+            yield plegar_linea_ics("BEGIN:VEVENT")
+            yield plegar_linea_ics(f"UID:turno-{id_turno}@mindlink")
+            yield plegar_linea_ics(f"DTSTAMP:{marca_generacion}")
+            yield plegar_linea_ics(f"DTSTART:{_formato_utc(inicio)}")
+            yield plegar_linea_ics(f"DTEND:{_formato_utc(inicio + timedelta(minutes=duracion))}")
+            yield plegar_linea_ics(f"SUMMARY:{escapar_texto_ics('Turno: ' + str(nombre_paciente))}")
+            yield plegar_linea_ics("END:VEVENT")
+
+        cursor.close()
+        yield plegar_linea_ics("END:VCALENDAR")
+    finally:
+        conn.close()
+
+
+def huella_agenda(dni_psicologo):
+    """
+    Calcula una huella (hash) de los turnos de un psicólogo con una sola consulta
+    agregada. Cambia cuando se agrega, elimina o mueve un turno, cuando cambia el nombre
+    de un paciente (que va en el título del evento) o cuando cambia la plantilla de
+    horarios (que define la duración de los turnos); se usa como ETag.
+
+    Returns:
+        str or None: Hash hexadecimal, o None si no se pudo consultar la base.
+    """
+    conn = connect_to_supabase()
+    if conn is None:
+        return None
+
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT md5(coalesce(string_agg(t.id_turnos::text || '|' || t.fecha::text || '|' || t.hora::text
+                                           || '|' || t.dni_paciente::text || '|' || coalesce(p.nombre, ''),
+                                           ',' ORDER BY t.id_turnos), '')
+                       || coalesce((SELECT string_agg(dia_semana::text || '|' || hora_inicio::text || '|'
+                                                      || hora_fin::text || '|' || duracion_slot::text,
+                                                      ',' ORDER BY dia_semana, hora_inicio)
+                                    FROM horarios_psicologo WHERE dni_psicologo = %s), ''))
+            FROM turnos t
+            LEFT JOIN pacientes p ON p.dni_paciente = t.dni_paciente
+            WHERE t.dni_psicologo = %s
+        """, (dni_psicologo, dni_psicologo))
+        huella = cursor.fetchone()[0]
+        cursor.close()
+        return huella
+    except Exception as e:
+        print(f"Error calculando la huella de la agenda: {e}")
+        return None
+    finally:
+        conn.close()
+
+
+def token_feed(dni_psicologo):
+    """
+    Token de suscripción al feed .ics de un psicólogo (HMAC del DNI con ICS_FEED_SECRET).
+    Devuelve None si ICS_FEED_SECRET no está configurado.
+    """
+    secreto = os.getenv("ICS_FEED_SECRET")
+    if not secreto:
+        return None
+    return hmac.new(secreto.encode("utf-8"), str(dni_psicologo).encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+
+def url_feed(dni_psicologo):
+    """
+    URL de suscripción al feed .ics (ICS_FEED_BASE_URL + ruta + token), o None
+    si el feed no está configurado.
+    """
+    base = os.getenv("ICS_FEED_BASE_URL")
+    token = token_feed(dni_psicologo)
+    if not base or not token:
+        return None
+    return f"{base.rstrip('/')}/agenda/{dni_psicologo}.ics?token={token}"
+
+
+# --- IMPORTACIÓN DE CALENDARIOS EXTERNOS ---
+
+DIAS_ICS = {'MO': 0, 'TU': 1, 'WE': 2, 'TH': 3, 'FR': 4, 'SA': 5, 'SU': 6}
+PATRON_DURACION = re.compile(r"^(?P<signo>[+-])?P(?:(?P<semanas>\d+)W)?(?:(?P<dias>\d+)D)?"
+                             r"(?:T(?:(?P<horas>\d+)H)?(?:(?P<minutos>\d+)M)?(?:(?P<segundos>\d+)S)?)?$")
+
+
+def leer_lineas_ics(archivo):
+    """
+    Lee un archivo .ics (binario) línea por línea y desdobla las líneas plegadas
+    (las que continúan empezando con espacio o tabulación). Nunca carga el archivo completo.
+
+    Yields:
+        str: Líneas lógicas de contenido, sin el salto de línea.
+    """
+    pendiente = None
+    for linea_bytes in archivo:
+        linea = linea_bytes.decode("utf-8", errors="replace").rstrip("\r\n")
+        if linea[:1] in (" ", "\t") and pendiente is not None:
+            pendiente += linea[1:]
+            continue
+        if pendiente is not None:
+            yield pendiente
+        pendiente = linea
+    if pendiente:
+        yield pendiente
+
+
+def parsear_propiedad(linea):
+    """
+    Separa una línea 'NOMBRE;PARAM=valor:VALOR' en (nombre, parámetros, valor).
+    Respeta los ':' y ';' que aparecen entre comillas dentro de los parámetros.
+    """
+    en_comillas = False
+    for posicion, caracter in enumerate(linea):
+        if caracter == '"':
+            en_comillas = not en_comillas
+        elif caracter == ':' and not en_comillas:
+            cabecera, valor = linea[:posicion], linea[posicion + 1:]
+            break
+    else:
+        return linea.upper(), {}, ""
+
+    partes = re.split(r';(?=(?:[^"]*"[^"]*")*[^"]*$)', cabecera)
+    parametros = {}
+    for parametro in partes[1:]:
+        clave, _, valor_parametro = parametro.partition('=')
+        parametros[clave.upper()] = valor_parametro.strip('"')
+    return partes[0].upper(), parametros, valor
+
+
+def _zona(nombre):
+    try:
+        return ZoneInfo(nombre)
+    except (ZoneInfoNotFoundError, ValueError):
+        return ZoneInfo(ZONA_AGENDA)
+
+
+def parsear_fecha_ics(valor, parametros):
+    """
+    Convierte un DTSTART/DTEND/EXDATE a datetime local de la agenda (sin zona).
+
+    Returns:
+        tuple: (datetime, es_dia_completo).
+    """
+    valor = valor.strip()
+    if parametros.get('VALUE') == 'DATE' or len(valor) == 8:
+        return datetime.strptime(valor[:8], "%Y%m%d"), True
+
+    if valor.endswith('Z'):
+        momento = datetime.strptime(valor[:15], "%Y%m%dT%H%M%S").replace(tzinfo=timezone.utc)
+    else:
+        momento = datetime.strptime(valor[:15], "%Y%m%dT%H%M%S")
+        if 'TZID' not in parametros:
+            return momento, False  # Hora flotante: se interpreta como hora local
+        momento = momento.replace(tzinfo=_zona(parametros['TZID']))
+    return momento.astimezone(ZoneInfo(ZONA_AGENDA)).replace(tzinfo=None), False
+
+
+def parsear_duracion_ics(valor):
+    """Convierte una DURATION de RFC 5545 (ej. 'PT1H30M', 'P1D') a timedelta."""
+    coincidencia = PATRON_DURACION.match(valor.strip())
+    if not coincidencia:
+        return None
+    partes = {k: int(v) for k, v in coincidencia.groupdict().items() if v and k != 'signo'}
+    duracion = timedelta(weeks=partes.get('semanas', 0), days=partes.get('dias', 0),
+                         hours=partes.get('horas', 0), minutes=partes.get('minutos', 0),
+                         seconds=partes.get('segundos', 0))
+    return -duracion if coincidencia.group('signo') == '-' else duracion
+
+
+def iterar_eventos_ics(lineas):
+    """
+    Recorre las líneas lógicas y devuelve un evento (VEVENT) a la vez, guardando
+    solo las propiedades necesarias para calcular la ocupación.
+
+    Yields:
+        dict: Propiedades del evento -> lista de (parámetros, valor).
+    """
+    evento = None
+    anidado = 0
+    for linea in lineas:
+        nombre, parametros, valor = parsear_propiedad(linea)
+        if nombre == 'BEGIN':
+            if valor.upper() == 'VEVENT':
+                evento, anidado = {}, 0
+            elif evento is not None:
+                anidado += 1  # VALARM u otros componentes dentro del evento
+        elif nombre == 'END':
+            if valor.upper() == 'VEVENT' and evento is not None:
+                yield evento
+                evento = None
+            elif evento is not None:
+                anidado -= 1
+        elif evento is not None and anidado == 0 and nombre in (
+                'DTSTART', 'DTEND', 'DURATION', 'RRULE', 'EXDATE', 'STATUS', 'TRANSP'):
+            evento.setdefault(nombre, []).append((parametros, valor))
+
+
+def _sumar_meses(fecha_hora, meses):
+    """Suma meses; devuelve None si el día no existe en el mes destino (RFC 5545 lo omite)."""
+    mes_total = fecha_hora.month - 1 + meses
+    anio, mes = fecha_hora.year + mes_total // 12, mes_total % 12 + 1
+    if fecha_hora.day > calendar.monthrange(anio, mes)[1]:
+        return None
+    return fecha_hora.replace(year=anio, month=mes)
+
+
+def expandir_ocurrencias(inicio, regla, hasta):
+    """
+    Genera los inicios de las ocurrencias de un evento recurrente hasta 'hasta'.
+
+    Soporta FREQ=DAILY/WEEKLY/MONTHLY/YEARLY con INTERVAL, COUNT, UNTIL y BYDAY
+    (este último en reglas semanales). Sin RRULE devuelve solo 'inicio'.
+    """
+    if not regla:
+        if inicio <= hasta:
+            yield inicio
+        return
+
+    partes = dict(p.split('=', 1) for p in regla.upper().split(';') if '=' in p)
+    frecuencia = partes.get('FREQ')
+    intervalo = max(int(partes.get('INTERVAL', 1)), 1)
+    restantes = int(partes['COUNT']) if 'COUNT' in partes else None
+    if 'UNTIL' in partes:
+        limite, es_dia_completo = parsear_fecha_ics(partes['UNTIL'], {})
+        if es_dia_completo:
+            limite = datetime.combine(limite.date(), time.max)
+        hasta = min(hasta, limite)
+
+    dias_semana = sorted(DIAS_ICS[d[-2:]] for d in partes.get('BYDAY', '').split(',') if d[-2:] in DIAS_ICS)
+
+    paso = 0
+    while True:
+        if frecuencia == 'DAILY':
+            candidatos = [inicio + timedelta(days=paso * intervalo)]
+        elif frecuencia == 'WEEKLY':
+            base = inicio + timedelta(weeks=paso * intervalo)
+            if dias_semana:
+                lunes = base - timedelta(days=base.weekday())
+                candidatos = [lunes + timedelta(days=d) for d in dias_semana]
+            else:
+                candidatos = [base]
+        elif frecuencia == 'MONTHLY':
+            candidatos = [_sumar_meses(inicio, paso * intervalo)]
+        elif frecuencia == 'YEARLY':
+            candidatos = [_sumar_meses(inicio, 12 * paso * intervalo)]
+        else:
+            candidatos = [inicio] if paso == 0 else []
+
+        if not candidatos:
+            return
+        for ocurrencia in candidatos:
+            if ocurrencia is None or ocurrencia < inicio:
+                continue
+            if ocurrencia > hasta:
+                return
+            yield ocurrencia
+            if restantes is not None:
+                restantes -= 1
+                if restantes <= 0:
+                    return
+        paso += 1
+
+
+def iterar_intervalos_ocupados(archivo, desde, hasta):
+    """
+    Lee un .ics en streaming y devuelve los intervalos ocupados dentro de la ventana.
+
+    Los eventos recurrentes se expanden solo hasta 'hasta', así un evento semanal
+    sin fin no genera ocurrencias infinitas. Los eventos cancelados o marcados como
+    "disponible" (TRANSP:TRANSPARENT) se ignoran.
+
+    Args:
+        archivo: Archivo binario iterable por líneas (ej. el de st.file_uploader).
+        desde (datetime.datetime): Inicio de la ventana.
+        hasta (datetime.datetime): Fin de la ventana.
+
+    Yields:
+        tuple: (inicio, fin) como datetime locales sin zona horaria.
+    """
+    for evento in iterar_eventos_ics(leer_lineas_ics(archivo)):
+        if 'DTSTART' not in evento:
+            continue
+        if evento.get('STATUS', [({}, '')])[0][1].upper() == 'CANCELLED':
+            continue
+        if evento.get('TRANSP', [({}, '')])[0][1].upper() == 'TRANSPARENT':
+            continue
+
+        inicio, dia_completo = parsear_fecha_ics(evento['DTSTART'][0][1], evento['DTSTART'][0][0])
+        if 'DTEND' in evento:
+            duracion = parsear_fecha_ics(evento['DTEND'][0][1], evento['DTEND'][0][0])[0] - inicio
+        elif 'DURATION' in evento:
+            duracion = parsear_duracion_ics(evento['DURATION'][0][1]) or timedelta(0)
+        else:
+            duracion = timedelta(days=1) if dia_completo else timedelta(0)
+        if duracion <= timedelta(0):
+            continue
+
+        excluidas = set()
+        for parametros, valor in evento.get('EXDATE', []):
+            for parte in valor.split(','):
+                excluidas.add(parsear_fecha_ics(parte, parametros)[0])
+
+        regla = evento['RRULE'][0][1] if 'RRULE' in evento else None
+        for ocurrencia in expandir_ocurrencias(inicio, regla, hasta):
+            if ocurrencia in excluidas or ocurrencia + duracion <= desde:
+                continue
+            yield ocurrencia, ocurrencia + duracion
+
+
+def importar_ics_como_bloqueos(archivo, dni_psicologo, dias_ventana=180, tamano_lote=500):
+    """
+    Importa un calendario externo como bloqueos de agenda (origen 'ics').
+
+    El archivo se procesa en streaming y los intervalos se insertan en lotes de
+    tamano_lote filas, así la memoria usada no depende del tamaño del archivo.
+    Los bloqueos importados anteriormente dentro de la ventana se reemplazan,
+    todo en una misma transacción.
+
+    Args:
+        archivo: Archivo .ics binario iterable por líneas.
+        dni_psicologo (str): DNI del psicólogo.
+        dias_ventana (int, optional): Días hacia adelante a expandir desde hoy.
+        tamano_lote (int, optional): Filas por INSERT.
+
+    Returns:
+        int or None: Cantidad de bloqueos importados, o None si hubo un error.
+    """
+    desde = datetime.combine(date.today(), time.min)
+    hasta = desde + timedelta(days=dias_ventana)
+
+    conn = connect_to_supabase()
+    if conn is None:
+        return None
+
+    query_insert = """
+    INSERT INTO bloqueos_agenda (dni_psicologo, inicio, fin, motivo, origen)
+    VALUES %s
+    """
+    try:
+        cursor = conn.cursor()
+        cursor.execute("""
+            DELETE FROM bloqueos_agenda
+            WHERE dni_psicologo = %s AND origen = 'ics' AND fin > %s AND inicio < %s
+        """, (dni_psicologo, desde, hasta))
+        cursor.close()
+
+        total = 0
+        lote = []
+        for inicio, fin in iterar_intervalos_ocupados(archivo, desde, hasta):
+            lote.append((dni_psicologo, max(inicio, desde), min(fin, hasta), 'Calendario externo', 'ics'))
+            if len(lote) >= tamano_lote:
+                if not execute_values_query(query_insert, lote, conn=conn):
+                    conn.rollback()
+                    return None
+                total += len(lote)
+                lote = []
+        if lote:
+            if not execute_values_query(query_insert, lote, conn=conn):
+                conn.rollback()
+                return None
+            total += len(lote)
+
+        conn.commit()
+        return total
+    except Exception as e:
+        conn.rollback()
+        print(f"Error importando calendario externo: {e}")
+        return None
+    finally:
+        conn.close()
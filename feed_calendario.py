@@ -0,0 +1,114 @@
+"""
+Servidor del feed de suscripción .ics de la agenda.
+
+Los clientes de calendario (Google Calendar, Apple Calendar, etc.) consultan la
+URL del feed cada pocos minutos. Para que eso no cueste casi nada:
+
+- La huella de la agenda (ETag) se consulta a la base como mucho una vez cada
+  FEED_TTL_SEGUNDOS por psicólogo y se guarda en memoria.
+- Si el cliente envía If-None-Match / If-Modified-Since y la agenda no cambió,
+  se responde 304 sin tocar la tabla de turnos.
+- Solo cuando hubo cambios se genera el .ics, en streaming desde un cursor del servidor.
+
+Uso:
+    python feed_calendario.py
+
+Requiere ICS_FEED_SECRET en el .env (ver env.sample).
+"""
+
+import hmac
+import os
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import parse_qs
+from wsgiref.simple_server import make_server
+
+from calendario_ics import generar_ics_turnos, huella_agenda, token_feed
+
+FEED_TTL_SEGUNDOS = int(os.getenv("ICS_FEED_TTL", "60"))
+RUTA_FEED = re.compile(r"^/agenda/(?P<dni>\d{7,8})\.ics$")
+
+# dni -> {'etag': str, 'last_modified': datetime, 'verificado': float}
+_estado_feeds = {}
+
+
+def _estado_actual(dni_psicologo):
+    """Devuelve (etag, last_modified) de la agenda, consultando la base solo si venció el TTL."""
+    ahora = time.monotonic()
+    estado = _estado_feeds.get(dni_psicologo)
+    if estado and ahora - estado['verificado'] < FEED_TTL_SEGUNDOS:
+        return estado['etag'], estado['last_modified']
+
+    huella = huella_agenda(dni_psicologo)
+    if huella is None:
+        return None, None
+
+    etag = f'"{huella}"'
+    if estado and estado['etag'] == etag:
+        last_modified = estado['last_modified']
+    else:
+        last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+    _estado_feeds[dni_psicologo] = {'etag': etag, 'last_modified': last_modified, 'verificado': ahora}
+    return etag, last_modified
+
+
+def _no_modificado(environ, etag, last_modified):
+    """Evalúa los encabezados condicionales (If-None-Match tiene prioridad)."""
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etiquetas = [e.strip() for e in if_none_match.split(',')]
+        return '*' in etiquetas or etag in etiquetas or f"W/{etag}" in etiquetas
+
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def aplicacion(environ, start_response):
+    """Aplicación WSGI del feed: GET /agenda/<dni>.ics?token=<token>."""
+    coincidencia = RUTA_FEED.match(environ.get('PATH_INFO', ''))
+    if environ.get('REQUEST_METHOD') not in ('GET', 'HEAD') or not coincidencia:
+        start_response('404 Not Found', [('Content-Type', 'text/plain; charset=utf-8')])
+        return [b'No encontrado']
+
+    dni_psicologo = coincidencia.group('dni')
+    token = parse_qs(environ.get('QUERY_STRING', '')).get('token', [''])[0]
+    esperado = token_feed(dni_psicologo)
+    if not esperado or not hmac.compare_digest(token, esperado):
+        start_response('403 Forbidden', [('Content-Type', 'text/plain; charset=utf-8')])
+        return [b'Token invalido']
+
+    etag, last_modified = _estado_actual(dni_psicologo)
+    if etag is None:
+        start_response('503 Service Unavailable', [('Content-Type', 'text/plain; charset=utf-8')])
+        return [b'Base de datos no disponible']
+
+    encabezados = [
+        ('ETag', etag),
+        ('Last-Modified', format_datetime(last_modified, usegmt=True)),
+        ('Cache-Control', f'private, max-age={FEED_TTL_SEGUNDOS}'),
+    ]
+
+    if _no_modificado(environ, etag, last_modified):
+        start_response('304 Not Modified', encabezados)
+        return []
+
+    start_response('200 OK', [('Content-Type', 'text/calendar; charset=utf-8')] + encabezados)
+    if environ['REQUEST_METHOD'] == 'HEAD':
+        return []
+    return (linea.encode('utf-8') for linea in generar_ics_turnos(dni_psicologo))
+
+
+if __name__ == '__main__':
+    if not os.getenv("ICS_FEED_SECRET"):
+        raise SystemExit("Configure ICS_FEED_SECRET en el archivo .env para habilitar el feed.")
+    puerto = int(os.getenv("ICS_FEED_PORT", "8502"))
+    print(f"Feed de calendario escuchando en el puerto {puerto}")
+    make_server('', puerto, aplicacion).serve_forever()
@@ -1,16 +1,28 @@
 #BACKEND
 
 import psycopg2
+import psycopg2.extras
 import os
 from dotenv import load_dotenv
 import pandas as pd
 import streamlit as st
-from datetime import date
+from datetime import date, datetime, timedelta
+from bisect import bisect_right
+from functools import lru_cache
 from dateutil.parser import parse
 
 # Load environment variables from .env file 
 load_dotenv()
 
+# Horarios de atención (inicio de cada slot) compartidos por las páginas de agenda
+HORARIOS_AGENDA = [
+    "08:00", "08:30", "09:00", "09:30", "10:00", "10:30",
+    "11:00", "11:30", "12:00", "12:30", "13:00", "13:30",
+    "14:00", "14:30", "15:00", "15:30", "16:00", "16:30",
+    "17:00", "17:30", "18:00", "18:30", "19:00", "19:30"
+]
+MINUTOS_POR_SLOT = 30
+
 def connect_to_supabase():
     """
     Connects to the Supabase PostgreSQL database using transaction pooler details
@@ -45,7 +57,7 @@ def connect_to_supabase():
         return None
 
 
-def execute_query(query, conn=None, is_select=True):
+def execute_query(query, conn=None, is_select=True, params=None):
     """
     Executes a SQL query and returns the results as a pandas DataFrame for SELECT queries,
     or executes DML operations (INSERT, UPDATE, DELETE) and returns success status.
@@ -56,6 +68,8 @@ def execute_query(query, conn=None, is_select=True):
             If None, a new connection will be established.
         is_select (bool, optional): Whether the query is a SELECT query (True) or 
             a DML operation like INSERT/UPDATE/DELETE (False). Default is True.
+        params (tuple or list, optional): Parameters for a parameterized query
+            (placeholders %s). Default is None.
             
     Returns:
         pandas.DataFrame or bool: A DataFrame containing the query results for SELECT queries,
@@ -70,7 +84,10 @@ def execute_query(query, conn=None, is_select=True):
         
         # Create cursor and execute query
         cursor = conn.cursor()
-        cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
         
         if is_select:
             # Fetch all results for SELECT queries
@@ -100,6 +117,452 @@ def execute_query(query, conn=None, is_select=True):
             conn.rollback()
         return pd.DataFrame() if is_select else False
 
+def execute_values_query(query, rows, conn=None, fetch=False):
+    """
+    Ejecuta un INSERT/UPDATE con muchas filas en una sola sentencia usando
+    psycopg2.extras.execute_values (el placeholder VALUES %s se expande con todas las filas).
+
+    Args:
+        query (str): Consulta con un único placeholder %s para la lista de VALUES.
+        rows (list): Lista de tuplas con los valores de cada fila.
+        conn (psycopg2.extensions.connection, optional): Conexión a usar. Si se
+            pasa una conexión, NO se hace commit: queda a cargo del llamador
+            (permite agrupar varias sentencias en una misma transacción).
+        fetch (bool, optional): Si la consulta tiene RETURNING, devuelve las filas
+            resultantes como DataFrame. Default False.
+
+    Returns:
+        pandas.DataFrame or bool: DataFrame con lo devuelto por RETURNING si fetch=True,
+            o True si la operación fue exitosa. None (con fetch=True) / False si hubo error;
+            un DataFrame vacío significa que la sentencia no devolvió filas.
+    """
+    if not rows:
+        return pd.DataFrame() if fetch else True
+
+    close_conn = False
+    try:
+        if conn is None:
+            conn = connect_to_supabase()
+            close_conn = True
+
+        cursor = conn.cursor()
+        # page_size = len(rows) para que todas las filas viajen en una única sentencia
+        results = psycopg2.extras.execute_values(cursor, query, rows, page_size=len(rows), fetch=fetch)
+
+        if fetch:
+            colnames = [desc[0] for desc in cursor.description]
+            result = pd.DataFrame(results, columns=colnames)
+        else:
+            result = True
+
+        if close_conn:
+            conn.commit()
+        cursor.close()
+        if close_conn:
+            conn.close()
+
+        return result
+    except Exception as e:
+        print(f"Error executing batch query: {e}")
+        if conn and close_conn:
+            conn.rollback()
+            conn.close()
+        return None if fetch else False
+
+PROXIMOS_TURNOS_EN_CACHE = 10  # Turnos que se traen y cachean por psicólogo; cada página toma los que necesita
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_proximos_turnos(dni_psicologo):
+    """
+    Devuelve los próximos PROXIMOS_TURNOS_EN_CACHE turnos de un psicólogo (a partir de este momento).
+
+    Es el servicio compartido de "próximo turno": lo usan la agenda y la página de
+    sesiones, así ambas muestran lo mismo y comparten una única entrada de caché por
+    psicólogo; cada página corta la lista con [:k]. La consulta usa el índice
+    (dni_psicologo, fecha, hora) y corta con LIMIT.
+    Después de agregar, mover o eliminar turnos llamar a invalidar_proximos_turnos().
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+
+    Returns:
+        list: Diccionarios con 'id_turno', 'dni_paciente', 'paciente', 'fecha'
+            (datetime.date), 'horario' ('HH:MM') y 'datetime', ordenados por fecha y hora.
+    """
+    if not dni_psicologo:
+        return []
+
+    ahora = datetime.now()
+    query = """
+    SELECT t.id_turnos AS id_turno,
+           t.dni_paciente,
+           p.nombre AS paciente,
+           t.fecha,
+           to_char(t.hora, 'HH24:MI') AS horario,
+           (t.fecha + t.hora) AS datetime
+    FROM turnos t
+    JOIN pacientes p ON t.dni_paciente = p.dni_paciente
+    WHERE t.dni_psicologo = %s
+      AND (t.fecha, t.hora) >= (%s::date, %s::time)
+    ORDER BY t.fecha, t.hora
+    LIMIT %s
+    """
+    try:
+        df = execute_query(query, is_select=True,
+                           params=(dni_psicologo, ahora.date(), ahora.time().replace(microsecond=0),
+                                   PROXIMOS_TURNOS_EN_CACHE))
+        if df is None or df.empty:
+            return []
+        return [{
+            'id_turno': int(row['id_turno']),
+            'dni_paciente': str(row['dni_paciente']),
+            'paciente': str(row['paciente']),
+            'fecha': row['fecha'],
+            'horario': row['horario'],
+            'datetime': row['datetime'],
+        } for _, row in df.iterrows()]
+    except Exception as e:
+        print(f"Error al cargar próximos turnos: {e}")
+        return []
+
+
+def invalidar_proximos_turnos():
+    """Limpia la caché compartida de próximos turnos (llamar tras modificar la tabla turnos)."""
+    cargar_proximos_turnos.clear()
+
+
+# --- HORARIOS DE ATENCIÓN Y DISPONIBILIDAD ---
+
+# Plantilla usada cuando el psicólogo no configuró su horario: todos los días,
+# con los mismos slots que HORARIOS_AGENDA. Filas (dia_semana, inicio, fin, duracion).
+PLANTILLA_HORARIO_POR_DEFECTO = tuple((dia, "08:00", "20:00", MINUTOS_POR_SLOT) for dia in range(7))
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_plantilla_horario(dni_psicologo):
+    """
+    Carga la plantilla semanal de horarios de atención de un psicólogo.
+
+    Returns:
+        tuple: Filas (dia_semana, 'HH:MM' inicio, 'HH:MM' fin, duracion_slot) ordenadas.
+            Es hashable, así que sirve directamente como versión de la plantilla para
+            materializar_slots. Si no hay horario configurado devuelve
+            PLANTILLA_HORARIO_POR_DEFECTO.
+    """
+    query = """
+    SELECT dia_semana,
+           to_char(hora_inicio, 'HH24:MI') AS hora_inicio,
+           to_char(hora_fin, 'HH24:MI') AS hora_fin,
+           duracion_slot
+    FROM horarios_psicologo
+    WHERE dni_psicologo = %s
+    ORDER BY dia_semana, hora_inicio
+    """
+    df = execute_query(query, is_select=True, params=(dni_psicologo,))
+    if df is None or df.empty:
+        return PLANTILLA_HORARIO_POR_DEFECTO
+    return tuple((int(row['dia_semana']), row['hora_inicio'], row['hora_fin'], int(row['duracion_slot']))
+                 for _, row in df.iterrows())
+
+
+@lru_cache(maxsize=256)
+def materializar_slots(plantilla):
+    """
+    Genera, una sola vez por versión de plantilla, los slots de cada día de la semana.
+
+    Args:
+        plantilla (tuple): Filas devueltas por cargar_plantilla_horario.
+
+    Returns:
+        dict: dia_semana -> tupla ordenada de horarios 'HH:MM'.
+    """
+    slots = {dia: set() for dia in range(7)}
+    for dia, inicio, fin, duracion in plantilla:
+        minuto = int(inicio[:2]) * 60 + int(inicio[3:5])
+        minuto_fin = int(fin[:2]) * 60 + int(fin[3:5])
+        while minuto + duracion <= minuto_fin:
+            slots[dia].add(f"{minuto // 60:02d}:{minuto % 60:02d}")
+            minuto += duracion
+    return {dia: tuple(sorted(horarios)) for dia, horarios in slots.items()}
+
+
+def duracion_slot_en(plantilla, dia_semana, horario):
+    """Duración en minutos del slot que empieza en 'horario' según la plantilla."""
+    minuto = int(horario[:2]) * 60 + int(horario[3:5])
+    for dia, inicio, fin, duracion in plantilla:
+        if (dia == dia_semana and
+                int(inicio[:2]) * 60 + int(inicio[3:5]) <= minuto < int(fin[:2]) * 60 + int(fin[3:5])):
+            return duracion
+    return MINUTOS_POR_SLOT
+
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_bloqueos(dni_psicologo, fecha_desde, fecha_hasta):
+    """
+    Carga los bloqueos del psicólogo y los feriados que se superponen con
+    [fecha_desde, fecha_hasta] (ambas inclusive).
+
+    Returns:
+        pandas.DataFrame: Columnas 'id_bloqueo' (None para feriados), 'inicio', 'fin',
+            'motivo' y 'origen'.
+    """
+    query = """
+    SELECT id_bloqueo, inicio, fin, motivo, origen
+    FROM bloqueos_agenda
+    WHERE dni_psicologo = %s
+      AND inicio < %s::date + 1
+      AND fin > %s::date
+    UNION ALL
+    SELECT NULL, fecha::timestamp, fecha + 1, descripcion, 'feriado'
+    FROM feriados
+    WHERE fecha BETWEEN %s AND %s
+    ORDER BY 2
+    """
+    df = execute_query(query, is_select=True,
+                       params=(dni_psicologo, fecha_hasta, fecha_desde, fecha_desde, fecha_hasta))
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['id_bloqueo', 'inicio', 'fin', 'motivo', 'origen'])
+    df['inicio'] = pd.to_datetime(df['inicio'])
+    df['fin'] = pd.to_datetime(df['fin'])
+    return df
+
+
+def invalidar_horarios():
+    """Limpia las cachés de plantillas y bloqueos (llamar tras modificarlos)."""
+    cargar_plantilla_horario.clear()
+    cargar_bloqueos.clear()
+
+
+def _slots_bloqueados(plantilla, fecha, slots_dia, bloqueos):
+    """Subconjunto de slots_dia de 'fecha' que se superponen con algún bloqueo."""
+    if bloqueos.empty:
+        return set()
+    inicio_dia = datetime.combine(fecha, datetime.min.time())
+    bloqueos_dia = bloqueos[(bloqueos['inicio'] < inicio_dia + timedelta(days=1)) & (bloqueos['fin'] > inicio_dia)]
+    bloqueados = set()
+    for horario in slots_dia if not bloqueos_dia.empty else ():
+        inicio_slot = inicio_dia + timedelta(hours=int(horario[:2]), minutes=int(horario[3:5]))
+        fin_slot = inicio_slot + timedelta(minutes=duracion_slot_en(plantilla, fecha.weekday(), horario))
+        if ((bloqueos_dia['inicio'] < fin_slot) & (bloqueos_dia['fin'] > inicio_slot)).any():
+            bloqueados.add(horario)
+    return bloqueados
+
+
+def horarios_disponibles_en(dni_psicologo, fecha, ocupados=()):
+    """
+    Horarios libres de un psicólogo en una fecha.
+
+    Los slots de la plantilla ya están materializados y cacheados, así que la
+    disponibilidad es una diferencia de conjuntos: slots del día - ocupados - bloqueados.
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+        fecha (datetime.date): Día a consultar.
+        ocupados (iterable, optional): Horarios 'HH:MM' ya tomados por turnos ese día.
+
+    Returns:
+        list: Horarios 'HH:MM' disponibles, ordenados.
+    """
+    plantilla = cargar_plantilla_horario(dni_psicologo)
+    slots_dia = materializar_slots(plantilla)[fecha.weekday()]
+    if not slots_dia:
+        return []
+    bloqueados = _slots_bloqueados(plantilla, fecha, slots_dia, cargar_bloqueos(dni_psicologo, fecha, fecha))
+    return sorted(set(slots_dia) - set(ocupados) - bloqueados)
+
+
+def horarios_no_disponibles(dni_psicologo, pares):
+    """
+    Pares (fecha, 'HH:MM') que caen fuera del horario de atención o en un bloqueo.
+    Carga la plantilla y los bloqueos de todo el rango una sola vez.
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+        pares (list): Tuplas (datetime.date, 'HH:MM').
+
+    Returns:
+        list: Subconjunto de 'pares' no disponibles.
+    """
+    if not pares:
+        return []
+    plantilla = cargar_plantilla_horario(dni_psicologo)
+    slots = materializar_slots(plantilla)
+    fechas = [fecha for fecha, _ in pares]
+    bloqueos = cargar_bloqueos(dni_psicologo, min(fechas), max(fechas))
+    return [(fecha, horario) for fecha, horario in pares
+            if horario not in slots[fecha.weekday()]
+            or horario in _slots_bloqueados(plantilla, fecha, (horario,), bloqueos)]
+
+
+def slots_de_atencion(dni_psicologo, fechas):
+    """
+    Slots de la plantilla y slots bloqueados de cada fecha de la lista.
+    Carga la plantilla y los bloqueos de todo el rango una sola vez.
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+        fechas (list): Objetos datetime.date.
+
+    Returns:
+        dict: fecha -> (tupla de horarios 'HH:MM' de atención, set de horarios bloqueados).
+    """
+    if not fechas:
+        return {}
+    plantilla = cargar_plantilla_horario(dni_psicologo)
+    slots = materializar_slots(plantilla)
+    bloqueos = cargar_bloqueos(dni_psicologo, min(fechas), max(fechas))
+    return {fecha: (slots[fecha.weekday()], _slots_bloqueados(plantilla, fecha, slots[fecha.weekday()], bloqueos))
+            for fecha in fechas}
+
+
+def fechas_no_disponibles(dni_psicologo, fechas, horario):
+    """Fechas de la lista en las que 'horario' no está disponible (ver horarios_no_disponibles)."""
+    return [fecha for fecha, _ in horarios_no_disponibles(dni_psicologo, [(fecha, horario) for fecha in fechas])]
+
+
+# --- DIRECTORIO DE PACIENTES ---
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cargar_nombres_pacientes(dni_psicologo):
+    """
+    Directorio DNI -> nombre de los pacientes de un psicólogo, con una única consulta
+    cacheada por psicólogo. Llamar a invalidar_nombres_pacientes() tras dar de alta o
+    modificar pacientes.
+
+    Returns:
+        dict: dni_paciente (str) -> nombre.
+    """
+    query = "SELECT dni_paciente, nombre FROM pacientes WHERE dni_psicologo = %s"
+    df = execute_query(query, is_select=True, params=(dni_psicologo,))
+    if df is None or df.empty:
+        return {}
+    return dict(zip(df['dni_paciente'].astype(str), df['nombre'].astype(str)))
+
+
+def invalidar_nombres_pacientes():
+    """Descarta los directorios de pacientes cacheados (llamar tras dar de alta o modificar pacientes)."""
+    cargar_nombres_pacientes.clear()
+
+
+# --- PRECIOS DE SESIÓN ---
+
+class TablaPrecios:
+    """
+    Precios de sesión de un psicólogo, en memoria, para resolverlos sin consultas extra.
+
+    Prioridad: precio del paciente > precio de su obra social > precio general.
+    Cada regla tiene una fecha de vigencia; para una fecha dada se usa la última
+    regla vigente de cada nivel.
+    """
+
+    def __init__(self, reglas, obras_sociales):
+        """
+        Args:
+            reglas (list): Tuplas (dni_paciente, obra_social, vigente_desde, precio); dni_paciente
+                y obra_social en None para el precio general.
+            obras_sociales (dict): dni_paciente -> obra social del paciente.
+        """
+        self.obras_sociales = obras_sociales
+        self._vigencias = {}
+        for dni_paciente, obra_social, vigente_desde, precio in sorted(reglas, key=lambda r: r[2]):
+            if dni_paciente:
+                clave = ('paciente', str(dni_paciente))
+            elif obra_social:
+                clave = ('obra_social', obra_social)
+            else:
+                clave = ('general', None)
+            fechas, precios = self._vigencias.setdefault(clave, ([], []))
+            fechas.append(vigente_desde)
+            precios.append(float(precio))
+
+    def _vigente(self, clave, fecha):
+        if clave not in self._vigencias:
+            return None
+        if isinstance(fecha, datetime):  # También cubre pandas.Timestamp
+            fecha = fecha.date()
+        fechas, precios = self._vigencias[clave]
+        posicion = bisect_right(fechas, fecha)
+        return precios[posicion - 1] if posicion else None
+
+    def precio(self, dni_paciente, fecha):
+        """
+        Precio de la sesión de un paciente en una fecha.
+
+        Returns:
+            float or None: Precio vigente, o None si no hay ninguna regla aplicable.
+        """
+        for clave in (('paciente', str(dni_paciente)),
+                      ('obra_social', self.obras_sociales.get(str(dni_paciente))),
+                      ('general', None)):
+            precio = self._vigente(clave, fecha)
+            if precio is not None:
+                return precio
+        return None
+
+    def precio_general(self, fecha):
+        """Precio general vigente en la fecha, o None si no se configuró."""
+        return self._vigente(('general', None), fecha)
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_reglas_precios(dni_psicologo):
+    """Reglas de precios del psicólogo (DataFrame), ordenadas por vigencia."""
+    query = """
+    SELECT id_precio, dni_paciente, obra_social, vigente_desde, precio
+    FROM precios_sesion
+    WHERE dni_psicologo = %s
+    ORDER BY vigente_desde, id_precio
+    """
+    df = execute_query(query, is_select=True, params=(dni_psicologo,))
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['id_precio', 'dni_paciente', 'obra_social', 'vigente_desde', 'precio'])
+    df['vigente_desde'] = pd.to_datetime(df['vigente_desde']).dt.date
+    df['precio'] = df['precio'].astype(float)
+    return df
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_tabla_precios(dni_psicologo):
+    """
+    Carga una sola vez las reglas de precios y las obras sociales de los pacientes
+    del psicólogo y devuelve la TablaPrecios lista para resolver precios en memoria.
+    """
+    reglas = cargar_reglas_precios(dni_psicologo)
+    df_pacientes = execute_query("SELECT dni_paciente, obra_social FROM pacientes WHERE dni_psicologo = %s",
+                                 is_select=True, params=(dni_psicologo,))
+    obras_sociales = {}
+    if df_pacientes is not None and not df_pacientes.empty:
+        con_obra_social = df_pacientes.dropna(subset=['obra_social'])
+        obras_sociales = dict(zip(con_obra_social['dni_paciente'].astype(str), con_obra_social['obra_social']))
+
+    filas = [(None if pd.isna(r['dni_paciente']) else r['dni_paciente'],
+              None if pd.isna(r['obra_social']) else r['obra_social'],
+              r['vigente_desde'], r['precio']) for r in reglas.to_dict('records')]
+    return TablaPrecios(filas, obras_sociales)
+
+
+def guardar_precio_sesion(dni_psicologo, precio, vigente_desde, dni_paciente=None, obra_social=None):
+    """Registra una regla de precio (general, por paciente o por obra social) con su fecha de vigencia."""
+    query = """
+    INSERT INTO precios_sesion (dni_psicologo, dni_paciente, obra_social, precio, vigente_desde)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+    return execute_query(query, is_select=False,
+                         params=(dni_psicologo, dni_paciente, obra_social, precio, vigente_desde))
+
+
+def eliminar_precios_sesion(ids_precios, dni_psicologo):
+    """Elimina reglas de precio por su clave primaria."""
+    query = "DELETE FROM precios_sesion WHERE id_precio = ANY(%s) AND dni_psicologo = %s"
+    return execute_query(query, is_select=False, params=([int(i) for i in ids_precios], dni_psicologo))
+
+
+def invalidar_precios():
+    """Descarta la tabla de precios cacheada tras modificar precios_sesion."""
+    cargar_reglas_precios.clear()
+    cargar_tabla_precios.clear()
+
+
 def add_employee(nombre, dni, telefono, fecha_contratacion, salario):
     """
     Adds a new employee to the Empleado table.
@@ -0,0 +1,247 @@
+import streamlit as st
+import pandas as pd
+import datetime
+from datetime import timedelta
+import plotly.express as px
+
+# --- IMPORTAR FUNCIONES DE BASE DE DATOS ---
+from functions import execute_query, PLANTILLA_HORARIO_POR_DEFECTO
+
+# --- FUNCIONES DE CARGA DE DATOS ---
+
+# Capacidad de cada psicólogo con turnos en el período: los slots de su plantilla de
+# horarios (la plantilla por defecto si no configuró ninguna) en cada fecha, menos los
+# que se superponen con un bloqueo o caen en un feriado. Misma regla que
+# materializar_slots / horarios_disponibles_en en functions.py.
+QUERY_CAPACIDAD = """
+WITH psicologos AS (
+    SELECT DISTINCT dni_psicologo FROM turnos WHERE fecha BETWEEN %s AND %s
+),
+plantillas AS (
+    SELECT h.dni_psicologo, h.dia_semana, h.hora_inicio, h.hora_fin, h.duracion_slot
+    FROM horarios_psicologo h
+    JOIN psicologos p ON p.dni_psicologo = h.dni_psicologo
+    UNION ALL
+    SELECT p.dni_psicologo, d.dia_semana, d.hora_inicio::time, d.hora_fin::time, d.duracion_slot
+    FROM psicologos p
+    CROSS JOIN unnest(%s::int[], %s::text[], %s::text[], %s::int[]) AS d(dia_semana, hora_inicio, hora_fin, duracion_slot)
+    WHERE NOT EXISTS (SELECT 1 FROM horarios_psicologo h WHERE h.dni_psicologo = p.dni_psicologo)
+),
+slots AS (
+    SELECT DISTINCT pl.dni_psicologo, f.fecha, s.inicio,
+           s.inicio + make_interval(mins => pl.duracion_slot) AS fin
+    FROM generate_series(%s::date, %s::date, interval '1 day') AS g(dia)
+    CROSS JOIN LATERAL (SELECT g.dia::date AS fecha) f
+    JOIN plantillas pl ON pl.dia_semana = extract(isodow FROM f.fecha)::int - 1
+    CROSS JOIN LATERAL generate_series(f.fecha + pl.hora_inicio,
+                                       f.fecha + pl.hora_fin - make_interval(mins => pl.duracion_slot),
+                                       make_interval(mins => pl.duracion_slot)) AS s(inicio)
+)
+SELECT s.dni_psicologo, s.fecha, count(*) AS capacidad
+FROM slots s
+WHERE NOT EXISTS (SELECT 1 FROM bloqueos_agenda b
+                  WHERE b.dni_psicologo = s.dni_psicologo AND b.inicio < s.fin AND b.fin > s.inicio)
+  AND NOT EXISTS (SELECT 1 FROM feriados fe WHERE fe.fecha = s.fecha)
+GROUP BY s.dni_psicologo, s.fecha
+"""
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cargar_ocupacion_clinica(fecha_desde, fecha_hasta):
+    """
+    Carga la ocupación de TODOS los psicólogos en una ventana de fechas. La
+    agregación se hace en SQL con GROUPING SETS, así la base devuelve solo los
+    totales (psicólogo x día, día x hora y psicólogo x hora) en lugar de cada
+    turno; una segunda consulta agregada trae la capacidad según las plantillas
+    de horarios y los bloqueos.
+
+    Args:
+        fecha_desde (datetime.date): Primer día de la ventana (inclusive).
+        fecha_hasta (datetime.date): Último día de la ventana (inclusive).
+
+    Returns:
+        dict: DataFrames 'psicologo_dia', 'dia_hora' y 'psicologo_hora' con la columna 'turnos',
+            y 'capacidad' (dni_psicologo, fecha, capacidad) con los slots disponibles de cada
+            psicólogo con turnos en el período (ver QUERY_CAPACIDAD).
+    """
+    query = """
+    SELECT
+        GROUPING(t.dni_psicologo) AS sin_psicologo,
+        GROUPING(t.fecha) AS sin_fecha,
+        GROUPING(extract(hour FROM t.hora)) AS sin_hora,
+        t.dni_psicologo,
+        t.fecha,
+        extract(hour FROM t.hora)::int AS hora,
+        count(*) AS turnos
+    FROM turnos t
+    WHERE t.fecha BETWEEN %s AND %s
+    GROUP BY GROUPING SETS (
+        (t.dni_psicologo, t.fecha),
+        (t.fecha, extract(hour FROM t.hora)),
+        (t.dni_psicologo, extract(hour FROM t.hora))
+    )
+    """
+    vacio = pd.DataFrame(columns=['dni_psicologo', 'fecha', 'hora', 'turnos'])
+    capacidad_vacia = pd.DataFrame(columns=['dni_psicologo', 'fecha', 'capacidad'])
+    try:
+        df = execute_query(query, conn=None, is_select=True, params=(fecha_desde, fecha_hasta))
+        if df is None or df.empty:
+            return {'psicologo_dia': vacio, 'dia_hora': vacio, 'psicologo_hora': vacio, 'capacidad': capacidad_vacia}
+
+        dias, inicios, fines, duraciones = (list(c) for c in zip(*PLANTILLA_HORARIO_POR_DEFECTO))
+        df_capacidad = execute_query(QUERY_CAPACIDAD, conn=None, is_select=True,
+                                     params=(fecha_desde, fecha_hasta, dias, inicios, fines, duraciones,
+                                             fecha_desde, fecha_hasta))
+        if df_capacidad is None or df_capacidad.empty:
+            df_capacidad = capacidad_vacia
+        else:
+            df_capacidad['capacidad'] = df_capacidad['capacidad'].astype(int)
+
+        df['turnos'] = df['turnos'].astype(int)
+        return {
+            'psicologo_dia': df[(df['sin_psicologo'] == 0) & (df['sin_fecha'] == 0)][['dni_psicologo', 'fecha', 'turnos']],
+            'dia_hora': df[(df['sin_fecha'] == 0) & (df['sin_hora'] == 0)][['fecha', 'hora', 'turnos']],
+            'psicologo_hora': df[(df['sin_psicologo'] == 0) & (df['sin_hora'] == 0)][['dni_psicologo', 'hora', 'turnos']],
+            'capacidad': df_capacidad,
+        }
+    except Exception as e:
+        st.error(f"Error al cargar la ocupación de la clínica: {e}")
+        return {'psicologo_dia': vacio, 'dia_hora': vacio, 'psicologo_hora': vacio, 'capacidad': capacidad_vacia}
+
+
+@st.cache_data(ttl=3600, show_spinner=False)
+def cargar_nombres_psicologos():
+    """Devuelve un diccionario DNI -> nombre de todos los psicólogos registrados."""
+    try:
+        df = execute_query("SELECT dnis, nombre FROM usuario_psicologos", conn=None, is_select=True)
+        if df is None or df.empty:
+            return {}
+        return dict(zip(df['dnis'].astype(str), df['nombre'].astype(str)))
+    except Exception as e:
+        st.error(f"Error al cargar psicólogos: {e}")
+        return {}
+
+
+# --- SECCIÓN DE AUTENTICACIÓN Y NAVEGACIÓN ---
+
+def cerrar_sesion():
+    """Limpia el estado de la sesión y redirige a la página de inicio."""
+    st.session_state.logged_in = False
+    st.session_state.user_data = None
+    st.session_state.show_register = False
+    st.session_state.show_recovery = False
+    st.session_state.recovery_dni = None
+    st.switch_page("Inicio.py")
+
+if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+    st.warning("⚠️ Debes iniciar sesión para acceder a esta página.")
+    if st.button("Ir a la página de inicio de sesión"):
+        st.switch_page("Inicio.py")
+    st.stop()
+
+# --- FIN DE LA SECCIÓN DE AUTENTICACIÓN ---
+
+st.set_page_config(page_title="Agenda de la Clínica", page_icon="🏥", layout="wide")
+st.markdown("""
+<style>
+    :root {--primary-dark: #001d4a; --primary-medium: #068D9D; --primary-light: #B9D7E0; --background-accent: #c2bdb6;}
+    .main .block-container {background-color: var(--primary-light); padding: 2rem 1rem;}
+    .title-container {background-color: #c2bdb6; padding: 1.5rem; border-radius: 9px; margin-bottom: 2rem; text-align: center; box-shadow: 0 4px 6px rgba(0, 29, 74, 0.1);}
+    .title-text {color: #001d4a; font-size: 2.5rem; font-weight: bold; margin: 0; text-shadow: 1px 1px 2px rgba(0,0,0,0.1);}
+    .stButton > button {background-color: var(--primary-dark) !important; color: white !important; border: none !important; border-radius: 8px !important; font-weight: bold !important; transition: all 0.3s ease !important;}
+    .stButton > button:hover {background-color: var(--primary-medium) !important; transform: translateY(-2px) !important; box-shadow: 0 4px 8px rgba(0, 29, 74, 0.3) !important;}
+</style>
+""", unsafe_allow_html=True)
+
+st.markdown('<div class="title-container"><h1 class="title-text"> AGENDA DE LA CLÍNICA </h1></div>', unsafe_allow_html=True)
+
+# --- SELECCIÓN DE LA SEMANA ---
+col_fecha, col_semanas = st.columns([2, 1])
+with col_fecha:
+    fecha_ref = st.date_input("Semana a visualizar", value=datetime.date.today(), key="clinica_fecha_ref")
+with col_semanas:
+    cantidad_semanas = st.number_input("Cantidad de semanas", min_value=1, max_value=8, value=1, step=1,
+                                       key="clinica_semanas")
+
+fecha_desde = fecha_ref - timedelta(days=fecha_ref.weekday())
+fecha_hasta = fecha_desde + timedelta(days=7 * cantidad_semanas - 1)
+st.caption(f"Del {fecha_desde.strftime('%d/%m/%Y')} al {fecha_hasta.strftime('%d/%m/%Y')}")
+
+ocupacion = cargar_ocupacion_clinica(fecha_desde, fecha_hasta)
+nombres_psicologos = cargar_nombres_psicologos()
+
+df_psicologo_dia = ocupacion['psicologo_dia']
+if df_psicologo_dia.empty:
+    st.info("No hay turnos agendados en la clínica para este período.")
+    st.stop()
+
+# --- MÉTRICAS GENERALES ---
+capacidad_por_psicologo = ocupacion['capacidad'].groupby('dni_psicologo')['capacidad'].sum()
+capacidad_total = int(capacidad_por_psicologo.sum())
+total_turnos = int(df_psicologo_dia['turnos'].sum())
+psicologos_activos = df_psicologo_dia['dni_psicologo'].nunique()
+
+col1, col2, col3 = st.columns(3)
+with col1: st.metric("Turnos en el período", total_turnos)
+with col2: st.metric("Psicólogos con turnos", psicologos_activos)
+with col3: st.metric("Ocupación promedio",
+                     f"{total_turnos / capacidad_total:.1%}" if capacidad_total else "Sin horarios disponibles")
+
+# --- OCUPACIÓN DE LA CLÍNICA POR DÍA Y HORA ---
+st.markdown("### Ocupación de la clínica por día y hora")
+df_dia_hora = ocupacion['dia_hora'].copy()
+df_dia_hora['dia'] = pd.to_datetime(df_dia_hora['fecha']).dt.strftime('%a %d/%m')
+matriz_dia_hora = (df_dia_hora.pivot_table(index='hora', columns='dia', values='turnos', aggfunc='sum', fill_value=0)
+                   .reindex(columns=pd.to_datetime(sorted(df_dia_hora['fecha'].unique())).strftime('%a %d/%m')))
+fig_dia_hora = px.imshow(matriz_dia_hora, aspect='auto', color_continuous_scale='Blues',
+                         labels={'x': 'Día', 'y': 'Hora', 'color': 'Turnos'})
+st.plotly_chart(fig_dia_hora, use_container_width=True)
+
+# --- OCUPACIÓN POR PSICÓLOGO ---
+st.markdown("### Ocupación por psicólogo")
+resumen = (df_psicologo_dia.groupby('dni_psicologo')['turnos'].sum()
+           .rename('total_turnos').reset_index())
+resumen['psicologo'] = resumen['dni_psicologo'].astype(str).map(nombres_psicologos).fillna(resumen['dni_psicologo'].astype(str))
+resumen['ocupacion'] = 100 * resumen['total_turnos'] / resumen['dni_psicologo'].map(capacidad_por_psicologo).where(lambda c: c > 0)
+
+por_dia = df_psicologo_dia.pivot_table(index='dni_psicologo', columns='fecha', values='turnos',
+                                       aggfunc='sum', fill_value=0)
+por_dia.columns = [pd.to_datetime(c).strftime('%a %d/%m') for c in por_dia.columns]
+resumen = resumen.merge(por_dia, left_on='dni_psicologo', right_index=True).sort_values('ocupacion', ascending=False)
+
+st.dataframe(
+    resumen[['psicologo', 'total_turnos', 'ocupacion'] + list(por_dia.columns)],
+    use_container_width=True,
+    hide_index=True,
+    column_config={
+        "psicologo": "Psicólogo",
+        "total_turnos": "Turnos",
+        "ocupacion": st.column_config.ProgressColumn("Ocupación", format="%.0f%%", min_value=0, max_value=100),
+    },
+    height=400
+)
+
+# --- OCUPACIÓN POR PSICÓLOGO Y HORA ---
+st.markdown("### Turnos por psicólogo y hora")
+df_psicologo_hora = ocupacion['psicologo_hora'].copy()
+df_psicologo_hora['psicologo'] = (df_psicologo_hora['dni_psicologo'].astype(str).map(nombres_psicologos)
+                                  .fillna(df_psicologo_hora['dni_psicologo'].astype(str)))
+matriz_psicologo_hora = df_psicologo_hora.pivot_table(index='psicologo', columns='hora', values='turnos',
+                                                      aggfunc='sum', fill_value=0)
+fig_psicologo_hora = px.imshow(matriz_psicologo_hora, aspect='auto', color_continuous_scale='Blues',
+                               labels={'x': 'Hora', 'y': 'Psicólogo', 'color': 'Turnos'},
+                               height=max(400, 18 * len(matriz_psicologo_hora)))
+st.plotly_chart(fig_psicologo_hora, use_container_width=True)
+
+with st.sidebar:
+    st.markdown("## Perfil del Psicólogo")
+    st.write(f"**Nombre:** {st.session_state.user_data.get('nombre', 'N/A')}")
+    st.write(f"**DNI:** {st.session_state.user_data.get('dni', 'N/A')}")
+    st.write(f"**Email:** {st.session_state.user_data.get('mail', 'N/A')}")
+
+    col1, col2, col3 = st.columns([1, 2, 1])
+    with col2:
+        st.markdown("<br><br><br>", unsafe_allow_html=True)
+        st.image("image-removebg-preview.png", width = 200)
+
+    if st.button("🚪 Cerrar Sesión", use_container_width=True, help="Cerrar sesión y volver a la página de inicio"):
+        cerrar_sesion()
@@ -1,13 +1,22 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import datetime
 from datetime import timedelta
 import calendar
+import math
+from bisect import bisect_left, bisect_right
 from dateutil.parser import parse
+import plotly.express as px
 
 # --- IMPORTAR FUNCIONES DE BASE DE DATOS ---
 # Asegúrate de que 'functions.py' esté en el mismo directorio o en el PYTHONPATH
-from functions import connect_to_supabase, execute_query
+from functions import (connect_to_supabase, execute_query, execute_values_query, HORARIOS_AGENDA, MINUTOS_POR_SLOT,
+                       cargar_proximos_turnos, invalidar_proximos_turnos, cargar_plantilla_horario, cargar_bloqueos,
+                       invalidar_horarios, horarios_disponibles_en, fechas_no_disponibles,
+                       horarios_no_disponibles, materializar_slots, duracion_slot_en, slots_de_atencion)
+from calendario_ics import generar_ics_turnos, url_feed, importar_ics_como_bloqueos
+from riesgo_ausencia import puntuar_proximos_turnos
 
 # --- FUNCIÓN CORREGIDA: CARGAR PACIENTES ASIGNADOS AL PSICÓLOGO ---
 def cargar_pacientes_asignados_al_psicologo(dni_psicologo):
@@ -52,51 +61,95 @@ def cargar_pacientes_asignados_al_psicologo(dni_psicologo):
         st.error(f"Error al cargar pacientes asignados: {e}")
         return []
 
-# --- FUNCIÓN ORIGINAL: CARGAR TURNOS DEL PSICÓLOGO DESDE LA BASE DE DATOS ---
+# --- ALMACÉN COLUMNAR DE TURNOS ---
+# Los turnos se guardan en st.session_state.turnos como un DataFrame tipado
+# (una fila por turno). Solo las filas que se muestran se convierten a diccionarios.
+
+COLUMNAS_TURNOS = ['id_turno', 'paciente', 'dni_paciente', 'dni_psicologo', 'fecha', 'horario', 'datetime']
+
+
+TURNOS_POR_PAGINA = 10  # Tarjetas por página en la lista detallada de próximos turnos
+PROXIMOS_TURNOS_A_MOSTRAR = 3  # Próximo turno + los siguientes en el recuadro lateral
+
+
+def turnos_df_vacio():
+    """Devuelve un DataFrame de turnos vacío con las columnas y tipos esperados."""
+    return pd.DataFrame({
+        'id_turno': pd.Series(dtype='int64'),
+        'paciente': pd.Series(dtype='object'),
+        'dni_paciente': pd.Series(dtype='object'),
+        'dni_psicologo': pd.Series(dtype='object'),
+        'fecha': pd.Series(dtype='datetime64[ns]'),
+        'horario': pd.Series(dtype='object'),
+        'datetime': pd.Series(dtype='datetime64[ns]'),
+    })
+
+
+def construir_turnos_df(registros):
+    """
+    Convierte una lista de diccionarios de turnos (con 'datetime') al formato columnar.
+    'fecha' se deriva de 'datetime' de forma vectorizada.
+    """
+    if not registros:
+        return turnos_df_vacio()
+    df = pd.DataFrame(registros)
+    df['datetime'] = pd.to_datetime(df['datetime'])
+    df['fecha'] = df['datetime'].dt.normalize()
+    df['id_turno'] = df['id_turno'].astype('int64')
+    return df[COLUMNAS_TURNOS]
+
+
+def turnos_a_registros(df_turnos):
+    """
+    Convierte SOLO las filas recibidas en diccionarios para mostrarlas en pantalla.
+    'fecha' se devuelve como datetime.date y 'datetime' como Timestamp.
+    """
+    if df_turnos.empty:
+        return []
+    return df_turnos.assign(fecha=df_turnos['fecha'].dt.date).to_dict('records')
+
+
 def cargar_turnos_psicologo_desde_bd(dni_psicologo):
     """
     Carga todos los turnos de un psicólogo específico desde la base de datos Supabase.
+
+    La combinación fecha + hora se hace en SQL y la conversión de tipos en pandas de
+    forma vectorizada, sin recorrer fila por fila.
+
+    Returns:
+        pandas.DataFrame: Turnos con las columnas de COLUMNAS_TURNOS, ordenados por fecha y hora.
     """
     if not dni_psicologo:
-        return []
+        return turnos_df_vacio()
 
     try:
-        query = f"""
-        SELECT t.dni_paciente, t.fecha, t.hora, p.nombre as nombre_paciente
+        query = """
+        SELECT t.id_turnos AS id_turno,
+               p.nombre AS paciente,
+               t.dni_paciente,
+               t.dni_psicologo,
+               to_char(t.hora, 'HH24:MI') AS horario,
+               (t.fecha + t.hora) AS datetime
         FROM turnos t
         JOIN pacientes p ON t.dni_paciente = p.dni_paciente
-        WHERE t.dni_psicologo = '{dni_psicologo}'
+        WHERE t.dni_psicologo = %s
         ORDER BY t.fecha, t.hora
         """
-        # execute_query ahora debe encargarse de la conexión y ejecución
-        df_turnos = execute_query(query, conn=None, is_select=True)
+        df_turnos = execute_query(query, conn=None, is_select=True, params=(dni_psicologo,))
 
         if df_turnos is None or df_turnos.empty:
-            return []
-
-        turnos_cargados = []
-        for index, row in df_turnos.iterrows():
-            try:
-                fecha_obj = parse(str(row['fecha'])).date() # 'fecha' in turnos table is 'date'
-                hora_str = str(row['hora']) # 'hora' in turnos table is 'time'
-
-                datetime_obj = datetime.datetime.combine(fecha_obj, datetime.time.fromisoformat(hora_str))
-
-                turnos_cargados.append({
-                    'paciente': str(row['nombre_paciente']),
-                    'dni_paciente': str(row['dni_paciente']),
-                    'dni_psicologo': dni_psicologo,
-                    'fecha': fecha_obj,
-                    'horario': hora_str,
-                    'datetime': datetime_obj
-                })
-            except Exception as e:
-                st.warning(f"Error procesando turno {row.get('dni_paciente', 'N/A')} - {row.get('fecha', 'N/A')} {row.get('hora', 'N/A')}: {e}")
-                continue
-        return turnos_cargados
+            return turnos_df_vacio()
+
+        df_turnos['id_turno'] = df_turnos['id_turno'].astype('int64')
+        df_turnos['paciente'] = df_turnos['paciente'].astype(str)
+        df_turnos['dni_paciente'] = df_turnos['dni_paciente'].astype(str)
+        df_turnos['dni_psicologo'] = df_turnos['dni_psicologo'].astype(str)
+        df_turnos['datetime'] = pd.to_datetime(df_turnos['datetime'])
+        df_turnos['fecha'] = df_turnos['datetime'].dt.normalize()
+        return df_turnos[COLUMNAS_TURNOS]
     except Exception as e:
         st.error(f"Error al cargar turnos del psicólogo desde la BD: {e}")
-        return []
+        return turnos_df_vacio()
 
 
 # --- FUNCIONES ADAPTADAS PARA EL NUEVO ENFOQUE DE PACIENTES ---
@@ -126,27 +179,633 @@ def obtener_pacientes_para_selectbox(dni_psicologo):
 
 def guardar_turno_en_bd(turno_data):
     """
-    Guarda un turno en la base de datos.
+    Guarda un turno en la base de datos (serie de un único turno).
     """
-    try:
-        fecha = turno_data['fecha'].strftime('%Y-%m-%d')
-        hora = turno_data['horario']
+    ok, _ = guardar_serie_turnos_en_bd([turno_data])
+    return ok
 
-        query = f"""
-        INSERT INTO turnos (dni_paciente, dni_psicologo, fecha, hora)
-        VALUES ('{turno_data['dni_paciente']}', '{turno_data['dni_psicologo']}',
-                '{fecha}', '{hora}')
+
+def eliminar_turnos_en_bd(ids_turnos, dni_psicologo):
+    """
+    Elimina uno o varios turnos por su clave primaria en una sola sentencia.
+
+    Args:
+        ids_turnos (list): Lista de 'id_turnos' a eliminar.
+        dni_psicologo (str): DNI del psicólogo logueado; restringe el borrado a sus turnos.
+
+    Returns:
+        bool: True si la eliminación fue exitosa, False en caso contrario.
+    """
+    if not ids_turnos:
+        return True
+
+    try:
+        query = """
+        DELETE FROM turnos
+        WHERE id_turnos = ANY(%s)
+          AND dni_psicologo = %s
         """
+        return execute_query(query, conn=None, is_select=False,
+                             params=([int(i) for i in ids_turnos], dni_psicologo))
+    except Exception as e:
+        st.error(f"Error al eliminar turnos en BD: {e}")
+        return False
+
+
+# --- HORARIO DE ATENCIÓN Y BLOQUEOS ---
 
-        resultado = execute_query(query, conn=None, is_select=False)
+NOMBRES_DIAS = ['Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado', 'Domingo']
 
-        # execute_query debería devolver True en caso de éxito para INSERT/UPDATE/DELETE
-        # Si devuelve False o lanza excepción en caso de error.
-        return resultado
 
+def guardar_plantilla_horario_en_bd(dni_psicologo, filas):
+    """
+    Reemplaza la plantilla de horarios del psicólogo en una única transacción.
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+        filas (list): Tuplas (dia_semana, 'HH:MM' inicio, 'HH:MM' fin, duracion_slot).
+
+    Returns:
+        bool: True si se guardó correctamente.
+    """
+    conn = connect_to_supabase()
+    if conn is None:
+        return False
+    try:
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM horarios_psicologo WHERE dni_psicologo = %s", (dni_psicologo,))
+        cursor.close()
+        query_insert = """
+        INSERT INTO horarios_psicologo (dni_psicologo, dia_semana, hora_inicio, hora_fin, duracion_slot)
+        VALUES %s
+        """
+        if not execute_values_query(query_insert, [(dni_psicologo,) + tuple(f) for f in filas], conn=conn):
+            conn.rollback()
+            return False
+        conn.commit()
+        return True
     except Exception as e:
-        st.error(f"Error al guardar turno en BD: {e}")
+        conn.rollback()
+        st.error(f"Error al guardar el horario de atención: {e}")
         return False
+    finally:
+        conn.close()
+
+
+def guardar_bloqueo_en_bd(dni_psicologo, inicio, fin, motivo, origen='manual'):
+    """Registra un intervalo bloqueado [inicio, fin) en la agenda del psicólogo."""
+    query = """
+    INSERT INTO bloqueos_agenda (dni_psicologo, inicio, fin, motivo, origen)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+    return execute_query(query, conn=None, is_select=False, params=(dni_psicologo, inicio, fin, motivo, origen))
+
+
+def eliminar_bloqueos_en_bd(ids_bloqueos, dni_psicologo):
+    """Elimina bloqueos por su clave primaria en una sola sentencia."""
+    query = "DELETE FROM bloqueos_agenda WHERE id_bloqueo = ANY(%s) AND dni_psicologo = %s"
+    return execute_query(query, conn=None, is_select=False,
+                         params=([int(i) for i in ids_bloqueos], dni_psicologo))
+
+
+# --- RIESGO DE AUSENCIA ---
+
+RIESGO_AUSENCIA_MEDIO = 0.25  # Desde esta probabilidad se muestra la etiqueta en la lista de turnos
+RIESGO_AUSENCIA_ALTO = 0.5
+
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_riesgo_ausencia(dni_psicologo):
+    """Probabilidad de ausencia por id de turno para todos los turnos próximos (ver riesgo_ausencia.py)."""
+    try:
+        return puntuar_proximos_turnos(dni_psicologo)
+    except Exception as e:
+        st.error(f"Error al calcular el riesgo de ausencia: {e}")
+        return {}
+
+
+def etiqueta_riesgo_ausencia(probabilidad):
+    """HTML de la etiqueta de riesgo, o cadena vacía si el riesgo es bajo o no hay modelo."""
+    if probabilidad is None or probabilidad < RIESGO_AUSENCIA_MEDIO:
+        return ""
+    nivel = "alto" if probabilidad >= RIESGO_AUSENCIA_ALTO else "medio"
+    return (f'<span class="riesgo-badge riesgo-{nivel}" title="Probabilidad estimada de ausencia">'
+            f'⚠️ Riesgo de ausencia {probabilidad:.0%}</span>')
+
+
+# --- LISTA DE ESPERA ---
+# Las preferencias activas se indexan por día de la semana, con los minutos pedidos
+# ordenados: al liberarse un turno se ubican por búsqueda binaria solo los horarios
+# dentro de la tolerancia, sin recorrer la lista (sirve con cualquier duración de slot).
+
+MINUTOS_TOLERANCIA_ESPERA = 60  # Horarios cercanos que también se ofrecen, con menor prioridad
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cargar_lista_espera(dni_psicologo):
+    """
+    Carga las preferencias activas de la lista de espera del psicólogo.
+
+    Returns:
+        pandas.DataFrame: Columnas id_espera, dni_paciente, paciente, dia_semana, hora ('HH:MM')
+            y created_at, ordenadas por antigüedad.
+    """
+    query = """
+    SELECT le.id_espera, le.dni_paciente, p.nombre AS paciente, le.dia_semana,
+           to_char(le.hora, 'HH24:MI') AS hora, le.created_at
+    FROM lista_espera le
+    JOIN pacientes p ON p.dni_paciente = le.dni_paciente
+    WHERE le.dni_psicologo = %s AND le.activo
+    ORDER BY le.created_at, le.id_espera
+    """
+    df = execute_query(query, conn=None, is_select=True, params=(dni_psicologo,))
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['id_espera', 'dni_paciente', 'paciente', 'dia_semana', 'hora', 'created_at'])
+    df['dni_paciente'] = df['dni_paciente'].astype(str)
+    df['dia_semana'] = df['dia_semana'].astype(int)
+    return df
+
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cargar_indice_lista_espera(dni_psicologo):
+    """
+    Índice de la lista de espera: dia_semana -> (minutos del día pedidos, ordenados;
+    minuto -> lista de preferencias de la más antigua a la más reciente).
+    """
+    por_dia = {}
+    for registro in cargar_lista_espera(dni_psicologo).to_dict('records'):
+        minuto = int(registro['hora'][:2]) * 60 + int(registro['hora'][3:5])
+        por_dia.setdefault(registro['dia_semana'], {}).setdefault(minuto, []).append(registro)
+    return {dia: (sorted(por_minuto), por_minuto) for dia, por_minuto in por_dia.items()}
+
+
+def invalidar_lista_espera():
+    """Descarta la lista de espera cacheada tras un alta, baja o asignación."""
+    cargar_lista_espera.clear()
+    cargar_indice_lista_espera.clear()
+
+
+def candidatos_para_slot(indice, fecha, horario, pacientes_excluidos=()):
+    """
+    Ordena los candidatos de la lista de espera para un horario liberado.
+
+    Primero van quienes pidieron exactamente ese día y hora; luego quienes pidieron
+    el mismo día a menos de MINUTOS_TOLERANCIA_ESPERA minutos. Dentro de cada grupo,
+    tiene prioridad quien espera hace más tiempo. Cada paciente aparece una sola vez.
+
+    Args:
+        indice (dict): Resultado de cargar_indice_lista_espera.
+        fecha (datetime.date): Fecha del turno liberado.
+        horario (str): Hora del turno liberado ('HH:MM').
+        pacientes_excluidos (iterable): DNIs a omitir (ej. ya tienen turno ese día).
+
+    Returns:
+        list: Diccionarios de preferencias con la clave extra 'diferencia_minutos'.
+    """
+    minutos, por_minuto = indice.get(fecha.weekday(), ([], {}))
+    minuto_base = int(horario[:2]) * 60 + int(horario[3:5])
+    excluidos = set(pacientes_excluidos)
+    candidatos = {}
+
+    desde = bisect_left(minutos, minuto_base - MINUTOS_TOLERANCIA_ESPERA)
+    hasta = bisect_right(minutos, minuto_base + MINUTOS_TOLERANCIA_ESPERA)
+    for minuto in minutos[desde:hasta]:
+        desvio = minuto - minuto_base
+        for registro in por_minuto[minuto]:
+            if registro['dni_paciente'] in excluidos:
+                continue
+            clave_orden = (abs(desvio), registro['created_at'])
+            actual = candidatos.get(registro['dni_paciente'])
+            if actual is None or clave_orden < actual[0]:
+                candidatos[registro['dni_paciente']] = (clave_orden, dict(registro, diferencia_minutos=abs(desvio)))
+
+    return [registro for _, registro in sorted(candidatos.values(), key=lambda c: c[0])]
+
+
+def agregar_a_lista_espera_en_bd(dni_psicologo, dni_paciente, dias_semana, horarios):
+    """Anota al paciente en cada combinación de día y hora con un único INSERT multi-fila."""
+    query = """
+    INSERT INTO lista_espera (dni_psicologo, dni_paciente, dia_semana, hora)
+    VALUES %s
+    """
+    filas = [(dni_psicologo, dni_paciente, dia, hora) for dia in dias_semana for hora in horarios]
+    return execute_values_query(query, filas)
+
+
+def desactivar_lista_espera_en_bd(dni_psicologo, ids_espera=None, dni_paciente=None):
+    """
+    Da de baja preferencias de la lista de espera, por id o todas las de un paciente
+    (por ejemplo, cuando ya se le asignó un turno).
+    """
+    if ids_espera is not None:
+        query = "UPDATE lista_espera SET activo = false WHERE dni_psicologo = %s AND id_espera = ANY(%s)"
+        params = (dni_psicologo, [int(i) for i in ids_espera])
+    else:
+        query = "UPDATE lista_espera SET activo = false WHERE dni_psicologo = %s AND dni_paciente = %s"
+        params = (dni_psicologo, dni_paciente)
+    return execute_query(query, conn=None, is_select=False, params=params)
+
+
+def registrar_slots_liberados(df_cancelados):
+    """Guarda los horarios futuros recién liberados para ofrecerlos a la lista de espera."""
+    futuros = df_cancelados[df_cancelados['datetime'] > datetime.datetime.now()]
+    liberados = st.session_state.setdefault('slots_liberados', [])
+    for fecha, horario in zip(futuros['fecha'].dt.date, futuros['horario']):
+        if (fecha, horario) not in liberados:
+            liberados.append((fecha, horario))
+
+
+# --- USO DE LA AGENDA POR DÍA Y HORA ---
+
+@st.cache_data(ttl=600, show_spinner=False)
+def cargar_uso_por_dia_hora(dni_psicologo, fecha_desde, fecha_hasta):
+    """
+    Cantidad de turnos y asistencia por día de la semana y hora en un período.
+
+    La agregación se hace en SQL (un único GROUP BY sobre turnos con LEFT JOIN a
+    sesiones), así la base devuelve como mucho 7 x horarios filas.
+
+    Returns:
+        pandas.DataFrame: Columnas dia_semana (0 = lunes), hora ('HH:MM'), turnos,
+            registradas (sesiones con asistencia cargada) y asistidas.
+    """
+    query = """
+    SELECT (extract(isodow FROM t.fecha)::int - 1) AS dia_semana,
+           to_char(t.hora, 'HH24:MI') AS hora,
+           count(DISTINCT t.id_turnos) AS turnos,
+           count(s.asistencia) AS registradas,
+           count(*) FILTER (WHERE s.asistencia = 'asistio') AS asistidas
+    FROM turnos t
+    LEFT JOIN sesiones s ON s.id_turno = t.id_turnos
+    WHERE t.dni_psicologo = %s
+      AND t.fecha BETWEEN %s AND %s
+    GROUP BY 1, t.hora
+    """
+    df = execute_query(query, conn=None, is_select=True, params=(dni_psicologo, fecha_desde, fecha_hasta))
+    if df is None or df.empty:
+        return pd.DataFrame(columns=['dia_semana', 'hora', 'turnos', 'registradas', 'asistidas'])
+    return df.astype({'dia_semana': int, 'turnos': int, 'registradas': int, 'asistidas': int})
+
+
+def matrices_uso_por_dia_hora(df_uso):
+    """
+    Arma las matrices hora x día (turnos y % de asistencia) a partir del agregado.
+
+    Returns:
+        tuple: (DataFrame de turnos, DataFrame de % de asistencia) con índice de horas
+            y una columna por día de la semana.
+    """
+    horas = sorted(set(HORARIOS_AGENDA) | set(df_uso['hora']))
+    turnos = (df_uso.pivot_table(index='hora', columns='dia_semana', values='turnos', aggfunc='sum', fill_value=0)
+              .reindex(index=horas, columns=range(7), fill_value=0))
+    registradas = (df_uso.pivot_table(index='hora', columns='dia_semana', values='registradas', aggfunc='sum')
+                   .reindex(index=horas, columns=range(7)))
+    asistidas = (df_uso.pivot_table(index='hora', columns='dia_semana', values='asistidas', aggfunc='sum')
+                 .reindex(index=horas, columns=range(7)))
+    asistencia = 100 * asistidas / registradas.where(registradas > 0)
+
+    turnos.columns = asistencia.columns = NOMBRES_DIAS
+    return turnos, asistencia.round(0)
+
+
+# --- GRILLA HORARIA (VISTAS SEMANA / DÍA) ---
+
+def matriz_ocupacion(df_turnos, fecha_inicio, cantidad_dias, horarios=HORARIOS_AGENDA):
+    """
+    Construye la matriz de ocupación (días x slots) de un rango de fechas.
+
+    Cada celda cuenta los turnos que empiezan dentro de ese slot. Se calcula con
+    operaciones vectorizadas de numpy sobre el DataFrame de turnos, sin bucles por turno.
+
+    Args:
+        df_turnos (pandas.DataFrame): Turnos en el formato de COLUMNAS_TURNOS.
+        fecha_inicio (datetime.date): Primer día de la grilla.
+        cantidad_dias (int): Cantidad de días (7 para la semana, 1 para el día).
+        horarios (list, optional): Inicio de cada slot en formato 'HH:MM'.
+
+    Returns:
+        tuple: (matriz, turnos_rango, idx_dia, idx_slot) donde matriz es un
+            numpy.ndarray de enteros con forma (cantidad_dias, len(horarios)),
+            turnos_rango son las filas del rango que caen dentro de la grilla e
+            idx_dia / idx_slot su posición en la matriz.
+    """
+    inicio = pd.Timestamp(fecha_inicio)
+    fin = inicio + pd.Timedelta(days=cantidad_dias)
+    turnos_rango = df_turnos[(df_turnos['fecha'] >= inicio) & (df_turnos['fecha'] < fin)]
+
+    inicio_slots = np.array([int(h[:2]) * 60 + int(h[3:5]) for h in horarios])
+    idx_dia = (turnos_rango['fecha'] - inicio).dt.days.to_numpy()
+    minutos = ((turnos_rango['datetime'] - turnos_rango['fecha']).dt.total_seconds() // 60).to_numpy()
+    idx_slot = np.searchsorted(inicio_slots, minutos, side='right') - 1
+
+    dentro = (idx_slot >= 0) & (minutos < inicio_slots[-1] + MINUTOS_POR_SLOT)
+    matriz = np.zeros((cantidad_dias, len(horarios)), dtype=np.int32)
+    np.add.at(matriz, (idx_dia[dentro], idx_slot[dentro]), 1)
+
+    return matriz, turnos_rango[dentro], idx_dia[dentro], idx_slot[dentro]
+
+
+def renderizar_grilla_horaria(df_turnos, fecha_inicio, cantidad_dias, dni_psicologo):
+    """
+    Dibuja la grilla horaria para la vista semanal o diaria con los slots del horario
+    de atención del psicólogo. Cada celda se muestra ocupada, libre, bloqueada o fuera
+    del horario de atención; la ocupación se calcula sobre los slots disponibles.
+    """
+    fechas = [fecha_inicio + timedelta(days=d) for d in range(cantidad_dias)]
+    slots_rango = slots_de_atencion(dni_psicologo, fechas)
+
+    # Filas: todos los slots de atención del rango, más los horarios de turnos que caen fuera de ellos
+    inicio = pd.Timestamp(fecha_inicio)
+    en_rango = (df_turnos['fecha'] >= inicio) & (df_turnos['fecha'] < inicio + pd.Timedelta(days=cantidad_dias))
+    horarios = sorted(set().union(*(slots for slots, _ in slots_rango.values()))
+                      | set(df_turnos.loc[en_rango, 'horario']))
+    if not horarios:
+        st.info("No hay horarios de atención en este período.")
+        return
+
+    matriz, turnos_rango, idx_dia, idx_slot = matriz_ocupacion(df_turnos, fecha_inicio, cantidad_dias, horarios)
+    ocupados = matriz > 0
+    disponibles = np.array([[horario in slots_rango[fecha][0] and horario not in slots_rango[fecha][1]
+                             for horario in horarios] for fecha in fechas])
+    ocupacion_dias = (ocupados & disponibles).sum(axis=1) / np.maximum(disponibles.sum(axis=1), 1)
+
+    # Nombres solo para las celdas ocupadas del rango visible
+    etiquetas = {}
+    for d, h, paciente in zip(idx_dia, idx_slot, turnos_rango['paciente']):
+        etiquetas.setdefault((d, h), []).append(paciente)
+
+    ahora = datetime.datetime.now()
+    dias_semana = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+
+    html = "<table class='grid-agenda'><tr><th></th>"
+    for d, fecha in enumerate(fechas):
+        clase_hoy = " class='today'" if fecha == datetime.date.today() else ""
+        html += (f"<th{clase_hoy}>{dias_semana[fecha.weekday()]} {fecha.strftime('%d/%m')}"
+                 f"<br><small>{ocupacion_dias[d]:.0%} ocupado</small></th>")
+    html += "</tr>"
+
+    for h, horario in enumerate(horarios):
+        html += f"<tr><td class='slot-hora'>{horario}</td>"
+        for d, fecha in enumerate(fechas):
+            if ocupados[d, h]:
+                nombres = ", ".join(etiquetas.get((d, h), []))
+                html += f"<td class='slot-ocupado'>{nombres}</td>"
+            elif horario not in slots_rango[fecha][0]:
+                html += "<td class='slot-fuera'></td>"
+            elif horario in slots_rango[fecha][1]:
+                html += "<td class='slot-bloqueado'>Bloqueado</td>"
+            elif datetime.datetime.combine(fecha, datetime.time.fromisoformat(horario)) < ahora:
+                html += "<td class='slot-pasado'></td>"
+            else:
+                html += "<td class='slot-libre'>Libre</td>"
+        html += "</tr>"
+    html += "</table>"
+
+    total_disponibles = int(disponibles.sum())
+    ocupados_disponibles = int((ocupados & disponibles).sum())
+    col_ocup, col_libres = st.columns(2)
+    col_ocup.markdown(f"**Ocupación del período:** {ocupados_disponibles / max(total_disponibles, 1):.0%} "
+                      f"({ocupados_disponibles} de {total_disponibles} horarios)")
+    col_libres.markdown(f"**Horarios libres:** {total_disponibles - ocupados_disponibles}")
+    st.markdown(html, unsafe_allow_html=True)
+
+
+# Turnos del psicólogo que se superponen con alguno de los intervalos (fecha, hora, duración)
+# pedidos. La duración de cada turno existente sale de su slot en la plantilla de horarios
+# (MINUTOS_POR_SLOT si cae fuera de ella), igual que duracion_slot_en.
+QUERY_CONFLICTOS_TURNOS = """
+WITH pedidos AS (
+    SELECT * FROM unnest(%s::date[], %s::time[], %s::int[]) AS n(fecha, hora, duracion)
+),
+existentes AS (
+    SELECT t.id_turnos, t.fecha, t.hora,
+           t.hora + make_interval(mins => coalesce(max(h.duracion_slot), %s)) AS hora_fin
+    FROM turnos t
+    LEFT JOIN horarios_psicologo h
+           ON h.dni_psicologo = t.dni_psicologo
+          AND h.dia_semana = extract(isodow FROM t.fecha)::int - 1
+          AND t.hora >= h.hora_inicio AND t.hora < h.hora_fin
+    WHERE t.dni_psicologo = %s
+      AND t.fecha = ANY(%s::date[])
+      AND NOT (t.id_turnos = ANY(%s))
+    GROUP BY t.id_turnos, t.fecha, t.hora
+)
+SELECT DISTINCT p.fecha, p.hora
+FROM pedidos p
+JOIN existentes e
+  ON e.fecha = p.fecha
+ AND e.hora < p.hora + make_interval(mins => p.duracion)
+ AND e.hora_fin > p.hora
+ORDER BY p.fecha, p.hora
+"""
+
+
+def buscar_conflictos_turnos(conn, dni_psicologo, fechas, horas, ids_excluidos=()):
+    """
+    Horarios pedidos que se superponen con turnos existentes del psicólogo, en una sola consulta.
+
+    Dos turnos chocan si hora < fin_otro y fin > hora_otro; la duración de cada uno
+    es la de su slot en la plantilla de horarios del psicólogo.
+
+    Args:
+        conn: Conexión abierta (la verificación queda en la misma transacción).
+        dni_psicologo (str): DNI del psicólogo.
+        fechas (list): Fechas 'YYYY-MM-DD'.
+        horas (list): Horarios 'HH:MM', uno por fecha.
+        ids_excluidos (iterable, optional): Turnos que no cuentan como conflicto (los que se mueven).
+
+    Returns:
+        list: Tuplas (datetime.date, 'HH:MM') de los horarios pedidos que chocan.
+    """
+    plantilla = cargar_plantilla_horario(dni_psicologo)
+    duraciones = [duracion_slot_en(plantilla, parse(f).weekday(), h) for f, h in zip(fechas, horas)]
+    df_conflictos = execute_query(QUERY_CONFLICTOS_TURNOS, conn=conn, is_select=True,
+                                  params=(fechas, horas, duraciones, MINUTOS_POR_SLOT, dni_psicologo,
+                                          sorted(set(fechas)), [int(i) for i in ids_excluidos]))
+    if df_conflictos is None or df_conflictos.empty:
+        return []
+    return [(parse(str(row['fecha'])).date(), str(row['hora'])[:5]) for _, row in df_conflictos.iterrows()]
+
+
+def superposiciones_internas(dni_psicologo, fechas, horas):
+    """Horarios de un mismo lote que se superponen entre sí (fechas 'YYYY-MM-DD', horas 'HH:MM')."""
+    plantilla = cargar_plantilla_horario(dni_psicologo)
+    intervalos = sorted((parse(f).date(), int(h[:2]) * 60 + int(h[3:5]), h) for f, h in zip(fechas, horas))
+    superpuestos = set()
+    for (fecha_a, inicio_a, hora_a), (fecha_b, inicio_b, hora_b) in zip(intervalos, intervalos[1:]):
+        if fecha_a == fecha_b and inicio_b < inicio_a + duracion_slot_en(plantilla, fecha_a.weekday(), hora_a):
+            superpuestos.update({(fecha_a, hora_a), (fecha_b, hora_b)})
+    return sorted(superpuestos)
+
+
+def reprogramar_turnos_en_bd(movimientos, dni_psicologo):
+    """
+    Mueve varios turnos a nuevas fechas/horarios en una sola transacción.
+
+    Verifica en UNA consulta que ninguno de los destinos se superponga con otro turno
+    (los turnos que se mueven no cuentan como conflicto entre sí) y luego aplica todos
+    los cambios con un único UPDATE ... FROM unnest(...).
+
+    Args:
+        movimientos (list): Tuplas (id_turno, nueva_fecha 'YYYY-MM-DD', nuevo_horario 'HH:MM').
+        dni_psicologo (str): DNI del psicólogo logueado.
+
+    Returns:
+        tuple: (ok, conflictos) con conflictos como lista de (fecha, horario) ocupados.
+    """
+    if not movimientos:
+        return True, []
+
+    ids = [int(m[0]) for m in movimientos]
+    fechas = [m[1] for m in movimientos]
+    horas = [m[2] for m in movimientos]
+
+    # Dos turnos del lote no pueden quedar superpuestos entre sí
+    superpuestos = superposiciones_internas(dni_psicologo, fechas, horas)
+    if superpuestos:
+        return False, superpuestos
+
+    conn = connect_to_supabase()
+    if conn is None:
+        st.error("❌ No se pudo conectar con la base de datos.")
+        return False, []
+
+    try:
+        conflictos = buscar_conflictos_turnos(conn, dni_psicologo, fechas, horas, ids_excluidos=ids)
+        if conflictos:
+            conn.rollback()
+            return False, conflictos
+
+        query_update = """
+        UPDATE turnos t
+        SET fecha = n.fecha, hora = n.hora
+        FROM unnest(%s::bigint[], %s::date[], %s::time[]) AS n(id_turnos, fecha, hora)
+        WHERE t.id_turnos = n.id_turnos
+          AND t.dni_psicologo = %s
+        """
+        # execute_query hace commit del UPDATE junto con la verificación anterior
+        ok = execute_query(query_update, conn=conn, is_select=False,
+                           params=(ids, fechas, horas, dni_psicologo))
+        return bool(ok), []
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Error al reprogramar turnos en BD: {e}")
+        return False, []
+    finally:
+        conn.close()
+
+
+# --- TURNOS RECURRENTES (SERIES) ---
+
+FRECUENCIAS_SERIE = {
+    "No se repite": None,
+    "Semanal": 7,
+    "Quincenal": 14,
+}
+
+MAX_TURNOS_SERIE = 104  # Dos años de turnos semanales como tope de seguridad
+
+
+def generar_fechas_serie(fecha_inicio, frecuencia_dias, hasta=None, repeticiones=None):
+    """
+    Genera las fechas de una serie de turnos recurrentes.
+
+    Args:
+        fecha_inicio (datetime.date): Fecha del primer turno.
+        frecuencia_dias (int or None): Días entre turnos (7 semanal, 14 quincenal).
+            Si es None, la serie tiene un único turno.
+        hasta (datetime.date, optional): Última fecha posible de la serie (inclusive).
+        repeticiones (int, optional): Cantidad total de turnos de la serie.
+
+    Returns:
+        list: Lista de objetos datetime.date, como máximo MAX_TURNOS_SERIE.
+    """
+    if not frecuencia_dias:
+        return [fecha_inicio]
+
+    limite = min(repeticiones or MAX_TURNOS_SERIE, MAX_TURNOS_SERIE)
+    fechas = []
+    fecha = fecha_inicio
+    while len(fechas) < limite and (hasta is None or fecha <= hasta):
+        fechas.append(fecha)
+        fecha += timedelta(days=frecuencia_dias)
+    return fechas
+
+
+def guardar_serie_turnos_en_bd(turnos_serie):
+    """
+    Guarda una serie de turnos del mismo psicólogo en una única transacción.
+
+    Primero verifica en UNA consulta si alguno de los horarios se superpone con un
+    turno existente; si hay conflictos no se inserta nada. Si no los hay,
+    inserta todos los turnos con un único INSERT multi-fila con ON CONFLICT DO
+    NOTHING sobre el índice único (dni_psicologo, fecha, hora): si otro guardado
+    concurrente tomó alguno de los horarios entre la verificación y el INSERT, esas
+    filas se omiten, se deshace la serie y se informan como conflictos. Cada diccionario de
+    turnos_serie recibe su 'id_turno' (clave primaria asignada por la base) cuando
+    la inserción es exitosa.
+
+    Args:
+        turnos_serie (list): Lista de diccionarios con 'dni_paciente', 'dni_psicologo',
+            'fecha' (datetime.date) y 'horario' ('HH:MM').
+
+    Returns:
+        tuple: (ok, conflictos) donde ok es True si se insertó la serie y conflictos
+            es la lista de (fecha, horario) ya ocupados.
+    """
+    if not turnos_serie:
+        return True, []
+
+    conn = connect_to_supabase()
+    if conn is None:
+        st.error("❌ No se pudo conectar con la base de datos.")
+        return False, []
+
+    try:
+        dni_psicologo = turnos_serie[0]['dni_psicologo']
+        fechas = [t['fecha'].strftime('%Y-%m-%d') for t in turnos_serie]
+        horas = [t['horario'] for t in turnos_serie]
+
+        # Chequeo de superposiciones de toda la serie en una sola consulta
+        conflictos = buscar_conflictos_turnos(conn, dni_psicologo, fechas, horas)
+        if conflictos:
+            return False, conflictos
+
+        query_insert = """
+        INSERT INTO turnos (dni_paciente, dni_psicologo, fecha, hora)
+        VALUES %s
+        ON CONFLICT (dni_psicologo, fecha, hora) DO NOTHING
+        RETURNING id_turnos, fecha, hora
+        """
+        filas = [(t['dni_paciente'], t['dni_psicologo'], f, h)
+                 for t, f, h in zip(turnos_serie, fechas, horas)]
+
+        df_ids = execute_values_query(query_insert, filas, conn=conn, fetch=True)
+        if df_ids is None:
+            # Error de la base (conexión, tipos, índice de sql/009 sin aplicar): no es un conflicto de horarios
+            conn.rollback()
+            return False, []
+
+        # RETURNING no garantiza el orden: se asocia cada id por (fecha, hora)
+        ids_por_horario = {(str(row['fecha']), str(row['hora'])[:5]): int(row['id_turnos'])
+                           for _, row in df_ids.iterrows()}
+        omitidos = [(parse(fecha).date(), hora[:5]) for fecha, hora in zip(fechas, horas)
+                    if (fecha, hora[:5]) not in ids_por_horario]
+        if omitidos:
+            # Otro guardado tomó esos horarios después de la verificación
+            conn.rollback()
+            return False, omitidos
+
+        conn.commit()
+        for turno, fecha, hora in zip(turnos_serie, fechas, horas):
+            turno['id_turno'] = ids_por_horario.get((fecha, hora[:5]))
+        return True, []
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Error al guardar la serie de turnos en BD: {e}")
+        return False, []
+    finally:
+        conn.close()
 
 
 # --- SECCIÓN DE AUTENTICACIÓN Y NAVEGACIÓN (SIN CAMBIOS) ---
@@ -358,6 +1017,15 @@ st.markdown("""
         color: #222E50; /* Azul medio para fecha y hora */
         font-weight: 500;
     }
+    .riesgo-badge {
+        padding: 0.2rem 0.6rem;
+        border-radius: 12px;
+        font-size: 0.8rem;
+        font-weight: bold;
+        white-space: nowrap;
+    }
+    .riesgo-alto { background-color: #f8d7da; color: #842029; }
+    .riesgo-medio { background-color: #fff3cd; color: #664d03; }
     .next-appointment {
         background-color: #bbdefb; /* Azul muy claro para el próximo turno */
         padding: 1.5rem;
@@ -435,6 +1103,55 @@ st.markdown("""
         max-width: 95%; /* Asegura que no se desborde */
         box-shadow: 0 1px 3px rgba(0, 0, 0, 0.1);
     }
+    /* Estilos para la grilla horaria (vistas semana y día) */
+    .grid-agenda {
+        width: 100%;
+        border-collapse: collapse;
+        font-size: 0.75rem;
+        table-layout: fixed;
+    }
+    .grid-agenda th {
+        background-color: #222E50;
+        color: white;
+        padding: 4px;
+        text-align: center;
+    }
+    .grid-agenda th.today {
+        background-color: #068D9D;
+    }
+    .grid-agenda td {
+        border: 1px solid #e0e0e0;
+        padding: 2px 4px;
+        height: 1.6rem;
+        overflow: hidden;
+        text-overflow: ellipsis;
+        white-space: nowrap;
+    }
+    .grid-agenda .slot-hora {
+        font-weight: bold;
+        color: #3f51b5;
+        width: 3.5rem;
+    }
+    .grid-agenda .slot-ocupado {
+        background-color: #1B9AAA;
+        color: white;
+    }
+    .grid-agenda .slot-libre {
+        background-color: #e8f5e9;
+        color: #2e7d32;
+        text-align: center;
+    }
+    .grid-agenda .slot-pasado {
+        background-color: #f5f5f5;
+    }
+    .grid-agenda .slot-bloqueado {
+        background-color: #fdecea;
+        color: #b71c1c;
+        text-align: center;
+    }
+    .grid-agenda .slot-fuera {
+        background-color: #e0e0e0;
+    }
     .day-cell .more-appointments {
         font-size: 0.7rem;
         text-align: center;
@@ -446,7 +1163,7 @@ st.markdown("""
 
 # Inicializar session state para almacenar turnos si no existe
 if 'turnos' not in st.session_state:
-    st.session_state.turnos = []
+    st.session_state.turnos = turnos_df_vacio()
 
 # --- MENSAJE DE BIENVENIDA Y BOTÓN DE SALIR ---
 user = st.session_state.user_data
@@ -514,13 +1231,12 @@ with col1:
         key="fecha_input"
     )
 
-    horarios_disponibles = [
-        "Seleccionar horario...",
-        "08:00", "08:30", "09:00", "09:30", "10:00", "10:30",
-        "11:00", "11:30", "12:00", "12:30", "13:00", "13:30",
-        "14:00", "14:30", "15:00", "15:30", "16:00", "16:30",
-        "17:00", "17:30", "18:00", "18:30", "19:00", "19:30"
-    ]
+    # Disponibilidad = slots de la plantilla (cacheados) - turnos del día - bloqueos
+    ocupados_dia = st.session_state.turnos.loc[st.session_state.turnos['fecha'] == pd.Timestamp(fecha_turno), 'horario']
+    horarios_libres = horarios_disponibles_en(dni_psicologo, fecha_turno, ocupados_dia)
+    horarios_disponibles = ["Seleccionar horario..."] + horarios_libres
+    if not horarios_libres:
+        st.info("No hay horarios disponibles para esa fecha (día sin atención, bloqueado o completo).")
 
     horario_seleccionado = st.selectbox(
         "**Horario del turno:**",
@@ -528,6 +1244,39 @@ with col1:
         key="horario_select"
     )
 
+    frecuencia_seleccionada = st.selectbox(
+        "**Repetición:**",
+        list(FRECUENCIAS_SERIE.keys()),
+        key="frecuencia_select"
+    )
+    frecuencia_dias = FRECUENCIAS_SERIE[frecuencia_seleccionada]
+
+    fecha_fin_serie = None
+    cantidad_serie = None
+    if frecuencia_dias:
+        modo_fin = st.radio(
+            "**Finaliza:**",
+            ["Después de N turnos", "En una fecha"],
+            horizontal=True,
+            key="fin_serie_radio"
+        )
+        if modo_fin == "Después de N turnos":
+            cantidad_serie = st.number_input(
+                "**Cantidad de turnos:**",
+                min_value=1,
+                max_value=MAX_TURNOS_SERIE,
+                value=4,
+                step=1,
+                key="cantidad_serie_input"
+            )
+        else:
+            fecha_fin_serie = st.date_input(
+                "**Hasta:**",
+                value=fecha_turno + timedelta(weeks=4),
+                min_value=fecha_turno,
+                key="fin_serie_input"
+            )
+
     st.markdown("---") # Separador visual
 
     if st.button("➕ AGREGAR TURNO", type="primary", use_container_width=True):
@@ -535,23 +1284,37 @@ with col1:
             paciente_seleccionado not in ["Seleccionar paciente...", "No hay pacientes asignados", "Error al cargar pacientes"] and
             horario_seleccionado != "Seleccionar horario..."):
 
-            nuevo_turno = {
+            hora_turno = datetime.time.fromisoformat(horario_seleccionado + ":00")
+            fechas_serie = generar_fechas_serie(fecha_turno, frecuencia_dias,
+                                                hasta=fecha_fin_serie, repeticiones=cantidad_serie)
+            nuevos_turnos = [{
                 'paciente': paciente_seleccionado,
                 'dni_paciente': dni_paciente_seleccionado,
                 'dni_psicologo': dni_psicologo,
-                'fecha': fecha_turno,
+                'fecha': fecha,
                 'horario': horario_seleccionado,
-                'datetime': datetime.datetime.combine(fecha_turno,
-                                                      datetime.time.fromisoformat(horario_seleccionado + ":00"))
-            }
+                'datetime': datetime.datetime.combine(fecha, hora_turno)
+            } for fecha in fechas_serie]
 
-            if guardar_turno_en_bd(nuevo_turno):
-                st.session_state.turnos.append(nuevo_turno)
-                st.success(f"✅ Turno agregado para **{paciente_seleccionado}** el {fecha_turno.strftime('%d/%m/%Y')} a las {horario_seleccionado}.")
+            fechas_bloqueadas = fechas_no_disponibles(dni_psicologo, fechas_serie, horario_seleccionado)
+            if fechas_bloqueadas:
+                ok, conflictos = False, [(fecha, horario_seleccionado) for fecha in fechas_bloqueadas]
+            else:
+                ok, conflictos = guardar_serie_turnos_en_bd(nuevos_turnos)
+            if ok:
+                invalidar_proximos_turnos()
+                st.session_state.turnos = pd.concat([st.session_state.turnos, construir_turnos_df(nuevos_turnos)],
+                                                    ignore_index=True)
+                if len(nuevos_turnos) == 1:
+                    st.success(f"✅ Turno agregado para **{paciente_seleccionado}** el {fecha_turno.strftime('%d/%m/%Y')} a las {horario_seleccionado}.")
+                else:
+                    st.success(f"✅ {len(nuevos_turnos)} turnos agregados para **{paciente_seleccionado}** ({frecuencia_seleccionada.lower()}, {horario_seleccionado}).")
+                st.rerun() # Rerun to refresh calendar and list
+            elif conflictos:
+                detalle = ", ".join(f"{fecha.strftime('%d/%m/%Y')} {hora}" for fecha, hora in conflictos)
+                st.error(f"❌ No se agendó ningún turno: los siguientes horarios no están disponibles (ocupados, bloqueados o fuera del horario de atención): {detalle}.")
             else:
                 st.error(f"❌ No se pudo agregar el turno para {paciente_seleccionado} en la base de datos. Por favor, intente de nuevo.")
-
-            st.rerun() # Rerun to refresh calendar and list
         else:
             if not dni_paciente_seleccionado or paciente_seleccionado in ["Seleccionar paciente...", "No hay pacientes asignados", "Error al cargar pacientes"]:
                 st.error("❌ Por favor, seleccione un **paciente** válido.")
@@ -562,120 +1325,177 @@ with col1:
     st.markdown('</div>', unsafe_allow_html=True) # Cierra el form-container
 
     # --- Próximo Turno ---
-    if st.session_state.turnos:
-        turnos_futuros = [t for t in st.session_state.turnos if t['datetime'] >= datetime.datetime.now()]
-        if turnos_futuros:
-            proximo_turno = min(turnos_futuros, key=lambda x: x['datetime'])
-
-            st.markdown('<div class="next-appointment">', unsafe_allow_html=True)
-            st.subheader("Tu próximo turno")
-            dias_restantes = (proximo_turno['datetime'].date() - datetime.date.today()).days
-            
-            st.markdown(f"""
-            <div style="display: flex; align-items: center; font-weight: bold; color: #3f51b5; padding-bottom: 0.5rem; gap: 1rem;">
-                <div class="day-circle">
-                    {dias_restantes if dias_restantes >= 0 else 0}
-                </div>
-                <div class="details">
-                    <strong>{proximo_turno['horario']} - {proximo_turno['paciente']}</strong><br>
-                    <small>{proximo_turno['fecha'].strftime('%d/%m/%Y')} (en {dias_restantes} {'día' if dias_restantes == 1 else 'días'})</small>
-                </div>
+    proximos_turnos = cargar_proximos_turnos(dni_psicologo)[:PROXIMOS_TURNOS_A_MOSTRAR]
+    if proximos_turnos:
+        proximo_turno = proximos_turnos[0]
+
+        st.markdown('<div class="next-appointment">', unsafe_allow_html=True)
+        st.subheader("Tu próximo turno")
+        dias_restantes = (proximo_turno['datetime'].date() - datetime.date.today()).days
+        
+        st.markdown(f"""
+        <div style="display: flex; align-items: center; font-weight: bold; color: #3f51b5; padding-bottom: 0.5rem; gap: 1rem;">
+            <div class="day-circle">
+                {dias_restantes if dias_restantes >= 0 else 0}
             </div>
-            """, unsafe_allow_html=True)
-            st.markdown('</div>', unsafe_allow_html=True)
+            <div class="details">
+                <strong>{proximo_turno['horario']} - {proximo_turno['paciente']}</strong><br>
+                <small>{proximo_turno['fecha'].strftime('%d/%m/%Y')} (en {dias_restantes} {'día' if dias_restantes == 1 else 'días'})</small>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+        for siguiente in proximos_turnos[1:]:
+            st.markdown(f"<small>Luego: {siguiente['fecha'].strftime('%d/%m/%Y')} {siguiente['horario']} - "
+                        f"{siguiente['paciente']}</small>", unsafe_allow_html=True)
+        st.markdown('</div>', unsafe_allow_html=True)
 
 with col2:
     st.markdown('<div class="calendar-container">', unsafe_allow_html=True)
-    st.subheader("🗓️ Vista mensual de turnos")
+    st.subheader("🗓️ Calendario de turnos")
+
+    vista_calendario = st.radio(
+        "Vista",
+        ["Mes", "Semana", "Día"],
+        horizontal=True,
+        key="vista_calendario",
+        label_visibility="collapsed"
+    )
 
-    col_prev, col_month, col_next = st.columns([1, 3, 1])
+    if vista_calendario == "Mes":
+        col_prev, col_month, col_next = st.columns([1, 3, 1])
 
-    if 'current_month' not in st.session_state:
-        st.session_state.current_month = datetime.date.today().month
-    if 'current_year' not in st.session_state:
-        st.session_state.current_year = datetime.date.today().year
+        if 'current_month' not in st.session_state:
+            st.session_state.current_month = datetime.date.today().month
+        if 'current_year' not in st.session_state:
+            st.session_state.current_year = datetime.date.today().year
 
-    with col_prev:
-        st.markdown("<div style='display: flex; justify-content: flex-start; align-items: center; height: 100%;'>", unsafe_allow_html=True)
-        if st.button("◀ Mes anterior", key="prev_month"):
-            if st.session_state.current_month == 1:
-                st.session_state.current_month = 12
-                st.session_state.current_year -= 1
-            else:
-                st.session_state.current_month -= 1
-            st.rerun()
-        st.markdown("</div>", unsafe_allow_html=True)
-
-    with col_month:
-        meses = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
-                 'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
-        st.markdown(f"<h3 style='text-align: center; color: #1a237e;'>{meses[st.session_state.current_month]} {st.session_state.current_year}</h3>",
-                    unsafe_allow_html=True)
-
-    with col_next:
-        st.markdown("<div style='display: flex; justify-content: flex-end; align-items: center; height: 100%;'>", unsafe_allow_html=True)
-        if st.button("Siguiente mes ▶", key="next_month"):
-            if st.session_state.current_month == 12:
-                st.session_state.current_month = 1
-                st.session_state.current_year += 1
-            else:
-                st.session_state.current_month += 1
-            st.rerun()
-        st.markdown("</div>", unsafe_allow_html=True)
+        with col_prev:
+            st.markdown("<div style='display: flex; justify-content: flex-start; align-items: center; height: 100%;'>", unsafe_allow_html=True)
+            if st.button("◀ Mes anterior", key="prev_month"):
+                if st.session_state.current_month == 1:
+                    st.session_state.current_month = 12
+                    st.session_state.current_year -= 1
+                else:
+                    st.session_state.current_month -= 1
+                st.rerun()
+            st.markdown("</div>", unsafe_allow_html=True)
+
+        with col_month:
+            meses = ['', 'Enero', 'Febrero', 'Marzo', 'Abril', 'Mayo', 'Junio',
+                     'Julio', 'Agosto', 'Septiembre', 'Octubre', 'Noviembre', 'Diciembre']
+            st.markdown(f"<h3 style='text-align: center; color: #1a237e;'>{meses[st.session_state.current_month]} {st.session_state.current_year}</h3>",
+                        unsafe_allow_html=True)
 
-    st.markdown("---") # Separador visual
+        with col_next:
+            st.markdown("<div style='display: flex; justify-content: flex-end; align-items: center; height: 100%;'>", unsafe_allow_html=True)
+            if st.button("Siguiente mes ▶", key="next_month"):
+                if st.session_state.current_month == 12:
+                    st.session_state.current_month = 1
+                    st.session_state.current_year += 1
+                else:
+                    st.session_state.current_month += 1
+                st.rerun()
+            st.markdown("</div>", unsafe_allow_html=True)
 
-    cal = calendar.monthcalendar(st.session_state.current_year, st.session_state.current_month)
+        st.markdown("---") # Separador visual
 
-    dias_semana = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
+        cal = calendar.monthcalendar(st.session_state.current_year, st.session_state.current_month)
 
-    cols_header = st.columns(7)
-    for i, dia_nombre in enumerate(dias_semana):
-        with cols_header[i]:
-            st.markdown(f"<div style='text-align: center; font-weight: bold; color: #3f51b5; padding-bottom: 0.5rem;'>{dia_nombre}</div>",
-                        unsafe_allow_html=True)
-    for semana in cal:
-        cols_week = st.columns(7)
-        for i, dia in enumerate(semana):
-            with cols_week[i]:
-                if dia == 0:
-                    st.markdown("<div style='height: 90px;'></div>", unsafe_allow_html=True) # Espacio para días fuera del mes
-                else:
-                    fecha_dia = datetime.date(st.session_state.current_year, st.session_state.current_month, dia)
-                    turnos_dia = sorted([t for t in st.session_state.turnos if t['fecha'] == fecha_dia], key=lambda x: x['datetime'])
+        # Turnos del mes agrupados por día con una sola máscara vectorizada
+        df_turnos = st.session_state.turnos
+        turnos_mes = df_turnos[(df_turnos['fecha'].dt.year == st.session_state.current_year) &
+                               (df_turnos['fecha'].dt.month == st.session_state.current_month)].sort_values('datetime')
+        turnos_por_dia = {dia: grupo for dia, grupo in turnos_mes.groupby(turnos_mes['fecha'].dt.day)}
 
-                    day_class = "day-cell"
-                    if fecha_dia == datetime.date.today():
-                        day_class += " today"
+        dias_semana = ['Lun', 'Mar', 'Mié', 'Jue', 'Vie', 'Sáb', 'Dom']
 
-                    day_content = f"<div class='{day_class}'>"
-                    day_content += f"<div class='day-number'>{dia}</div>"
+        cols_header = st.columns(7)
+        for i, dia_nombre in enumerate(dias_semana):
+            with cols_header[i]:
+                st.markdown(f"<div style='text-align: center; font-weight: bold; color: #3f51b5; padding-bottom: 0.5rem;'>{dia_nombre}</div>",
+                            unsafe_allow_html=True)
+        for semana in cal:
+            cols_week = st.columns(7)
+            for i, dia in enumerate(semana):
+                with cols_week[i]:
+                    if dia == 0:
+                        st.markdown("<div style='height: 90px;'></div>", unsafe_allow_html=True) # Espacio para días fuera del mes
+                    else:
+                        fecha_dia = datetime.date(st.session_state.current_year, st.session_state.current_month, dia)
+                        turnos_dia = turnos_por_dia.get(dia, turnos_df_vacio())
 
-                    for turno in turnos_dia[:2]: # Mostrar hasta 2 turnos directamente
-                        day_content += f"<div class='appointment-bubble'>{turno['horario']} {turno['paciente']}</div>"
+                        day_class = "day-cell"
+                        if fecha_dia == datetime.date.today():
+                            day_class += " today"
 
-                    if len(turnos_dia) > 2:
-                        day_content += f"<div class='more-appointments'>+{len(turnos_dia)-2} más</div>"
+                        day_content = f"<div class='{day_class}'>"
+                        day_content += f"<div class='day-number'>{dia}</div>"
 
-                    day_content += "</div>"
-                    st.markdown(day_content, unsafe_allow_html=True)
+                        for turno in turnos_a_registros(turnos_dia.head(2)): # Mostrar hasta 2 turnos directamente
+                            day_content += f"<div class='appointment-bubble'>{turno['horario']} {turno['paciente']}</div>"
+
+                        if len(turnos_dia) > 2:
+                            day_content += f"<div class='more-appointments'>+{len(turnos_dia)-2} más</div>"
+
+                        day_content += "</div>"
+                        st.markdown(day_content, unsafe_allow_html=True)
+
+    else:
+        if 'fecha_vista_grilla' not in st.session_state:
+            st.session_state.fecha_vista_grilla = datetime.date.today()
+
+        paso_dias = 7 if vista_calendario == "Semana" else 1
+        col_prev_g, col_titulo_g, col_next_g = st.columns([1, 3, 1])
+        with col_prev_g:
+            if st.button("◀ Anterior", key="prev_grilla"):
+                st.session_state.fecha_vista_grilla -= timedelta(days=paso_dias)
+                st.rerun()
+        with col_next_g:
+            if st.button("Siguiente ▶", key="next_grilla"):
+                st.session_state.fecha_vista_grilla += timedelta(days=paso_dias)
+                st.rerun()
+
+        fecha_ref = st.session_state.fecha_vista_grilla
+        if vista_calendario == "Semana":
+            fecha_inicio_grilla = fecha_ref - timedelta(days=fecha_ref.weekday())
+            titulo_grilla = (f"Semana del {fecha_inicio_grilla.strftime('%d/%m')} al "
+                             f"{(fecha_inicio_grilla + timedelta(days=6)).strftime('%d/%m/%Y')}")
+        else:
+            fecha_inicio_grilla = fecha_ref
+            titulo_grilla = fecha_ref.strftime('%d/%m/%Y')
+
+        with col_titulo_g:
+            st.markdown(f"<h3 style='text-align: center; color: #1a237e;'>{titulo_grilla}</h3>",
+                        unsafe_allow_html=True)
+
+        st.markdown("---") # Separador visual
+        renderizar_grilla_horaria(st.session_state.turnos, fecha_inicio_grilla, paso_dias, dni_psicologo)
 
     st.markdown('</div>', unsafe_allow_html=True) # Cierra el calendar-container
 
 # --- Lista de Próximos Turnos (debajo del calendario en la columna 2) ---
-if st.session_state.turnos:
+if not st.session_state.turnos.empty:
     st.markdown("---") # Separador
     st.subheader("📋 Lista detallada de próximos turnos")
 
-    turnos_ordenados = sorted(st.session_state.turnos, key=lambda x: x['datetime'])
-
     # Mostrar turnos desde hace 1 hora (para incluir los que acaban de pasar)
-    turnos_visibles = [t for t in turnos_ordenados if t['datetime'] >= datetime.datetime.now() - timedelta(hours=1)]
+    df_turnos = st.session_state.turnos
+    turnos_visibles = df_turnos[df_turnos['datetime'] >= datetime.datetime.now() - timedelta(hours=1)].sort_values('datetime')
 
-    if not turnos_visibles:
+    if turnos_visibles.empty:
         st.info("🎉 ¡No hay turnos próximos agendados! Disfruta de tu tiempo libre o agrega uno nuevo.")
     else:
-        for i, turno in enumerate(turnos_visibles):
+        # Paginación: solo se renderizan los widgets de la página visible
+        total_paginas = max(1, -(-len(turnos_visibles) // TURNOS_POR_PAGINA))
+        pagina = min(st.session_state.get('pagina_turnos', 0), total_paginas - 1)
+        st.session_state.pagina_turnos = pagina
+
+        inicio = pagina * TURNOS_POR_PAGINA
+        turnos_pagina = turnos_visibles.iloc[inicio:inicio + TURNOS_POR_PAGINA]
+
+        riesgo_ausencia = cargar_riesgo_ausencia(dni_psicologo)
+
+        for turno in turnos_a_registros(turnos_pagina):
             col_turno, col_delete = st.columns([4, 1])
 
             with col_turno:
@@ -685,36 +1505,380 @@ if st.session_state.turnos:
                         <strong>{turno['paciente']}</strong><br>
                         <span>📅 {turno['fecha'].strftime('%d/%m/%Y')} - 🕐 {turno['horario']}</span>
                     </div>
+                    {etiqueta_riesgo_ausencia(riesgo_ausencia.get(turno['id_turno']))}
                 </div>
                 """, unsafe_allow_html=True)
 
             with col_delete:
                 st.markdown("<div style='display: flex; justify-content: flex-end; align-items: center; height: 100%;'>", unsafe_allow_html=True)
-                if st.button("🗑️ Eliminar", key=f"delete_{i}", help="Eliminar turno", use_container_width=True):
-                    try:
-                        query_delete = f"""
-                        DELETE FROM turnos
-                        WHERE dni_paciente = '{turno['dni_paciente']}'
-                          AND dni_psicologo = '{turno['dni_psicologo']}'
-                          AND fecha = '{turno['fecha'].strftime('%Y-%m-%d')}'
-                          AND hora = '{turno['horario']}'
-                        """
-                        if execute_query(query_delete, conn=None, is_select=False):
-                            st.session_state.turnos.remove(turno)
-                            st.success("🗑️ Turno eliminado correctamente.")
-                        else:
-                            st.error("❌ Error al eliminar el turno de la base de datos.")
-                    except Exception as e:
-                        st.error(f"❌ Error inesperado al intentar eliminar el turno: {e}")
+                if st.button("🗑️ Eliminar", key=f"delete_{turno['id_turno']}", help="Eliminar turno", use_container_width=True):
+                    if eliminar_turnos_en_bd([turno['id_turno']], dni_psicologo):
+                        invalidar_proximos_turnos()
+                        registrar_slots_liberados(df_turnos[df_turnos['id_turno'] == turno['id_turno']])
+                        st.session_state.turnos = df_turnos[df_turnos['id_turno'] != turno['id_turno']]
+                        st.success("🗑️ Turno eliminado correctamente.")
+                    else:
+                        st.error("❌ Error al eliminar el turno de la base de datos.")
                     st.rerun()
                 st.markdown("</div>", unsafe_allow_html=True)
 
+        if total_paginas > 1:
+            col_pag_prev, col_pag_info, col_pag_next = st.columns([1, 3, 1])
+            with col_pag_prev:
+                if st.button("◀ Anteriores", key="turnos_pagina_prev", disabled=pagina == 0, use_container_width=True):
+                    st.session_state.pagina_turnos = pagina - 1
+                    st.rerun()
+            with col_pag_info:
+                st.markdown(f"<div style='text-align: center; color: #3f51b5;'>Página {pagina + 1} de {total_paginas} "
+                            f"({len(turnos_visibles)} turnos)</div>", unsafe_allow_html=True)
+            with col_pag_next:
+                if st.button("Siguientes ▶", key="turnos_pagina_next", disabled=pagina >= total_paginas - 1, use_container_width=True):
+                    st.session_state.pagina_turnos = pagina + 1
+                    st.rerun()
+
+    # --- Cancelación masiva de un día completo ---
+    with st.expander("🗓️ Cancelar todos los turnos de un día"):
+        fecha_cancelacion = st.date_input(
+            "**Día a cancelar:**",
+            value=datetime.date.today(),
+            min_value=datetime.date.today(),
+            key="fecha_cancelacion_input"
+        )
+        ids_dia = df_turnos.loc[df_turnos['fecha'] == pd.Timestamp(fecha_cancelacion), 'id_turno'].tolist()
+
+        if not ids_dia:
+            st.info("No hay turnos agendados ese día.")
+        else:
+            st.warning(f"Se cancelarán **{len(ids_dia)}** turnos del {fecha_cancelacion.strftime('%d/%m/%Y')}.")
+            if st.button(f"Cancelar {len(ids_dia)} turnos", key="bulk_cancel_button", use_container_width=True):
+                if eliminar_turnos_en_bd(ids_dia, dni_psicologo):
+                    invalidar_proximos_turnos()
+                    registrar_slots_liberados(df_turnos[df_turnos['id_turno'].isin(ids_dia)])
+                    st.session_state.turnos = df_turnos[~df_turnos['id_turno'].isin(ids_dia)]
+                    st.success(f"🗑️ {len(ids_dia)} turnos cancelados.")
+                    st.rerun()
+                else:
+                    st.error("❌ Error al cancelar los turnos en la base de datos.")
+
+# --- Turnos liberados: ofrecer a la lista de espera ---
+if st.session_state.get('slots_liberados'):
+    st.markdown("---")
+    st.subheader("🔔 Turnos liberados")
+    indice_espera = cargar_indice_lista_espera(dni_psicologo)
+    df_turnos = st.session_state.turnos
+
+    for fecha_libre, horario_libre in list(st.session_state.slots_liberados):
+        # Un paciente que ya tiene turno ese día no se propone
+        con_turno_ese_dia = df_turnos.loc[df_turnos['fecha'] == pd.Timestamp(fecha_libre), 'dni_paciente']
+        candidatos = candidatos_para_slot(indice_espera, fecha_libre, horario_libre, con_turno_ese_dia)
+
+        st.markdown(f"**{NOMBRES_DIAS[fecha_libre.weekday()]} {fecha_libre.strftime('%d/%m/%Y')} - {horario_libre}**")
+        if not candidatos:
+            st.caption("Nadie en la lista de espera para este horario.")
+        for candidato in candidatos[:3]:
+            col_cand, col_asignar = st.columns([4, 1])
+            with col_cand:
+                detalle = ("pidió este horario" if candidato['diferencia_minutos'] == 0
+                           else f"pidió las {candidato['hora']}")
+                st.write(f"{candidato['paciente']} — {detalle} "
+                         f"(en espera desde {pd.Timestamp(candidato['created_at']).strftime('%d/%m/%Y')})")
+            with col_asignar:
+                if st.button("Agendar", key=f"espera_{candidato['id_espera']}_{fecha_libre}_{horario_libre}",
+                             use_container_width=True):
+                    nuevo_turno = {
+                        'paciente': candidato['paciente'],
+                        'dni_paciente': candidato['dni_paciente'],
+                        'dni_psicologo': dni_psicologo,
+                        'fecha': fecha_libre,
+                        'horario': horario_libre,
+                        'datetime': datetime.datetime.combine(fecha_libre, datetime.time.fromisoformat(horario_libre))
+                    }
+                    if guardar_turno_en_bd(nuevo_turno):
+                        desactivar_lista_espera_en_bd(dni_psicologo, dni_paciente=candidato['dni_paciente'])
+                        invalidar_lista_espera()
+                        invalidar_proximos_turnos()
+                        st.session_state.turnos = pd.concat([df_turnos, construir_turnos_df([nuevo_turno])],
+                                                            ignore_index=True)
+                        st.session_state.slots_liberados.remove((fecha_libre, horario_libre))
+                        st.rerun()
+                    else:
+                        st.error("❌ No se pudo agendar el turno: el horario ya no está disponible.")
+        if st.button("Descartar", key=f"descartar_slot_{fecha_libre}_{horario_libre}"):
+            st.session_state.slots_liberados.remove((fecha_libre, horario_libre))
+            st.rerun()
+
+# --- Reprogramación masiva de turnos ---
+with st.expander("🔁 Reprogramar turnos"):
+    df_turnos = st.session_state.turnos
+    df_futuros = df_turnos[df_turnos['datetime'] >= datetime.datetime.now()].sort_values('datetime')
+
+    if df_futuros.empty:
+        st.info("No hay turnos futuros para reprogramar.")
+    else:
+        modo_reprogramacion = st.radio("**Turnos a mover:**", ["Un día completo", "Turnos seleccionados"],
+                                       horizontal=True, key="modo_reprogramacion")
+        if modo_reprogramacion == "Un día completo":
+            dia_origen = st.date_input("**Día a mover:**", value=df_futuros['fecha'].iloc[0].date(),
+                                       min_value=datetime.date.today(), key="reprogramar_dia")
+            df_seleccion = df_futuros[df_futuros['fecha'] == pd.Timestamp(dia_origen)]
+        else:
+            etiquetas_turnos = (df_futuros['datetime'].dt.strftime('%d/%m/%Y %H:%M') + " - " + df_futuros['paciente'])
+            opciones_turnos = dict(zip(etiquetas_turnos, df_futuros['id_turno']))
+            seleccion = st.multiselect("**Turnos:**", list(opciones_turnos.keys()), key="reprogramar_seleccion")
+            df_seleccion = df_futuros[df_futuros['id_turno'].isin([opciones_turnos[e] for e in seleccion])]
+
+        col_dias, col_minutos = st.columns(2)
+        with col_dias:
+            desplazamiento_dias = st.number_input("**Mover días:**", min_value=-30, max_value=365, value=7, step=1,
+                                                  key="reprogramar_dias")
+        with col_minutos:
+            # El paso es el máximo común divisor de las duraciones de slot de la plantilla
+            paso_minutos = math.gcd(*(duracion for _, _, _, duracion in cargar_plantilla_horario(dni_psicologo)))
+            pasos = 240 // paso_minutos
+            opciones_minutos = [k * paso_minutos for k in range(-pasos, pasos + 1)]  # Simétricas alrededor de 0
+            desplazamiento_minutos = st.selectbox("**Mover horario (minutos):**", opciones_minutos,
+                                                  index=opciones_minutos.index(0), key="reprogramar_minutos")
+
+        if df_seleccion.empty:
+            st.info("Seleccione los turnos a reprogramar.")
+        elif desplazamiento_dias == 0 and desplazamiento_minutos == 0:
+            st.info("Indique un desplazamiento distinto de cero.")
+        else:
+            nuevos_datetime = df_seleccion['datetime'] + pd.Timedelta(days=int(desplazamiento_dias),
+                                                                      minutes=int(desplazamiento_minutos))
+            vista_previa = pd.DataFrame({
+                'paciente': df_seleccion['paciente'],
+                'actual': df_seleccion['datetime'].dt.strftime('%d/%m/%Y %H:%M'),
+                'nuevo': nuevos_datetime.dt.strftime('%d/%m/%Y %H:%M'),
+            })
+            st.dataframe(vista_previa, hide_index=True, use_container_width=True,
+                         column_config={"paciente": "Paciente", "actual": "Horario actual", "nuevo": "Nuevo horario"})
+
+            if st.button(f"Reprogramar {len(df_seleccion)} turnos", key="reprogramar_button", type="primary"):
+                nuevos_horarios = nuevos_datetime.dt.strftime('%H:%M')
+                destinos = list(zip(nuevos_datetime.dt.date, nuevos_horarios))
+                no_disponibles = horarios_no_disponibles(dni_psicologo, destinos)
+
+                if (nuevos_datetime < datetime.datetime.now()).any():
+                    st.error("❌ Algunos turnos quedarían en el pasado. Ajuste el desplazamiento.")
+                elif no_disponibles:
+                    detalle = ", ".join(f"{f.strftime('%d/%m/%Y')} {h}" for f, h in no_disponibles)
+                    st.error(f"❌ Fuera del horario de atención o bloqueados: {detalle}.")
+                else:
+                    movimientos = list(zip(df_seleccion['id_turno'],
+                                           nuevos_datetime.dt.strftime('%Y-%m-%d'), nuevos_horarios))
+                    ok, conflictos = reprogramar_turnos_en_bd(movimientos, dni_psicologo)
+                    if ok:
+                        invalidar_proximos_turnos()
+                        df_actualizado = df_turnos.set_index('id_turno')
+                        df_actualizado.loc[df_seleccion['id_turno'], 'datetime'] = nuevos_datetime.to_numpy()
+                        df_actualizado.loc[df_seleccion['id_turno'], 'horario'] = nuevos_horarios.to_numpy()
+                        df_actualizado['fecha'] = df_actualizado['datetime'].dt.normalize()
+                        st.session_state.turnos = df_actualizado.reset_index()[COLUMNAS_TURNOS]
+                        st.success(f"✅ {len(movimientos)} turnos reprogramados.")
+                        st.rerun()
+                    elif conflictos:
+                        detalle = ", ".join(f"{f.strftime('%d/%m/%Y')} {h}" for f, h in conflictos)
+                        st.error(f"❌ No se movió ningún turno: horarios ocupados: {detalle}.")
+                    else:
+                        st.error("❌ No se pudieron reprogramar los turnos.")
+
+# --- Uso de la agenda por día y hora ---
+with st.expander("📊 Uso de la agenda por día y hora"):
+    col_uso_desde, col_uso_hasta = st.columns(2)
+    with col_uso_desde:
+        uso_desde = st.date_input("Desde", value=datetime.date.today() - timedelta(days=90), key="uso_desde")
+    with col_uso_hasta:
+        uso_hasta = st.date_input("Hasta", value=datetime.date.today(), min_value=uso_desde, key="uso_hasta")
+
+    df_uso = cargar_uso_por_dia_hora(dni_psicologo, uso_desde, uso_hasta)
+    if df_uso.empty:
+        st.info("No hay turnos en el período seleccionado.")
+    else:
+        matriz_turnos, matriz_asistencia = matrices_uso_por_dia_hora(df_uso)
+        col_uso_1, col_uso_2 = st.columns(2)
+        with col_uso_1: st.metric("Turnos en el período", int(df_uso['turnos'].sum()))
+        with col_uso_2:
+            registradas = int(df_uso['registradas'].sum())
+            st.metric("Asistencia", f"{df_uso['asistidas'].sum() / registradas:.0%}" if registradas else "Sin datos")
+
+        tab_turnos, tab_asistencia = st.tabs(["Turnos", "Asistencia (%)"])
+        with tab_turnos:
+            fig_turnos = px.imshow(matriz_turnos, aspect='auto', color_continuous_scale='Blues',
+                                   labels={'x': 'Día', 'y': 'Hora', 'color': 'Turnos'})
+            st.plotly_chart(fig_turnos, use_container_width=True)
+        with tab_asistencia:
+            fig_asistencia = px.imshow(matriz_asistencia, aspect='auto', color_continuous_scale='RdYlGn',
+                                       zmin=0, zmax=100, labels={'x': 'Día', 'y': 'Hora', 'color': '% asistencia'})
+            st.plotly_chart(fig_asistencia, use_container_width=True)
+
+# --- Lista de espera ---
+with st.expander("⏳ Lista de espera"):
+    nombres_espera, mapeo_espera = obtener_pacientes_para_selectbox(dni_psicologo)
+    paciente_espera = st.selectbox("Paciente", nombres_espera, key="espera_paciente")
+    col_espera_dias, col_espera_horas = st.columns(2)
+    with col_espera_dias:
+        dias_espera = st.multiselect("Días preferidos", NOMBRES_DIAS, key="espera_dias")
+    with col_espera_horas:
+        horarios_atencion = sorted(set().union(*materializar_slots(cargar_plantilla_horario(dni_psicologo)).values()))
+        horas_espera = st.multiselect("Horarios preferidos", horarios_atencion, key="espera_horas")
+    if st.button("➕ Agregar a la lista de espera", key="espera_agregar"):
+        if not mapeo_espera.get(paciente_espera) or not dias_espera or not horas_espera:
+            st.error("❌ Seleccione un paciente, al menos un día y al menos un horario.")
+        elif agregar_a_lista_espera_en_bd(dni_psicologo, mapeo_espera[paciente_espera],
+                                          [NOMBRES_DIAS.index(d) for d in dias_espera], horas_espera):
+            invalidar_lista_espera()
+            st.success(f"✅ {paciente_espera} agregado a la lista de espera.")
+            st.rerun()
+        else:
+            st.error("❌ No se pudo registrar la lista de espera.")
+
+    df_espera = cargar_lista_espera(dni_psicologo)
+    if df_espera.empty:
+        st.info("No hay pacientes en la lista de espera.")
+    else:
+        df_espera_vista = df_espera.assign(dia=df_espera['dia_semana'].map(dict(enumerate(NOMBRES_DIAS))))
+        st.dataframe(df_espera_vista[['paciente', 'dia', 'hora', 'created_at']], hide_index=True,
+                     use_container_width=True,
+                     column_config={
+                         "paciente": "Paciente",
+                         "dia": "Día",
+                         "hora": "Hora",
+                         "created_at": st.column_config.DatetimeColumn("En espera desde", format="DD/MM/YYYY"),
+                     })
+        opciones_espera = {f"{row['paciente']} - {row['dia']} {row['hora']}": row['id_espera']
+                           for row in df_espera_vista.to_dict('records')}
+        espera_a_quitar = st.multiselect("Quitar de la lista", list(opciones_espera.keys()), key="espera_quitar")
+        if espera_a_quitar and st.button("Quitar seleccionados", key="espera_quitar_boton"):
+            if desactivar_lista_espera_en_bd(dni_psicologo, ids_espera=[opciones_espera[e] for e in espera_a_quitar]):
+                invalidar_lista_espera()
+                st.rerun()
+            else:
+                st.error("❌ No se pudo actualizar la lista de espera.")
+
+# --- Configuración del horario de atención y días bloqueados ---
+with st.expander("⚙️ Horario de atención y días bloqueados"):
+    st.markdown("**Horario semanal** (para una pausa, cargue dos rangos el mismo día)")
+    plantilla_actual = cargar_plantilla_horario(dni_psicologo)
+    df_plantilla = pd.DataFrame(
+        [(NOMBRES_DIAS[dia], datetime.time.fromisoformat(inicio), datetime.time.fromisoformat(fin), duracion)
+         for dia, inicio, fin, duracion in plantilla_actual],
+        columns=['dia', 'desde', 'hasta', 'duracion']
+    )
+    df_plantilla_editada = st.data_editor(
+        df_plantilla,
+        num_rows="dynamic",
+        hide_index=True,
+        use_container_width=True,
+        key="editor_plantilla_horario",
+        column_config={
+            "dia": st.column_config.SelectboxColumn("Día", options=NOMBRES_DIAS, required=True),
+            "desde": st.column_config.TimeColumn("Desde", format="HH:mm", step=60 * 15, required=True),
+            "hasta": st.column_config.TimeColumn("Hasta", format="HH:mm", step=60 * 15, required=True),
+            "duracion": st.column_config.NumberColumn("Duración del turno (min)", min_value=15, max_value=180,
+                                                      step=5, default=MINUTOS_POR_SLOT, required=True),
+        }
+    )
+    if st.button("💾 Guardar horario", key="guardar_plantilla", type="primary"):
+        df_valido = df_plantilla_editada.dropna()
+        if (df_valido['hasta'] <= df_valido['desde']).any():
+            st.error("❌ En cada rango, 'Hasta' debe ser posterior a 'Desde'.")
+        else:
+            filas = [(NOMBRES_DIAS.index(row['dia']), row['desde'].strftime('%H:%M'),
+                      row['hasta'].strftime('%H:%M'), int(row['duracion']))
+                     for _, row in df_valido.iterrows()]
+            if guardar_plantilla_horario_en_bd(dni_psicologo, filas):
+                invalidar_horarios()
+                st.success("✅ Horario de atención guardado.")
+                st.rerun()
+            else:
+                st.error("❌ No se pudo guardar el horario de atención.")
+
+    st.markdown("---")
+    st.markdown("**Bloquear días** (vacaciones, congresos, etc.)")
+    col_bloq_desde, col_bloq_hasta, col_bloq_motivo = st.columns([1, 1, 2])
+    with col_bloq_desde:
+        bloqueo_desde = st.date_input("Desde", value=datetime.date.today(), key="bloqueo_desde")
+    with col_bloq_hasta:
+        bloqueo_hasta = st.date_input("Hasta", value=datetime.date.today(), min_value=bloqueo_desde, key="bloqueo_hasta")
+    with col_bloq_motivo:
+        bloqueo_motivo = st.text_input("Motivo", placeholder="Ej: Vacaciones", key="bloqueo_motivo")
+    if st.button("🚫 Bloquear días", key="guardar_bloqueo", type="primary"):
+        inicio_bloqueo = datetime.datetime.combine(bloqueo_desde, datetime.time.min)
+        fin_bloqueo = datetime.datetime.combine(bloqueo_hasta + timedelta(days=1), datetime.time.min)
+        if guardar_bloqueo_en_bd(dni_psicologo, inicio_bloqueo, fin_bloqueo, bloqueo_motivo or None):
+            invalidar_horarios()
+            st.success("✅ Días bloqueados.")
+            st.rerun()
+        else:
+            st.error("❌ No se pudo registrar el bloqueo.")
+
+    st.markdown("---")
+    st.markdown("**Importar calendario externo (.ics)**")
+    st.caption("Los eventos del calendario (Google, Outlook, Apple) se bloquean en la agenda. "
+               "Al volver a importar se reemplazan los bloqueos importados anteriormente.")
+    col_ics_archivo, col_ics_dias = st.columns([3, 1])
+    with col_ics_archivo:
+        archivo_ics = st.file_uploader("Archivo .ics", type=["ics"], key="importar_ics_archivo")
+    with col_ics_dias:
+        dias_importacion = st.number_input("Días a importar", min_value=7, max_value=730, value=180, step=30,
+                                           key="importar_ics_dias")
+    if archivo_ics is not None and st.button("📥 Importar calendario", key="importar_ics"):
+        with st.spinner("Importando calendario..."):
+            importados = importar_ics_como_bloqueos(archivo_ics, dni_psicologo, dias_ventana=int(dias_importacion))
+        if importados is None:
+            st.error("❌ No se pudo importar el calendario.")
+        else:
+            invalidar_horarios()
+            st.success(f"✅ {importados} eventos importados como bloqueos.")
+            st.rerun()
+
+    bloqueos_futuros = cargar_bloqueos(dni_psicologo, datetime.date.today(), datetime.date.today() + timedelta(days=365))
+    if not bloqueos_futuros.empty:
+        st.dataframe(bloqueos_futuros[['inicio', 'fin', 'motivo', 'origen']], hide_index=True, use_container_width=True,
+                     column_config={
+                         "inicio": st.column_config.DatetimeColumn("Desde", format="DD/MM/YYYY HH:mm"),
+                         "fin": st.column_config.DatetimeColumn("Hasta", format="DD/MM/YYYY HH:mm"),
+                         "motivo": "Motivo",
+                         "origen": "Origen",
+                     })
+        bloqueos_propios = bloqueos_futuros.dropna(subset=['id_bloqueo'])
+        opciones_bloqueos = {
+            f"{row['inicio']:%d/%m/%Y %H:%M} - {row['fin']:%d/%m/%Y %H:%M} {row['motivo'] or ''}": int(row['id_bloqueo'])
+            for _, row in bloqueos_propios.iterrows()
+        }
+        bloqueos_a_eliminar = st.multiselect("Desbloquear", list(opciones_bloqueos.keys()), key="bloqueos_eliminar")
+        if bloqueos_a_eliminar and st.button("Quitar bloqueos seleccionados", key="eliminar_bloqueos"):
+            if eliminar_bloqueos_en_bd([opciones_bloqueos[b] for b in bloqueos_a_eliminar], dni_psicologo):
+                invalidar_horarios()
+                st.rerun()
+            else:
+                st.error("❌ No se pudieron quitar los bloqueos.")
+
 with st.sidebar:
     st.markdown("## Perfil del Psicólogo")
     st.write(f"**Nombre:** {st.session_state.user_data.get('nombre', 'N/A')}")
     st.write(f"**DNI:** {st.session_state.user_data.get('dni', 'N/A')}")
     st.write(f"**Email:** {st.session_state.user_data.get('mail', 'N/A')}")
 
+    # --- Exportación de la agenda a calendarios externos (.ics) ---
+    st.markdown("---")
+    st.markdown("## 📤 Exportar agenda")
+    # El archivo se genera recién al hacer clic (data diferida) y no se guarda en la sesión
+    st.download_button(
+        "⬇️ Descargar agenda.ics",
+        data=lambda: b"".join(linea.encode("utf-8") for linea in generar_ics_turnos(dni_psicologo)),
+        file_name="agenda.ics",
+        mime="text/calendar",
+        on_click="ignore",
+        type="primary",
+        use_container_width=True
+    )
+    url_suscripcion = url_feed(dni_psicologo)
+    if url_suscripcion:
+        st.caption("Suscripción (se actualiza sola en el calendario del teléfono):")
+        st.code(url_suscripcion, language=None)
+
     #st.markdown("---")
     col1, col2, col3 = st.columns([1, 2, 1]) # Adjust ratios for desired centering
     with col2:
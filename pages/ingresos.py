@@ -127,6 +127,137 @@ def update_ingreso_status(id_ingreso, new_status='Pagado'):
 
 # ... (rest of your existing ingresos functions)
 
+# ============= INCOME AGGREGATES FOR THE CHARTS =============
+
+def get_version_ingresos(dni_psicologo):
+    """
+    Token barato que cambia cada vez que se agregan, borran o modifican ingresos del psicólogo.
+    Se usa como parte de la clave de caché de los resúmenes.
+    """
+    query = """
+    SELECT count(*) AS cantidad, max(created_at) AS ultimo_alta, max(updated_at) AS ultima_modificacion
+    FROM ingresos
+    WHERE dni_psicologo = %s
+    """
+    df = execute_query(query, params=(dni_psicologo,), is_select=True)
+    if df.empty:
+        return None
+    return tuple(str(v) for v in df.iloc[0].tolist())
+
+def get_resumen_ingresos(dni_psicologo):
+    """
+    Totales por estado y por mes calculados en la base (GROUP BY), para los gráficos.
+
+    Returns:
+        tuple: (DataFrame estado/total_sesion, DataFrame mes/total_sesion ordenado por mes).
+    """
+    query_estado = """
+    SELECT lower(estado) AS estado, sum(total_sesion)::float8 AS total_sesion
+    FROM ingresos
+    WHERE dni_psicologo = %s
+    GROUP BY 1
+    ORDER BY 1
+    """
+    query_mes = """
+    SELECT date_trunc('month', fecha)::date AS mes, sum(total_sesion)::float8 AS total_sesion
+    FROM ingresos
+    WHERE dni_psicologo = %s
+    GROUP BY 1
+    ORDER BY 1
+    """
+    df_estado = execute_query(query_estado, params=(dni_psicologo,), is_select=True)
+    df_mes = execute_query(query_mes, params=(dni_psicologo,), is_select=True)
+    return df_estado, df_mes
+
+# ============= REPRICING OF EXISTING INGRESOS =============
+
+# Resolves the price of every income in the range with the same rules as the
+# sessions page (patient > obra social > general, latest vigente_desde <= fecha).
+# The preview and the UPDATE share this CTE, so what is previewed is what gets written.
+CTE_RECALCULO_PRECIOS = """
+WITH recalculo AS (
+    SELECT
+        i.id_ingresos,
+        i.dni_paciente,
+        p.nombre AS nombre_paciente,
+        i.fecha,
+        i.estado,
+        i.total_sesion AS total_actual,
+        coalesce(precio_paciente.precio, precio_obra_social.precio, precio_general.precio) AS total_nuevo
+    FROM ingresos i
+    LEFT JOIN pacientes p ON p.dni_paciente = i.dni_paciente
+    LEFT JOIN LATERAL (
+        SELECT pr.precio FROM precios_sesion pr
+        WHERE pr.dni_psicologo = i.dni_psicologo AND pr.dni_paciente = i.dni_paciente
+          AND pr.vigente_desde <= i.fecha
+        ORDER BY pr.vigente_desde DESC, pr.id_precio DESC LIMIT 1
+    ) precio_paciente ON true
+    LEFT JOIN LATERAL (
+        SELECT pr.precio FROM precios_sesion pr
+        WHERE pr.dni_psicologo = i.dni_psicologo AND pr.obra_social = p.obra_social
+          AND pr.vigente_desde <= i.fecha
+        ORDER BY pr.vigente_desde DESC, pr.id_precio DESC LIMIT 1
+    ) precio_obra_social ON true
+    LEFT JOIN LATERAL (
+        SELECT pr.precio FROM precios_sesion pr
+        WHERE pr.dni_psicologo = i.dni_psicologo AND pr.dni_paciente IS NULL AND pr.obra_social IS NULL
+          AND pr.vigente_desde <= i.fecha
+        ORDER BY pr.vigente_desde DESC, pr.id_precio DESC LIMIT 1
+    ) precio_general ON true
+    WHERE i.dni_psicologo = %s
+      AND i.fecha BETWEEN %s AND %s
+      AND (NOT %s OR i.total_sesion = 0)
+      AND (%s OR lower(i.estado) <> 'pago')
+)
+"""
+
+def preview_recalculo_ingresos(dni_psicologo, fecha_desde, fecha_hasta, solo_en_cero=True, incluir_pagados=False):
+    """
+    Vista previa (no escribe nada): devuelve los ingresos cuyo total_sesion cambiaría,
+    con el monto actual y el recalculado.
+    """
+    query = CTE_RECALCULO_PRECIOS + """
+    SELECT id_ingresos, nombre_paciente, dni_paciente, fecha, estado, total_actual, total_nuevo
+    FROM recalculo
+    WHERE total_nuevo IS NOT NULL AND total_nuevo IS DISTINCT FROM total_actual
+    ORDER BY fecha, id_ingresos
+    """
+    params = (dni_psicologo, fecha_desde, fecha_hasta, solo_en_cero, incluir_pagados)
+    return execute_query(query, params=params, is_select=True)
+
+def aplicar_recalculo_ingresos(dni_psicologo, fecha_desde, fecha_hasta, solo_en_cero=True, incluir_pagados=False):
+    """
+    Recalcula total_sesion de todo el período con un único UPDATE ... FROM sobre el mismo CTE.
+
+    Returns:
+        int or None: Cantidad de ingresos actualizados, o None si hubo un error.
+    """
+    query = CTE_RECALCULO_PRECIOS + """
+    UPDATE ingresos i
+    SET total_sesion = r.total_nuevo, updated_at = NOW()
+    FROM recalculo r
+    WHERE i.id_ingresos = r.id_ingresos
+      AND r.total_nuevo IS NOT NULL AND r.total_nuevo IS DISTINCT FROM r.total_actual
+    """
+    params = (dni_psicologo, fecha_desde, fecha_hasta, solo_en_cero, incluir_pagados)
+    conn = connect_to_supabase()
+    if conn is None:
+        return None
+    try:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        actualizados = cursor.rowcount
+        conn.commit()
+        cursor.close()
+        return actualizados
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Error al recalcular los ingresos: {e}")
+        return None
+    finally:
+        conn.close()
+
+
 def get_ingresos_by_psicologo(dni_psicologo):
     """
     Obtiene todos los registros de ingresos asociados a un psicólogo específico.
@@ -134,18 +265,20 @@ def get_ingresos_by_psicologo(dni_psicologo):
     """
     query = """
     SELECT 
-        id_ingresos,
-        estado,
-        created_at,
-        updated_at,
-        dni_psicologo,
-        dni_paciente,
-        total_sesion, -- This is the monto/amount column
-        fecha,
-        sesion
-    FROM ingresos
-    WHERE dni_psicologo = %s
-    ORDER BY fecha DESC, created_at DESC;
+        i.id_ingresos,
+        i.estado,
+        i.created_at,
+        i.updated_at,
+        i.dni_psicologo,
+        i.dni_paciente,
+        coalesce(p.nombre, 'Paciente Desconocido') AS nombre_paciente, -- Resolved in the same query (no per-patient lookups)
+        i.total_sesion, -- This is the monto/amount column
+        i.fecha,
+        i.sesion
+    FROM ingresos i
+    LEFT JOIN pacientes p ON p.dni_paciente = i.dni_paciente
+    WHERE i.dni_psicologo = %s
+    ORDER BY i.fecha DESC, i.created_at DESC;
     """
     
     try:
@@ -162,7 +295,7 @@ def get_ingresos_by_psicologo(dni_psicologo):
         st.error(f"Error al obtener ingresos del psicólogo {dni_psicologo}: {str(e)}")
         # Define columns precisely based on your schema
         return pd.DataFrame(columns=['id_ingresos', 'estado', 'created_at', 'updated_at',
-                                     'dni_psicologo', 'dni_paciente', 'total_sesion',
+                                     'dni_psicologo', 'dni_paciente', 'nombre_paciente', 'total_sesion',
                                      'fecha', 'sesion'])
 
 def add_ingreso(dni_psicologo, dni_paciente, total_sesion, fecha, sesion, estado):
@@ -201,18 +334,6 @@ def get_pacientes_for_dropdown(dni_psicologo):
         return [(f"{row['dni_paciente']} - {row['nombre']}", row['dni_paciente']) for _, row in df.iterrows()]
     return []
 
-# NEW FUNCTION: Get patient name by DNI
-@st.cache_data(ttl=300, show_spinner=False) # Cache for 5 minutes
-def get_patient_name_by_dni(dni_paciente):
-    """
-    Retrieves the patient's name given their DNI.
-    """
-    query = "SELECT nombre FROM pacientes WHERE dni_paciente = %s;"
-    result_df = execute_query(query, params=(dni_paciente,), is_select=True)
-    if not result_df.empty:
-        return result_df.iloc[0]['nombre']
-    return "Paciente Desconocido" # Fallback if name not found
-
 # ============= STREAMLIT CONFIGURATION =============
 
 st.set_page_config(
@@ -414,6 +535,12 @@ def load_ingresos_data_by_psicologo(dni_psicologo):
     """Loads income data from Supabase filtered by psychologist with caching"""
     return get_ingresos_by_psicologo(dni_psicologo)
 
+# Keyed by psychologist and data version: charts are recomputed only when ingresos change
+@st.cache_data(max_entries=50, show_spinner=False)
+def load_resumen_ingresos(dni_psicologo, version):
+    """Loads the per-status and per-month income totals (aggregated server-side)"""
+    return get_resumen_ingresos(dni_psicologo)
+
 # Main title with custom background
 st.markdown("""
 <div class="title-container">
@@ -454,18 +581,8 @@ if st.session_state.authenticated_psicologo:
     # with st.spinner("Cargando sus ingresos..."):
     df_ingresos = load_ingresos_data_by_psicologo(st.session_state.authenticated_psicologo)
         
-    # --- NEW: Fetch patient names and merge with df_ingresos for display ---
-    # This is done here to ensure the merged DataFrame is used for filtering and display
-    if not df_ingresos.empty:
-        # Get unique patient DNIs from the incomes
-        unique_dnis = df_ingresos['dni_paciente'].unique().tolist()
-        
-        # Fetch names for these DNIs
-        patient_names = {dni: get_patient_name_by_dni(dni) for dni in unique_dnis}
-        
-        # Map DNI to patient name in the DataFrame
-        df_ingresos['nombre_paciente'] = df_ingresos['dni_paciente'].map(patient_names)
-    else:
+    # Patient names come from the JOIN in get_ingresos_by_psicologo
+    if 'nombre_paciente' not in df_ingresos.columns:
         df_ingresos['nombre_paciente'] = pd.Series(dtype='str') # Add empty column if df is empty
 
 
@@ -663,6 +780,51 @@ if st.session_state.authenticated_psicologo:
 # --- END NEW SECTION FOR PENDING SESSIONS ---
 # ... (rest of your Streamlit code, including the main st.dataframe for all incomes and plots)
 
+        # --- Repricing of past incomes from the pricing rules ---
+        with st.expander("🧮 Recalcular montos según la tabla de precios"):
+            st.caption("Recalcula el monto de los ingresos del período con los precios configurados en la página de Sesiones "
+                       "(paciente > obra social > general, según la fecha de cada sesión).")
+            col_recalc_desde, col_recalc_hasta = st.columns(2)
+            with col_recalc_desde:
+                recalculo_desde = st.date_input("Desde", value=df_ingresos['fecha'].min(), key="recalculo_desde")
+            with col_recalc_hasta:
+                recalculo_hasta = st.date_input("Hasta", value=df_ingresos['fecha'].max(), key="recalculo_hasta")
+            col_recalc_cero, col_recalc_pagados = st.columns(2)
+            with col_recalc_cero:
+                recalculo_solo_cero = st.checkbox("Solo ingresos con monto $0", value=True, key="recalculo_solo_cero")
+            with col_recalc_pagados:
+                recalculo_pagados = st.checkbox("Incluir ingresos ya pagados", value=False, key="recalculo_pagados")
+
+            parametros_recalculo = (st.session_state.authenticated_psicologo, recalculo_desde, recalculo_hasta,
+                                    recalculo_solo_cero, recalculo_pagados)
+            if st.button("👁️ Vista previa", key="recalculo_preview"):
+                st.session_state.recalculo_preview = (parametros_recalculo, preview_recalculo_ingresos(*parametros_recalculo))
+
+            preview = st.session_state.get('recalculo_preview')
+            if preview and preview[0] == parametros_recalculo:
+                df_preview = preview[1]
+                if df_preview.empty:
+                    st.info("No hay ingresos para corregir con estos criterios.")
+                else:
+                    diferencia = (df_preview['total_nuevo'].astype(float) - df_preview['total_actual'].astype(float)).sum()
+                    st.markdown(f"**{len(df_preview)}** ingresos cambiarían (diferencia total: **${diferencia:,.2f}**).")
+                    st.dataframe(df_preview.drop(columns=['id_ingresos']), use_container_width=True, hide_index=True,
+                                 column_config={
+                                     "nombre_paciente": "Paciente",
+                                     "dni_paciente": "DNI Paciente",
+                                     "fecha": st.column_config.DateColumn("Fecha", format="DD/MM/YYYY"),
+                                     "estado": "Estado",
+                                     "total_actual": st.column_config.NumberColumn("Monto actual", format="$%.2f"),
+                                     "total_nuevo": st.column_config.NumberColumn("Monto nuevo", format="$%.2f"),
+                                 }, height=300)
+                    if st.button(f"✅ Aplicar a {len(df_preview)} ingresos", key="recalculo_aplicar", type="primary"):
+                        actualizados = aplicar_recalculo_ingresos(*parametros_recalculo)
+                        if actualizados is not None:
+                            del st.session_state.recalculo_preview
+                            st.cache_data.clear()
+                            st.success(f"✅ {actualizados} ingresos actualizados.")
+                            st.rerun()
+
         # Button to refresh data
         if st.button("🔄 Refrescar Datos de Ingresos", help="Recarga los datos de ingresos desde la base de datos"):
             st.cache_data.clear()
@@ -671,9 +833,10 @@ if st.session_state.authenticated_psicologo:
         # --- Donut Chart for Income Status (Paid vs. Pending) ---
         #st.markdown("---")
         st.markdown("### Proporción de Ingresos: Pagados vs. Pendientes")
-        if not df_ingresos.empty:
-            # Group by status and sum total_sesion
-            income_status_summary = df_ingresos.groupby('estado')['total_sesion'].sum().reset_index()
+        income_status_summary, income_per_month = load_resumen_ingresos(
+            st.session_state.authenticated_psicologo,
+            get_version_ingresos(st.session_state.authenticated_psicologo))
+        if not income_status_summary.empty:
 
             # Define colors, attempting to match the image's aesthetic
             # Ensure 'pagado' is green, 'pendiente' is blue (or similar)
@@ -700,7 +863,7 @@ if st.session_state.authenticated_psicologo:
                 title_text='Distribución de Ingresos por Estado',
                 title_x=0.5, # Center the title
                 margin=dict(t=50, b=0, l=0, r=0), # Adjust margins for better fit
-                annotations=[dict(text=f'Total:<br>${df_ingresos["total_sesion"].sum():,.0f}',
+                annotations=[dict(text=f'Total:<br>${income_status_summary["total_sesion"].sum():,.0f}',
                                   x=0.5, y=0.5, font_size=20, showarrow=False)] # Center text
             )
             st.plotly_chart(fig_donut, use_container_width=True)
@@ -710,20 +873,9 @@ if st.session_state.authenticated_psicologo:
         # --- Bar Chart for Income Per Month ---
         #st.markdown("---")
         st.markdown("### Ingresos por Mes")
-        if not df_ingresos.empty:
-            # Ensure 'fecha' is datetime object for month extraction
-            df_ingresos_copy = df_ingresos.copy()
-            df_ingresos_copy['fecha'] = pd.to_datetime(df_ingresos_copy['fecha'])
-            
-            # Extract month and year
-            df_ingresos_copy['month_year'] = df_ingresos_copy['fecha'].dt.to_period('M').astype(str)
-            
-            # Aggregate income by month and year
-            income_per_month = df_ingresos_copy.groupby('month_year')['total_sesion'].sum().reset_index()
-            
-            # Sort by month_year to ensure chronological order
-            income_per_month['sort_key'] = pd.to_datetime(income_per_month['month_year'])
-            income_per_month = income_per_month.sort_values('sort_key').drop(columns='sort_key')
+        if not income_per_month.empty:
+            # Months come already grouped and sorted from the database
+            income_per_month['month_year'] = pd.to_datetime(income_per_month['mes']).dt.strftime('%Y-%m')
 
             fig_bar = px.bar(
                 income_per_month,
@@ -1,21 +1,18 @@
 import streamlit as st
 import pandas as pd
-from datetime import date, datetime
-from dateutil.parser import parse
+from datetime import date, datetime, timedelta
 
 # --- IMPORTAR FUNCIONES DE BASE DE DATOS ---
-from functions import connect_to_supabase, execute_query, guardar_sesion_en_bd
+from functions import (connect_to_supabase, execute_query, execute_values_query, guardar_sesion_en_bd,
+                       cargar_proximos_turnos, cargar_tabla_precios, cargar_reglas_precios, guardar_precio_sesion,
+                       eliminar_precios_sesion, invalidar_precios, cargar_nombres_pacientes)
+from busqueda_sesiones import obtener_buscador_sesiones
 
 # --- NUEVA CLASE PARA MANEJAR INGRESOS AUTOMÁTICOS ---
 class ManejadorIngresos:
-    def __init__(self):
-        self.precio_fijo_sesion = None
-    
-    def obtener_precio_sesion(self):
-        """Obtiene el precio fijo configurado para las sesiones"""
-        if 'precio_sesion' in st.session_state:
-            return st.session_state.precio_sesion
-        return None
+    def obtener_precio_sesion(self, dni_psicologo, dni_paciente, fecha):
+        """Resuelve el precio de la sesión con la tabla de precios del psicólogo (en memoria, sin consultas extra)"""
+        return cargar_tabla_precios(dni_psicologo).precio(dni_paciente, fecha)
     
     def obtener_datos_turno(self, id_turno):
         """Obtiene la fecha del turno basado en el ID"""
@@ -32,14 +29,15 @@ class ManejadorIngresos:
     def crear_ingreso_automatico(self, datos_sesion, dni_psicologo_actual):
         """Crea automáticamente un registro en la tabla ingresos"""
         try:
-            # Obtener precio configurado
-            precio_sesion = self.obtener_precio_sesion()
-            if not precio_sesion:
-                st.warning("⚠️ No se ha configurado el precio de las sesiones. El ingreso se creará con valor 0.")
-                precio_sesion = 0
+            # Obtener fecha del turno (viene con la sesión cuando se eligió desde los turnos pendientes)
+            fecha_turno = datos_sesion.get('fecha') or self.obtener_datos_turno(datos_sesion['id_turno'])
             
-            # Obtener fecha del turno
-            fecha_turno = self.obtener_datos_turno(datos_sesion['id_turno'])
+            # Obtener precio vigente para el paciente en la fecha del turno
+            precio_sesion = self.obtener_precio_sesion(dni_psicologo_actual, datos_sesion['dni_paciente'],
+                                                       fecha_turno or datetime.now().date())
+            if precio_sesion is None:
+                st.warning("⚠️ No hay un precio vigente para esta sesión. El ingreso se registra en $0.")
+                precio_sesion = 0
             
             # Preparar datos para insertar en ingresos
             query = f"""
@@ -85,6 +83,9 @@ def guardar_sesion_con_ingreso(nueva_sesion, dni_psicologo):
                 
                 # 3. Crear el ingreso automáticamente
                 manejador_ingresos.crear_ingreso_automatico(nueva_sesion, dni_psicologo)
+
+                # 4. Agregar la sesión al índice de búsqueda (no-op con el backend de Postgres)
+                obtener_buscador_sesiones().indexar_sesion(dni_psicologo, nueva_sesion)
                 
             return True
         return False
@@ -92,6 +93,94 @@ def guardar_sesion_con_ingreso(nueva_sesion, dni_psicologo):
         st.error(f"Error al guardar sesión con ingreso: {e}")
         return False
 
+# --- REGISTRO DE VARIAS SESIONES EN LOTE ---
+def pacientes_sin_precio(filas, dni_psicologo):
+    """Nombres de los pacientes de las filas que no tienen un precio vigente en la fecha del turno."""
+    tabla_precios = cargar_tabla_precios(dni_psicologo)
+    return sorted({f['nombre_paciente'] for f in filas if tabla_precios.precio(f['dni_paciente'], f['fecha']) is None})
+
+def guardar_sesiones_en_lote(filas, dni_psicologo, permitir_sin_precio=False):
+    """
+    Registra varias sesiones y sus ingresos en una única transacción.
+
+    Busca las fichas médicas de todos los pacientes con una consulta, inserta las
+    sesiones con un INSERT multi-fila (RETURNING id_sesion) y luego los ingresos
+    con otro. Si falta alguna ficha, algún paciente no tiene precio vigente (y no
+    se confirmó registrarlo en $0) o falla una sentencia, no se guarda nada.
+
+    Args:
+        filas (list): Diccionarios con 'id_turno', 'dni_paciente', 'fecha', 'nombre_paciente',
+            'asistencia', 'estado', 'notas_de_la_sesion' y 'temas_principales_desarrollados'.
+        dni_psicologo (str): DNI del psicólogo logueado.
+        permitir_sin_precio (bool, optional): Registrar en $0 los ingresos sin precio vigente.
+
+    Returns:
+        tuple: (lista de sesiones guardadas con su 'id_sesion', lista de pacientes sin ficha médica,
+            lista de pacientes sin precio vigente).
+    """
+    if not filas:
+        return [], [], []
+
+    tabla_precios = cargar_tabla_precios(dni_psicologo)
+    precios = [tabla_precios.precio(f['dni_paciente'], f['fecha']) for f in filas]
+    sin_precio = sorted({f['nombre_paciente'] for f, precio in zip(filas, precios) if precio is None})
+    if sin_precio and not permitir_sin_precio:
+        return [], [], sin_precio
+
+    conn = connect_to_supabase()
+    if conn is None:
+        st.error("❌ No se pudo conectar con la base de datos.")
+        return [], [], []
+
+    try:
+        dnis = sorted({str(f['dni_paciente']) for f in filas})
+        df_fichas = execute_query("SELECT dni_paciente, id_ficha_medica FROM ficha_medica WHERE dni_paciente = ANY(%s)",
+                                  conn=conn, is_select=True, params=(dnis,))
+        fichas = {} if df_fichas is None or df_fichas.empty else dict(
+            zip(df_fichas['dni_paciente'].astype(str), df_fichas['id_ficha_medica'].tolist()))
+        sin_ficha = sorted({f['nombre_paciente'] for f in filas if str(f['dni_paciente']) not in fichas})
+        if sin_ficha:
+            return [], sin_ficha, []
+
+        query_sesiones = """
+        INSERT INTO sesiones (id_turno, dni_paciente, id_fichamedica, notas_de_la_sesion,
+                              temas_principales_desarrollados, estado, asistencia)
+        VALUES %s
+        RETURNING id_sesion, id_turno
+        """
+        df_ids = execute_values_query(query_sesiones, [
+            (int(f['id_turno']), str(f['dni_paciente']), fichas[str(f['dni_paciente'])], f['notas_de_la_sesion'],
+             f['temas_principales_desarrollados'], f['estado'], f['asistencia']) for f in filas
+        ], conn=conn, fetch=True)
+        if df_ids is None or len(df_ids) != len(filas):
+            conn.rollback()
+            return [], [], []
+
+        ids_por_turno = dict(zip(df_ids['id_turno'].astype(int).tolist(), df_ids['id_sesion'].astype(int).tolist()))
+        for fila in filas:
+            fila['id_sesion'] = ids_por_turno[int(fila['id_turno'])]
+
+        query_ingresos = """
+        INSERT INTO ingresos (estado, dni_psicologo, dni_paciente, total_sesion, fecha, sesion)
+        VALUES %s
+        """
+        if not execute_values_query(query_ingresos, [
+            (f['estado'], dni_psicologo, str(f['dni_paciente']),
+             0 if precio is None else precio, f['fecha'], f['id_sesion'])
+            for f, precio in zip(filas, precios)
+        ], conn=conn):
+            conn.rollback()
+            return [], [], []
+
+        conn.commit()
+        return filas, [], []
+    except Exception as e:
+        conn.rollback()
+        st.error(f"Error al guardar las sesiones: {e}")
+        return [], [], []
+    finally:
+        conn.close()
+
 # --- FUNCIÓN DE NAVEGACIÓN Y AUTENTICACIÓN ---
 def cerrar_sesion():
     """Limpia el estado de la sesión y redirige a la página de inicio."""
@@ -116,9 +205,72 @@ if not dni_psicologo_logueado:
     st.stop()
 
 # --- FUNCIONES DE CARGA DE DATOS (mantener las existentes) ---
+SESIONES_POR_PAGINA = 25  # Filas de la tabla de sesiones que se muestran (y cuyas notas se cargan) a la vez
+
 @st.cache_data(ttl=60, show_spinner=False)
-def cargar_sesiones_psicologo(dni_psicologo):
-    """Carga sesiones uniéndolas con turnos para filtrar por el DNI del psicólogo"""
+def cargar_resumen_sesiones(dni_psicologo):
+    """Cuenta total de sesiones y presentes del psicólogo con una consulta agregada."""
+    try:
+        query = """
+        SELECT count(*) AS total,
+               count(*) FILTER (WHERE s.asistencia = 'asistio') AS presentes
+        FROM sesiones s
+        JOIN turnos t ON s.id_turno = t.id_turnos
+        WHERE t.dni_psicologo = %s
+        """
+        df = execute_query(query, is_select=True, params=(dni_psicologo,))
+        if df is None or df.empty:
+            return {'total': 0, 'presentes': 0}
+        return {'total': int(df.iloc[0]['total']), 'presentes': int(df.iloc[0]['presentes'])}
+    except Exception as e:
+        st.error(f"Error al cargar el resumen de sesiones: {e}")
+        return {'total': 0, 'presentes': 0}
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_pagina_sesiones(dni_psicologo, paciente=None, asistencia=None, fecha=None, estado=None,
+                           texto_notas=None, despues_de=None, limite=SESIONES_POR_PAGINA):
+    """
+    Carga una página del historial de sesiones (sin el texto de las notas).
+
+    Usa paginación por clave sobre (t.fecha DESC, s.id_sesion DESC): la página
+    siguiente empieza después de la última fila de la anterior, así el costo no
+    depende de cuántas páginas se avanzaron. Los filtros se aplican en SQL.
+
+    Args:
+        dni_psicologo (str): DNI del psicólogo.
+        paciente (str, optional): Texto a buscar en el nombre o DNI del paciente.
+        asistencia (str, optional): 'asistio' o 'no asistio'.
+        fecha (datetime.date, optional): Fecha exacta del turno.
+        estado (str, optional): 'pendiente' o 'pago'.
+        texto_notas (str, optional): Consulta de texto completo sobre notas y temas.
+        despues_de (tuple, optional): (fecha, id_sesion) de la última fila de la página anterior.
+        limite (int, optional): Filas por página.
+
+    Returns:
+        tuple: (DataFrame de la página, hay_mas).
+    """
+    condiciones = ["t.dni_psicologo = %s"]
+    params = [dni_psicologo]
+    if paciente:
+        condiciones.append("(p.nombre ILIKE %s OR t.dni_paciente::text LIKE %s)")
+        params += [f"%{paciente}%", f"%{paciente}%"]
+    if asistencia:
+        condiciones.append("s.asistencia = %s")
+        params.append(asistencia)
+    if fecha:
+        condiciones.append("t.fecha = %s")
+        params.append(fecha)
+    if estado:
+        condiciones.append("s.estado = %s")
+        params.append(estado)
+    if texto_notas:
+        condicion_texto, params_texto = obtener_buscador_sesiones().filtro_sql(dni_psicologo, texto_notas)
+        condiciones.append(condicion_texto)
+        params += params_texto
+    if despues_de:
+        condiciones.append("(t.fecha, s.id_sesion) < (%s::date, %s)")
+        params += [despues_de[0], int(despues_de[1])]
+
     try:
         query = f"""
         SELECT
@@ -126,8 +278,6 @@ def cargar_sesiones_psicologo(dni_psicologo):
             s.id_turno,
             t.dni_paciente,
             s.id_fichamedica,
-            s.notas_de_la_sesion,
-            s.temas_principales_desarrollados,
             s.estado,
             s.asistencia,
             p.nombre as nombre_paciente,
@@ -135,14 +285,49 @@ def cargar_sesiones_psicologo(dni_psicologo):
         FROM sesiones s
         JOIN turnos t ON s.id_turno = t.id_turnos
         JOIN pacientes p ON t.dni_paciente = p.dni_paciente
-        WHERE t.dni_psicologo = '{dni_psicologo}'
+        WHERE {' AND '.join(condiciones)}
         ORDER BY t.fecha DESC, s.id_sesion DESC
+        LIMIT %s
         """
-        df = execute_query(query, is_select=True)
-        return df if df is not None else pd.DataFrame()
+        # Se pide una fila de más para saber si existe una página siguiente
+        df = execute_query(query, is_select=True, params=tuple(params) + (limite + 1,))
+        if df is None or df.empty:
+            return pd.DataFrame(), False
+        return df.iloc[:limite], len(df) > limite
     except Exception as e:
         st.error(f"Error al cargar sesiones: {e}")
-        return pd.DataFrame()
+        return pd.DataFrame(), False
+
+@st.cache_data(ttl=60, show_spinner=False)
+def cargar_notas_sesiones(ids_sesiones):
+    """
+    Trae las notas y temas de un conjunto acotado de sesiones (las visibles).
+
+    Args:
+        ids_sesiones (tuple): IDs de sesión (tupla para que sirva como clave de caché).
+
+    Returns:
+        pandas.DataFrame: Columnas id_sesion, notas_de_la_sesion y temas_principales_desarrollados.
+    """
+    vacio = pd.DataFrame(columns=['id_sesion', 'notas_de_la_sesion', 'temas_principales_desarrollados'])
+    if not ids_sesiones:
+        return vacio
+    try:
+        query = """
+        SELECT id_sesion, notas_de_la_sesion, temas_principales_desarrollados
+        FROM sesiones
+        WHERE id_sesion = ANY(%s)
+        """
+        df = execute_query(query, is_select=True, params=([int(i) for i in ids_sesiones],))
+        return df if df is not None and not df.empty else vacio
+    except Exception as e:
+        st.error(f"Error al cargar notas de las sesiones: {e}")
+        return vacio
+
+@st.cache_data(ttl=60, show_spinner=False)
+def buscar_en_sesiones(dni_psicologo, consulta):
+    """Resultados rankeados y resaltados de la búsqueda en notas y temas."""
+    return obtener_buscador_sesiones().buscar(dni_psicologo, consulta)
 
 @st.cache_data(ttl=60, show_spinner=False)
 def cargar_pacientes_asignados_al_psicologo(dni_psicologo):
@@ -162,52 +347,121 @@ def cargar_pacientes_asignados_al_psicologo(dni_psicologo):
         return []
 
 @st.cache_data(ttl=300, show_spinner=False)
-def cargar_proximo_turno(dni_psicologo):
-    """Carga el próximo turno futuro para el psicólogo."""
-    if not dni_psicologo: return None
-    try:
-        query = f"""
-        SELECT t.fecha, t.hora, p.nombre as nombre_paciente
-        FROM turnos t
+def cargar_asistencia_por_paciente(dni_psicologo):
+    """
+    Estadísticas de asistencia por paciente calculadas en una única consulta.
+
+    Las rachas se obtienen con funciones de ventana (diferencia de row_number entre
+    la serie completa del paciente y la serie de asistencias/ausencias), así la base
+    devuelve una fila por paciente.
+
+    Returns:
+        pandas.DataFrame: dni_paciente, nombre_paciente, total, presentes, tasa_asistencia (0-100),
+            ultima_asistencia, ultima_sesion, racha_actual (positiva = asistencias seguidas,
+            negativa = ausencias seguidas), mejor_racha y max_ausencias_seguidas.
+    """
+    query = """
+    WITH historial AS (
+        SELECT t.dni_paciente,
+               p.nombre AS nombre_paciente,
+               t.fecha,
+               s.asistencia = 'asistio' AS asistio,
+               row_number() OVER (PARTITION BY t.dni_paciente ORDER BY t.fecha, s.id_sesion)
+                 - row_number() OVER (PARTITION BY t.dni_paciente, s.asistencia = 'asistio'
+                                      ORDER BY t.fecha, s.id_sesion) AS grupo,
+               row_number() OVER (PARTITION BY t.dni_paciente ORDER BY t.fecha DESC, s.id_sesion DESC) AS orden_inverso
+        FROM sesiones s
+        JOIN turnos t ON s.id_turno = t.id_turnos
         JOIN pacientes p ON t.dni_paciente = p.dni_paciente
-        WHERE t.dni_psicologo = '{dni_psicologo}'
-          AND (t.fecha > CURRENT_DATE OR (t.fecha = CURRENT_DATE AND t.hora > CURRENT_TIME))
-        ORDER BY t.fecha ASC, t.hora ASC
-        LIMIT 1
-        """
-        df = execute_query(query, is_select=True)
-        if df is None or df.empty: return None
-
-        turno = df.iloc[0]
-        fecha_obj = parse(str(turno['fecha'])).date()
-        return {
-            'dia': fecha_obj.strftime('%A'),
-            'fecha': fecha_obj.strftime('%d/%m/%Y'),
-            'horario': str(turno['hora']),
-            'paciente': str(turno['nombre_paciente'])
-        }
+        WHERE t.dni_psicologo = %s
+    ),
+    rachas AS (
+        SELECT dni_paciente, asistio, count(*) AS largo, min(orden_inverso) = 1 AS es_actual
+        FROM historial
+        GROUP BY dni_paciente, asistio, grupo
+    ),
+    resumen_rachas AS (
+        SELECT dni_paciente,
+               max(CASE WHEN es_actual THEN CASE WHEN asistio THEN largo ELSE -largo END END) AS racha_actual,
+               coalesce(max(largo) FILTER (WHERE asistio), 0) AS mejor_racha,
+               coalesce(max(largo) FILTER (WHERE NOT asistio), 0) AS max_ausencias_seguidas
+        FROM rachas
+        GROUP BY dni_paciente
+    )
+    SELECT h.dni_paciente,
+           max(h.nombre_paciente) AS nombre_paciente,
+           count(*) AS total,
+           count(*) FILTER (WHERE h.asistio) AS presentes,
+           round(100.0 * count(*) FILTER (WHERE h.asistio) / count(*), 1) AS tasa_asistencia,
+           max(h.fecha) FILTER (WHERE h.asistio) AS ultima_asistencia,
+           max(h.fecha) AS ultima_sesion,
+           r.racha_actual, r.mejor_racha, r.max_ausencias_seguidas
+    FROM historial h
+    JOIN resumen_rachas r ON r.dni_paciente = h.dni_paciente
+    GROUP BY h.dni_paciente, r.racha_actual, r.mejor_racha, r.max_ausencias_seguidas
+    ORDER BY tasa_asistencia, total DESC
+    """
+    try:
+        df = execute_query(query, is_select=True, params=(dni_psicologo,))
+        if df is None or df.empty:
+            return pd.DataFrame()
+        df['tasa_asistencia'] = df['tasa_asistencia'].astype(float)
+        return df
     except Exception as e:
-        st.error(f"Error al cargar próximo turno: {e}")
-        return None
-    
+        st.error(f"Error al cargar la asistencia por paciente: {e}")
+        return pd.DataFrame()
+
+@st.cache_data(ttl=300, show_spinner=False)
+def cargar_tendencia_asistencia(dni_psicologo, dni_paciente=None, meses=12):
+    """Sesiones y asistencias por mes (de todo el consultorio o de un paciente) en los últimos meses."""
+    query = """
+    SELECT date_trunc('month', t.fecha)::date AS mes,
+           count(*) AS sesiones,
+           count(*) FILTER (WHERE s.asistencia = 'asistio') AS presentes
+    FROM sesiones s
+    JOIN turnos t ON s.id_turno = t.id_turnos
+    WHERE t.dni_psicologo = %s
+      AND (%s::text IS NULL OR t.dni_paciente::text = %s)
+      AND t.fecha >= date_trunc('month', current_date) - make_interval(months => %s)
+    GROUP BY 1
+    ORDER BY 1
+    """
+    try:
+        df = execute_query(query, is_select=True, params=(dni_psicologo, dni_paciente, dni_paciente, meses - 1))
+        if df is None or df.empty:
+            return pd.DataFrame()
+        df['% asistencia'] = (100 * df['presentes'] / df['sesiones']).round(1)
+        return df
+    except Exception as e:
+        st.error(f"Error al cargar la tendencia de asistencia: {e}")
+        return pd.DataFrame()
+
+DIAS_VENTANA_PENDIENTES = 60  # Días hacia atrás que se revisan al buscar turnos sin sesión; "Cargar anteriores" suma otros tantos
+
 @st.cache_data(ttl=60, show_spinner=False)
-def cargar_turnos_pendientes(dni_psicologo):
-    """Carga los turnos de un psicólogo que aún no tienen una sesión registrada."""
+def cargar_turnos_pendientes(dni_psicologo, desde):
+    """
+    Carga los turnos del psicólogo desde la fecha 'desde' que aún no tienen una sesión registrada.
+
+    Usa NOT EXISTS sobre el índice de sesiones(id_turno) y recorre solo la ventana
+    pedida, no todo el historial.
+    """
     try:
-        query = f"""
+        query = """
         SELECT
             t.id_turnos,
             t.fecha,
-            t.hora,
+            to_char(t.hora, 'HH24:MI') as hora,
             p.nombre as nombre_paciente,
             p.dni_paciente
         FROM turnos t
         JOIN pacientes p ON t.dni_paciente = p.dni_paciente
-        LEFT JOIN sesiones s ON t.id_turnos = s.id_turno
-        WHERE t.dni_psicologo = '{dni_psicologo}' AND s.id_sesion IS NULL
+        WHERE t.dni_psicologo = %s
+          AND t.fecha >= %s
+          AND NOT EXISTS (SELECT 1 FROM sesiones s WHERE s.id_turno = t.id_turnos)
         ORDER BY t.fecha DESC, t.hora DESC
         """
-        df = execute_query(query, is_select=True)
+        df = execute_query(query, is_select=True, params=(dni_psicologo, desde))
         return df if df is not None else pd.DataFrame()
     except Exception as e:
         st.error(f"Error al cargar turnos pendientes: {e}")
@@ -236,9 +490,7 @@ def traducir_dia(dia_ingles):
 def cargar_datos_en_sesion(dni_psicologo):
     """Carga todos los datos necesarios en el estado de la sesión"""
     if 'last_loaded_dni' not in st.session_state or st.session_state.last_loaded_dni != dni_psicologo:
-        st.session_state.sesiones = cargar_sesiones_psicologo(dni_psicologo)
         st.session_state.pacientes_asignados = cargar_pacientes_asignados_al_psicologo(dni_psicologo)
-        st.session_state.proximo_turno_data = cargar_proximo_turno(dni_psicologo)
         st.session_state.last_loaded_dni = dni_psicologo
 
 def forzar_recarga_datos():
@@ -261,30 +513,71 @@ with st.sidebar:
     # NUEVA SECCIÓN: Configuración de precios
     st.markdown("---")
     st.markdown("## 💰 Configuración de Precios")
-    
-    if 'precio_sesion' in st.session_state and st.session_state.precio_sesion > 0:
-        st.success(f"Precio configurado: ${st.session_state.precio_sesion:,.2f}")
-        if st.button("Cambiar precio"):
-            if 'precio_sesion' in st.session_state:
-                del st.session_state.precio_sesion
-            st.rerun()
-    else:
+
+    tabla_precios = cargar_tabla_precios(dni_psicologo_logueado)
+    precio_general_hoy = tabla_precios.precio_general(date.today())
+    if precio_general_hoy is not None:
+        st.success(f"Precio general vigente: ${precio_general_hoy:,.2f}")
+
+    with st.expander("Agregar precio", expanded=precio_general_hoy is None):
+        alcance_precio = st.radio("Aplica a", ["Todos los pacientes", "Un paciente", "Una obra social"],
+                                  key="alcance_precio")
+        dni_paciente_precio, obra_social_precio = None, None
+        if alcance_precio == "Un paciente":
+            pacientes_precio = {p['nombre']: p['dni'] for p in st.session_state.get('pacientes_asignados', [])}
+            nombre_precio = st.selectbox("Paciente", list(pacientes_precio.keys()), key="paciente_precio")
+            dni_paciente_precio = pacientes_precio.get(nombre_precio)
+        elif alcance_precio == "Una obra social":
+            obra_social_precio = st.selectbox("Obra social", sorted(set(tabla_precios.obras_sociales.values())),
+                                              key="obra_social_precio")
+
         precio_input = st.number_input(
             "Precio por sesión:",
             min_value=0.0,
             value=0.0,
             step=100.0,
             format="%.2f",
-            help="Configure el precio que se aplicará automáticamente a los ingresos"
+            help="Se aplica automáticamente a los ingresos de las sesiones desde la fecha de vigencia"
         )
-        
+        vigente_desde_input = st.date_input("Vigente desde", value=date.today(), key="vigente_desde_precio")
+
         if st.button("💾 Guardar precio", type="primary"):
-            if precio_input > 0:
-                st.session_state.precio_sesion = precio_input
+            if precio_input <= 0:
+                st.error("Ingrese un precio válido mayor a 0")
+            elif alcance_precio == "Un paciente" and not dni_paciente_precio:
+                st.error("Seleccione un paciente")
+            elif alcance_precio == "Una obra social" and not obra_social_precio:
+                st.error("Seleccione una obra social")
+            elif guardar_precio_sesion(dni_psicologo_logueado, precio_input, vigente_desde_input,
+                                       dni_paciente=dni_paciente_precio, obra_social=obra_social_precio):
+                invalidar_precios()
                 st.success(f"✅ Precio guardado: ${precio_input:,.2f}")
                 st.rerun()
             else:
-                st.error("Ingrese un precio válido mayor a 0")
+                st.error("❌ No se pudo guardar el precio")
+
+    reglas_precios = cargar_reglas_precios(dni_psicologo_logueado)
+    if not reglas_precios.empty:
+        with st.expander("Precios configurados"):
+            nombres_pacientes = cargar_nombres_pacientes(dni_psicologo_logueado)
+            etiquetas_reglas = {}
+            for regla in reglas_precios.to_dict('records'):
+                if pd.notna(regla['dni_paciente']):
+                    alcance = nombres_pacientes.get(str(regla['dni_paciente']), str(regla['dni_paciente']))
+                elif pd.notna(regla['obra_social']):
+                    alcance = regla['obra_social']
+                else:
+                    alcance = "General"
+                etiquetas_reglas[f"{alcance}: ${regla['precio']:,.2f} desde {regla['vigente_desde']:%d/%m/%Y}"] = regla['id_precio']
+            for etiqueta in etiquetas_reglas:
+                st.write(etiqueta)
+            reglas_a_eliminar = st.multiselect("Eliminar", list(etiquetas_reglas.keys()), key="precios_eliminar")
+            if reglas_a_eliminar and st.button("Eliminar seleccionados", key="eliminar_precios"):
+                if eliminar_precios_sesion([etiquetas_reglas[r] for r in reglas_a_eliminar], dni_psicologo_logueado):
+                    invalidar_precios()
+                    st.rerun()
+                else:
+                    st.error("❌ No se pudieron eliminar los precios")
 
     col1, col2, col3 = st.columns([1, 2, 1])
     with col2:
@@ -298,8 +591,8 @@ with st.sidebar:
 st.markdown('<div class="title-container"><h1 class="title-text"> SESIONES </h1></div>', unsafe_allow_html=True)
 
 # MOSTRAR ALERTA SI NO HAY PRECIO CONFIGURADO
-if 'precio_sesion' not in st.session_state or st.session_state.precio_sesion <= 0:
-    st.warning("⚠️ **Atención:** No has configurado el precio por sesión. Los ingresos se crearán con valor $0. Configura el precio en el panel lateral.")
+if precio_general_hoy is None:
+    st.warning("⚠️ **Atención:** No has configurado un precio general por sesión. Los ingresos de pacientes sin un precio propio se crearán con valor $0. Configura el precio en el panel lateral.")
 
 col_btn, col_welcome = st.columns([1, 2])
 with col_btn:
@@ -310,17 +603,90 @@ with col_btn:
 if st.session_state.get('show_form', False):
     st.markdown("### 📝 Registrar Notas de un Turno")
 
-    turnos_pendientes = cargar_turnos_pendientes(dni_psicologo_logueado)
+    dias_ventana = st.session_state.get('dias_ventana_pendientes', DIAS_VENTANA_PENDIENTES)
+    desde_pendientes = date.today() - timedelta(days=dias_ventana)
+    turnos_pendientes = cargar_turnos_pendientes(dni_psicologo_logueado, desde_pendientes)
+
+    col_ventana, col_anteriores = st.columns([3, 1])
+    col_ventana.caption(f"Turnos sin registrar desde el {desde_pendientes.strftime('%d/%m/%Y')}.")
+    if col_anteriores.button("Cargar anteriores", key="cargar_pendientes_anteriores"):
+        st.session_state.dias_ventana_pendientes = dias_ventana + DIAS_VENTANA_PENDIENTES
+        st.rerun()
     
+    modo_registro = st.radio("Modo de registro", ["Un turno", "Varios turnos"], horizontal=True,
+                             key="modo_registro_sesiones")
+
     if turnos_pendientes.empty:
         st.warning("No tienes turnos pendientes de registrar.")
+    elif modo_registro == "Varios turnos":
+        st.caption("Marque los turnos a registrar. Las notas y los temas son obligatorios si el paciente asistió.")
+        df_lote = turnos_pendientes.assign(
+            registrar=False, asistencia="asistio", estado="pendiente",
+            temas_principales_desarrollados="", notas_de_la_sesion=""
+        )[['registrar', 'nombre_paciente', 'fecha', 'hora', 'asistencia', 'estado',
+           'temas_principales_desarrollados', 'notas_de_la_sesion', 'id_turnos', 'dni_paciente']]
+
+        df_editado = st.data_editor(
+            df_lote,
+            hide_index=True,
+            use_container_width=True,
+            disabled=['nombre_paciente', 'fecha', 'hora', 'id_turnos', 'dni_paciente'],
+            column_order=['registrar', 'nombre_paciente', 'fecha', 'hora', 'asistencia', 'estado',
+                          'temas_principales_desarrollados', 'notas_de_la_sesion'],
+            column_config={
+                "registrar": st.column_config.CheckboxColumn("Registrar"),
+                "nombre_paciente": "Paciente",
+                "fecha": st.column_config.DateColumn("Fecha", format="DD/MM/YYYY"),
+                "hora": "Hora",
+                "asistencia": st.column_config.SelectboxColumn("Asistencia", options=["asistio", "no asistio"], required=True),
+                "estado": st.column_config.SelectboxColumn("Estado", options=["pendiente", "pago"], required=True),
+                "temas_principales_desarrollados": st.column_config.TextColumn("Temas", width="medium"),
+                "notas_de_la_sesion": st.column_config.TextColumn("Notas", width="large"),
+            },
+            key="editor_lote_sesiones"
+        )
+
+        seleccionadas = df_editado[df_editado['registrar']]
+        sin_precio = pacientes_sin_precio(seleccionadas[['dni_paciente', 'fecha', 'nombre_paciente']]
+                                          .to_dict('records'), dni_psicologo_logueado)
+        confirmar_sin_precio = False
+        if sin_precio:
+            st.warning(f"⚠️ No hay un precio vigente para: {', '.join(sin_precio)}. "
+                       "Configure el precio en la barra lateral o confirme registrar esos ingresos en $0.")
+            confirmar_sin_precio = st.checkbox("Registrar esos ingresos en $0", key="lote_confirmar_sin_precio")
+        if st.button(f"💾 Guardar {len(seleccionadas)} sesiones", type="primary",
+                     disabled=seleccionadas.empty or (bool(sin_precio) and not confirmar_sin_precio),
+                     key="guardar_lote_sesiones"):
+            asistieron = seleccionadas['asistencia'] == 'asistio'
+            incompletas = asistieron & ((seleccionadas['notas_de_la_sesion'].fillna('').str.strip() == '') |
+                                        (seleccionadas['temas_principales_desarrollados'].fillna('').str.strip() == ''))
+            if incompletas.any():
+                st.warning(f"⚠️ Complete notas y temas de: {', '.join(seleccionadas.loc[incompletas, 'nombre_paciente'])}.")
+            else:
+                filas = (seleccionadas.rename(columns={'id_turnos': 'id_turno'})
+                         .fillna({'notas_de_la_sesion': '', 'temas_principales_desarrollados': ''})
+                         .to_dict('records'))
+                guardadas, sin_ficha, sin_precio = guardar_sesiones_en_lote(filas, dni_psicologo_logueado,
+                                                                           permitir_sin_precio=confirmar_sin_precio)
+                if sin_ficha:
+                    st.error(f"❌ No se guardó ninguna sesión: falta la ficha médica de {', '.join(sin_ficha)}.")
+                elif sin_precio:
+                    st.error(f"❌ No se guardó ninguna sesión: no hay precio vigente para {', '.join(sin_precio)}.")
+                elif guardadas:
+                    obtener_buscador_sesiones().indexar_sesiones(dni_psicologo_logueado, guardadas)
+                    st.success(f"✅ {len(guardadas)} sesiones guardadas con sus ingresos.")
+                    st.session_state.show_form = False
+                    forzar_recarga_datos()
+                    st.rerun()
+                else:
+                    st.error("❌ Error al guardar las sesiones. No se registró ningún cambio.")
     else:
         with st.form("nueva_sesion_form", clear_on_submit=True):
-            turnos_options = {}
-            for index, row in turnos_pendientes.iterrows():
-                fecha_str = pd.to_datetime(row['fecha']).strftime('%d/%m/%Y')
-                key = f"{row['nombre_paciente']} - {fecha_str} {row['hora']}"
-                turnos_options[key] = {"id_turno": row['id_turnos']}
+            etiquetas = (turnos_pendientes['nombre_paciente'].astype(str) + " - " +
+                         pd.to_datetime(turnos_pendientes['fecha']).dt.strftime('%d/%m/%Y') + " " +
+                         turnos_pendientes['hora'].astype(str))
+            turnos_options = dict(zip(etiquetas, turnos_pendientes[['id_turnos', 'fecha', 'nombre_paciente']]
+                                      .rename(columns={'id_turnos': 'id_turno'}).to_dict('records')))
             
             opciones_lista = ["Seleccionar un turno..."] + list(turnos_options.keys())
 
@@ -359,6 +725,12 @@ if st.session_state.get('show_form', False):
                 key="estado_sesion_radio"
             )
 
+            confirmar_sin_precio = st.checkbox(
+                "Si no hay precio vigente, registrar el ingreso en $0",
+                value=False,
+                key="confirmar_sin_precio"
+            )
+
             submitted = st.form_submit_button("💾 Guardar Sesión", type="primary")
 
             if submitted:
@@ -376,6 +748,13 @@ if st.session_state.get('show_form', False):
                     
                     dni_paciente = df_dni_paciente.iloc[0]['dni_paciente']
 
+                    if (not confirmar_sin_precio and
+                            manejador_ingresos.obtener_precio_sesion(dni_psicologo_logueado, dni_paciente,
+                                                                     turno_info['fecha']) is None):
+                        st.warning(f"⚠️ No hay un precio vigente para {turno_info['nombre_paciente']}. "
+                                   "Configure el precio en la barra lateral o marque la opción para registrar el ingreso en $0.")
+                        st.stop()
+
                     # Obtener ID de ficha médica
                     query_id_fichamedica = f"SELECT id_ficha_medica FROM ficha_medica WHERE dni_paciente = '{dni_paciente}'"
                     df_id_fichamedica = execute_query(query_id_fichamedica, is_select=True)
@@ -394,7 +773,9 @@ if st.session_state.get('show_form', False):
                         'asistencia': asistencia,
                         'notas_de_la_sesion': notas_sesion,
                         'temas_principales_desarrollados': temas_principales,
-                        'estado': estado_sesion
+                        'estado': estado_sesion,
+                        'fecha': turno_info['fecha'],
+                        'nombre_paciente': turno_info['nombre_paciente']
                     }
                     
                     # CAMBIO PRINCIPAL: Usar la nueva función que crea sesión + ingreso
@@ -411,13 +792,13 @@ if st.session_state.get('show_form', False):
 # --- RESTO DEL CÓDIGO (mantener igual) ---
 st.markdown("### 📋 Sesiones Registradas")
 
-df_sesiones = st.session_state.get('sesiones', pd.DataFrame())
+resumen_sesiones = cargar_resumen_sesiones(dni_psicologo_logueado)
 
-if not df_sesiones.empty:
+if resumen_sesiones['total'] > 0:
     st.markdown('<div class="metric-container">', unsafe_allow_html=True)
     col1, col2, col3, col4 = st.columns(4)
-    presentes = df_sesiones['asistencia'].eq('asistio').sum() 
-    total = len(df_sesiones)
+    presentes = resumen_sesiones['presentes']
+    total = resumen_sesiones['total']
     with col1: st.metric("Total de Sesiones", total)
     with col2: st.metric("Presentes", presentes)
     with col3: st.metric("Ausentes", total - presentes)
@@ -425,48 +806,114 @@ if not df_sesiones.empty:
     st.markdown('</div>', unsafe_allow_html=True)
 
     st.markdown("#### 🔍 Filtros")
-    col1, col2, col3, col4 = st.columns(4) 
+    col1, col2, col3, col4, col5 = st.columns(5)
     filtro_paciente = col1.text_input("Buscar por nombre o DNI", key="filtro_paciente")
+    filtro_notas = col5.text_input("Buscar en notas y temas", key="filtro_notas")
     filtro_asistencia = col2.selectbox("Filtrar por asistencia", ["Todos", "asistio", "no asistio"], key="filtro_asistencia") 
     filtro_fecha = col3.date_input("Filtrar por fecha", value=None, key="filtro_fecha")
     filtro_estado = col4.selectbox("Filtrar por estado", ["Todos", "pendiente", "pago"], key="filtro_estado_sesion") 
 
-    df_filtrado = df_sesiones.copy()
-    if filtro_paciente:
-        df_filtrado = df_filtrado[df_filtrado['nombre_paciente'].str.contains(filtro_paciente, case=False, na=False) | df_filtrado['dni_paciente'].astype(str).str.contains(filtro_paciente, na=False)]
-    if filtro_asistencia != "Todos":
-        df_filtrado = df_filtrado[df_filtrado['asistencia'] == filtro_asistencia]
-    if filtro_fecha:
-        df_filtrado['fecha_sesion_from_turno'] = pd.to_datetime(df_filtrado['fecha_sesion_from_turno']).dt.date
-        df_filtrado = df_filtrado[df_filtrado['fecha_sesion_from_turno'] == filtro_fecha]
-    if filtro_estado != "Todos": 
-        df_filtrado = df_filtrado[df_filtrado['estado'] == filtro_estado]
-
-    st.dataframe(df_filtrado, use_container_width=True, hide_index=True,
-        column_config={
-            "id_sesion": "ID Sesión", 
-            "dni_paciente": "DNI Paciente", 
-            "nombre_paciente": "Paciente",
-            "fecha_sesion_from_turno": st.column_config.DateColumn("Fecha Sesión", format="DD/MM/YYYY"),
-            "notas_de_la_sesion": st.column_config.TextColumn("Notas", width="large"),
-            "temas_principales_desarrollados": st.column_config.TextColumn("Temas Desarrollados", width="medium"),
-            "id_turno": "ID Turno", 
-            "id_fichamedica": "ID Ficha Médica", 
-            "estado": "Estado",
-            "asistencia": "Asistencia"
-        }, height=400)
+    filtros = {
+        'paciente': filtro_paciente.strip() or None,
+        'asistencia': None if filtro_asistencia == "Todos" else filtro_asistencia,
+        'fecha': filtro_fecha,
+        'estado': None if filtro_estado == "Todos" else filtro_estado,
+        'texto_notas': filtro_notas.strip() or None,
+    }
+
+    if filtros['texto_notas']:
+        resultados_busqueda = buscar_en_sesiones(dni_psicologo_logueado, filtros['texto_notas'])
+        with st.expander(f"🔎 Coincidencias más relevantes para \"{filtros['texto_notas']}\" ({len(resultados_busqueda)})",
+                         expanded=True):
+            for resultado in resultados_busqueda.to_dict('records'):
+                st.markdown(f"**{resultado['nombre_paciente']}** · {pd.to_datetime(resultado['fecha']).strftime('%d/%m/%Y')}  \n"
+                            f"{resultado['fragmento']}")
+
+    # Pila de cursores: cursores[i] es el punto de inicio de la página i.
+    # Se reinicia cuando cambian los filtros.
+    if st.session_state.get('filtros_sesiones') != filtros:
+        st.session_state.filtros_sesiones = filtros
+        st.session_state.cursores_sesiones = [None]
+    cursores = st.session_state.cursores_sesiones
+
+    df_pagina, hay_mas = cargar_pagina_sesiones(dni_psicologo_logueado, despues_de=cursores[-1], **filtros)
+
+    # Solo se cargan las notas de la página visible
+    if not df_pagina.empty:
+        df_notas = cargar_notas_sesiones(tuple(df_pagina['id_sesion'].tolist()))
+        df_pagina = df_pagina.merge(df_notas, on='id_sesion', how='left')
+
+    col_pag_prev, col_pag_info, col_pag_next = st.columns([1, 3, 1])
+    with col_pag_prev:
+        if st.button("◀ Más recientes", key="sesiones_pagina_prev", disabled=len(cursores) == 1, use_container_width=True):
+            cursores.pop()
+            st.rerun()
+    with col_pag_info:
+        st.markdown(f"<div style='text-align: center;'>Página {len(cursores)}</div>", unsafe_allow_html=True)
+    with col_pag_next:
+        if st.button("Más antiguas ▶", key="sesiones_pagina_next", disabled=not hay_mas, use_container_width=True):
+            ultima = df_pagina.iloc[-1]
+            cursores.append((ultima['fecha_sesion_from_turno'], int(ultima['id_sesion'])))
+            st.rerun()
+
+    if df_pagina.empty:
+        st.info("No hay sesiones que coincidan con los filtros.")
+    else:
+        st.dataframe(df_pagina, use_container_width=True, hide_index=True,
+            column_config={
+                "id_sesion": "ID Sesión", 
+                "dni_paciente": "DNI Paciente", 
+                "nombre_paciente": "Paciente",
+                "fecha_sesion_from_turno": st.column_config.DateColumn("Fecha Sesión", format="DD/MM/YYYY"),
+                "notas_de_la_sesion": st.column_config.TextColumn("Notas", width="large"),
+                "temas_principales_desarrollados": st.column_config.TextColumn("Temas Desarrollados", width="medium"),
+                "id_turno": "ID Turno", 
+                "id_fichamedica": "ID Ficha Médica", 
+                "estado": "Estado",
+                "asistencia": "Asistencia"
+            }, height=400)
+
+    # --- ASISTENCIA POR PACIENTE ---
+    with st.expander("👥 Asistencia por paciente"):
+        df_asistencia = cargar_asistencia_por_paciente(dni_psicologo_logueado)
+        if df_asistencia.empty:
+            st.info("No hay datos de asistencia.")
+        else:
+            st.dataframe(df_asistencia.drop(columns=['dni_paciente']), use_container_width=True, hide_index=True,
+                column_config={
+                    "nombre_paciente": "Paciente",
+                    "total": "Sesiones",
+                    "presentes": "Presentes",
+                    "tasa_asistencia": st.column_config.ProgressColumn("% Asistencia", format="%.0f%%", min_value=0, max_value=100),
+                    "ultima_asistencia": st.column_config.DateColumn("Última asistencia", format="DD/MM/YYYY"),
+                    "ultima_sesion": st.column_config.DateColumn("Último turno", format="DD/MM/YYYY"),
+                    "racha_actual": st.column_config.NumberColumn("Racha actual", help="Positiva: asistencias seguidas. Negativa: ausencias seguidas."),
+                    "mejor_racha": "Mejor racha",
+                    "max_ausencias_seguidas": "Máx. ausencias seguidas",
+                })
+
+            pacientes_tendencia = {"Todos los pacientes": None}
+            pacientes_tendencia.update(dict(zip(df_asistencia['nombre_paciente'], df_asistencia['dni_paciente'].astype(str))))
+            paciente_tendencia = st.selectbox("Tendencia mensual de", list(pacientes_tendencia.keys()), key="paciente_tendencia")
+            df_tendencia = cargar_tendencia_asistencia(dni_psicologo_logueado, pacientes_tendencia[paciente_tendencia])
+            if df_tendencia.empty:
+                st.info("Sin sesiones en los últimos 12 meses.")
+            else:
+                st.line_chart(df_tendencia.set_index('mes')[['% asistencia']])
 else:
     st.info("Aún no tienes sesiones registradas.")
 
 # --- PRÓXIMO TURNO Y FOOTER ---
 st.markdown("---")
-proximo_turno = st.session_state.get('proximo_turno_data')
-if proximo_turno:
+# Servicio compartido con la agenda: misma consulta y misma caché
+proximos_turnos = cargar_proximos_turnos(dni_psicologo_logueado)[:1]
+if proximos_turnos:
+    proximo_turno = proximos_turnos[0]
     st.markdown(f"""
     <div class="proximo-turno-card">
         <div class="proximo-turno-title">📅 Próximo Turno</div>
-        <div class="turno-info"><strong>Día:</strong> {traducir_dia(proximo_turno['dia'])}</div>
-        <div class="turno-info"><strong>Fecha:</strong> {proximo_turno['fecha']}</div>
+        <div class="turno-info"><strong>Día:</strong> {traducir_dia(proximo_turno['fecha'].strftime('%A'))}</div>
+        <div class="turno-info"><strong>Fecha:</strong> {proximo_turno['fecha'].strftime('%d/%m/%Y')}</div>
         <div class="turno-info"><strong>Horario:</strong> {proximo_turno['horario']}</div>
         <div class="turno-info"><strong>Paciente:</strong> <span class="turno-paciente">{proximo_turno['paciente']}</span></div>
     </div>
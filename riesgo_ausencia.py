@@ -0,0 +1,222 @@
+"""
+Modelo de riesgo de ausencia para los próximos turnos.
+
+Es una regresión logística chica, entrenada offline con numpy sobre el historial
+de asistencia (sesiones + turnos) y guardada como coeficientes en un JSON. La
+aplicación solo carga ese archivo y puntúa todos los turnos próximos de un
+psicólogo en un único cálculo vectorizado.
+
+Variables (el historial se cuenta por par psicólogo-paciente, igual al entrenar y al puntuar):
+- Tasa de ausencias previas del paciente con el psicólogo (suavizada para pacientes nuevos).
+- Cantidad de sesiones previas con el psicólogo (log).
+- Día de la semana y hora del turno.
+- Días desde el turno anterior del paciente. La tabla turnos no guarda cuándo se
+  dio el turno, así que esta distancia reemplaza a la anticipación de la reserva.
+
+Entrenamiento:
+    python riesgo_ausencia.py
+"""
+
+import json
+import os
+from datetime import date
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from functions import execute_query
+
+RUTA_MODELO = os.getenv("MODELO_RIESGO_AUSENCIA", "modelo_riesgo_ausencia.json")
+
+# Prior de la tasa de ausencias: equivale a haber visto 1 ausencia en 5 sesiones
+PRIOR_AUSENCIAS = 1.0
+PRIOR_SESIONES = 5.0
+DIAS_MAXIMOS_ENTRE_TURNOS = 90
+
+VARIABLES = ['tasa_ausencias', 'log_sesiones_previas', 'dias_desde_anterior', 'primer_turno',
+             'hora', 'hora_cuadrado', 'martes', 'miercoles', 'jueves', 'viernes', 'sabado', 'domingo']
+
+
+def matriz_variables(df):
+    """
+    Convierte las filas de turnos en la matriz de variables del modelo (vectorizado).
+
+    Args:
+        df (pandas.DataFrame): Columnas fecha, hora, sesiones_previas, ausencias_previas
+            y dias_desde_anterior (nulo si es el primer turno del paciente).
+
+    Returns:
+        numpy.ndarray: Matriz de n filas x len(VARIABLES) columnas.
+    """
+    sesiones = df['sesiones_previas'].to_numpy(dtype=float)
+    ausencias = df['ausencias_previas'].to_numpy(dtype=float)
+    dias = pd.to_numeric(df['dias_desde_anterior'], errors='coerce').to_numpy(dtype=float)
+    horas = pd.to_timedelta(df['hora'].astype(str)).dt.total_seconds().to_numpy() / 3600
+    dia_semana = pd.to_datetime(df['fecha']).dt.weekday.to_numpy()
+
+    primer_turno = np.isnan(dias)
+    dias = np.clip(np.where(primer_turno, DIAS_MAXIMOS_ENTRE_TURNOS, dias), 0, DIAS_MAXIMOS_ENTRE_TURNOS)
+    hora_centrada = (horas - 14) / 4
+
+    columnas = [
+        (ausencias + PRIOR_AUSENCIAS) / (sesiones + PRIOR_SESIONES),
+        np.log1p(sesiones),
+        dias / DIAS_MAXIMOS_ENTRE_TURNOS,
+        primer_turno.astype(float),
+        hora_centrada,
+        hora_centrada ** 2,
+    ]
+    # Día de la semana en one-hot, con el lunes como referencia
+    columnas += [(dia_semana == d).astype(float) for d in range(1, 7)]
+    return np.column_stack(columnas)
+
+
+def cargar_modelo(ruta=RUTA_MODELO):
+    """
+    Lee los coeficientes del modelo; devuelve None si todavía no se entrenó.
+    La caché se indexa por la fecha de modificación del archivo, así un reentrenamiento
+    se toma sin reiniciar la aplicación.
+    """
+    if not os.path.exists(ruta):
+        return None
+    return _leer_modelo(ruta, os.path.getmtime(ruta))
+
+
+@lru_cache(maxsize=4)
+def _leer_modelo(ruta, modificado):
+    with open(ruta, encoding="utf-8") as archivo:
+        modelo = json.load(archivo)
+    if modelo.get('variables') != VARIABLES:
+        return None  # Modelo entrenado con otras variables: hay que reentrenar
+    return {
+        'media': np.array(modelo['media']),
+        'desvio': np.array(modelo['desvio']),
+        'coeficientes': np.array(modelo['coeficientes']),
+        'intercepto': float(modelo['intercepto']),
+    }
+
+
+def predecir(modelo, X):
+    """Probabilidad de ausencia para cada fila de X."""
+    z = ((X - modelo['media']) / modelo['desvio']) @ modelo['coeficientes'] + modelo['intercepto']
+    return 1 / (1 + np.exp(-z))
+
+
+def puntuar_proximos_turnos(dni_psicologo):
+    """
+    Calcula el riesgo de ausencia de todos los turnos próximos del psicólogo.
+
+    Una consulta trae los turnos desde hoy con el historial de cada paciente
+    (ausencias y sesiones previas, distancia al turno anterior) y el modelo se
+    aplica a todas las filas juntas.
+
+    Returns:
+        dict: id_turno -> probabilidad de ausencia (0-1). Vacío si no hay modelo entrenado.
+    """
+    modelo = cargar_modelo()
+    if modelo is None:
+        return {}
+
+    query = """
+    WITH turnos_psicologo AS (
+        SELECT id_turnos, dni_paciente, fecha, hora,
+               fecha - lag(fecha) OVER (PARTITION BY dni_paciente ORDER BY fecha, hora) AS dias_desde_anterior
+        FROM turnos
+        WHERE dni_psicologo = %s
+    ),
+    historial AS (
+        SELECT t.dni_paciente,
+               count(*) AS sesiones_previas,
+               count(*) FILTER (WHERE s.asistencia <> 'asistio') AS ausencias_previas
+        FROM sesiones s
+        JOIN turnos t ON s.id_turno = t.id_turnos
+        WHERE t.dni_psicologo = %s
+        GROUP BY t.dni_paciente
+    )
+    SELECT tp.id_turnos, tp.fecha, tp.hora, tp.dias_desde_anterior,
+           coalesce(h.sesiones_previas, 0) AS sesiones_previas,
+           coalesce(h.ausencias_previas, 0) AS ausencias_previas
+    FROM turnos_psicologo tp
+    LEFT JOIN historial h ON h.dni_paciente = tp.dni_paciente
+    WHERE tp.fecha >= current_date
+    """
+    df = execute_query(query, conn=None, is_select=True, params=(dni_psicologo, dni_psicologo))
+    if df is None or df.empty:
+        return {}
+    probabilidades = predecir(modelo, matriz_variables(df))
+    return dict(zip(df['id_turnos'].astype(int).tolist(), probabilidades.round(3).tolist()))
+
+
+# --- ENTRENAMIENTO OFFLINE ---
+
+def cargar_datos_entrenamiento():
+    """Historial de todas las sesiones con las variables calculadas con lo que se sabía antes de cada turno."""
+    query = """
+    WITH turnos_con_anterior AS (
+        SELECT id_turnos, dni_psicologo, dni_paciente, fecha, hora,
+               fecha - lag(fecha) OVER (PARTITION BY dni_psicologo, dni_paciente ORDER BY fecha, hora) AS dias_desde_anterior
+        FROM turnos
+    )
+    SELECT t.fecha, t.hora, t.dias_desde_anterior,
+           count(*) OVER previas AS sesiones_previas,
+           count(*) FILTER (WHERE s.asistencia <> 'asistio') OVER previas AS ausencias_previas,
+           (s.asistencia <> 'asistio')::int AS ausente
+    FROM sesiones s
+    JOIN turnos_con_anterior t ON s.id_turno = t.id_turnos
+    WINDOW previas AS (PARTITION BY t.dni_psicologo, t.dni_paciente ORDER BY t.fecha, t.hora
+                       ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+    """
+    return execute_query(query, conn=None, is_select=True)
+
+
+def entrenar(X, y, iteraciones=3000, tasa_aprendizaje=0.1, regularizacion=1e-3):
+    """Regresión logística con descenso por gradiente y regularización L2 (variables estandarizadas)."""
+    media = X.mean(axis=0)
+    desvio = X.std(axis=0)
+    desvio[desvio == 0] = 1
+    Xs = (X - media) / desvio
+
+    coeficientes = np.zeros(X.shape[1])
+    intercepto = np.log(y.mean() / (1 - y.mean()))
+    for _ in range(iteraciones):
+        p = 1 / (1 + np.exp(-(Xs @ coeficientes + intercepto)))
+        error = p - y
+        coeficientes -= tasa_aprendizaje * (Xs.T @ error / len(y) + regularizacion * coeficientes)
+        intercepto -= tasa_aprendizaje * error.mean()
+    return {'media': media, 'desvio': desvio, 'coeficientes': coeficientes, 'intercepto': intercepto}
+
+
+if __name__ == '__main__':
+    df = cargar_datos_entrenamiento()
+    if df is None or df.empty:
+        raise SystemExit("No hay sesiones registradas para entrenar el modelo.")
+
+    y = df['ausente'].to_numpy(dtype=float)
+    if y.min() == y.max():
+        raise SystemExit("El historial tiene una sola clase (todas asistencias o todas ausencias).")
+
+    X = matriz_variables(df)
+    # Validación temporal: se entrena con el 80 % más antiguo y se evalúa con el resto
+    orden = np.argsort(pd.to_datetime(df['fecha']).to_numpy(), kind='stable')
+    corte = int(len(orden) * 0.8)
+    modelo = entrenar(X[orden[:corte]], y[orden[:corte]])
+    if corte < len(orden):
+        p = np.clip(predecir(modelo, X[orden[corte:]]), 1e-6, 1 - 1e-6)
+        y_prueba = y[orden[corte:]]
+        log_loss = -np.mean(y_prueba * np.log(p) + (1 - y_prueba) * np.log(1 - p))
+        print(f"Log-loss en validación ({len(y_prueba)} sesiones): {log_loss:.4f} "
+              f"(tasa base de ausencias: {y_prueba.mean():.1%})")
+
+    modelo = entrenar(X, y)
+    with open(RUTA_MODELO, "w", encoding="utf-8") as archivo:
+        json.dump({
+            'variables': VARIABLES,
+            'media': modelo['media'].tolist(),
+            'desvio': modelo['desvio'].tolist(),
+            'coeficientes': modelo['coeficientes'].tolist(),
+            'intercepto': float(modelo['intercepto']),
+            'sesiones': int(len(y)),
+            'entrenado': date.today().isoformat(),
+        }, archivo, indent=2)
+    print(f"Modelo guardado en {RUTA_MODELO} ({len(y)} sesiones).")
@@ -0,0 +1,5 @@
+-- Índices para las consultas de la agenda.
+
+-- Agenda de la clínica: todos los turnos de una ventana de fechas.
+CREATE INDEX IF NOT EXISTS idx_turnos_fecha_hora
+    ON turnos (fecha, hora);
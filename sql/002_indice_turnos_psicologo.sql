@@ -0,0 +1,4 @@
+-- Próximos turnos de un psicólogo (cargar_proximos_turnos): búsqueda por
+-- (dni_psicologo, fecha, hora) >= ahora con ORDER BY ... LIMIT k.
+CREATE INDEX IF NOT EXISTS idx_turnos_psicologo_fecha_hora
+    ON turnos (dni_psicologo, fecha, hora);
@@ -0,0 +1,38 @@
+-- Horarios de atención por psicólogo, bloqueos de agenda y feriados.
+
+-- Plantilla semanal: una fila por rango de atención. Las pausas se expresan
+-- cargando más de un rango para el mismo día (ej. 08:00-12:00 y 14:00-19:00).
+-- dia_semana: 0 = lunes ... 6 = domingo (igual que datetime.date.weekday()).
+CREATE TABLE IF NOT EXISTS horarios_psicologo (
+    id_horario    bigserial PRIMARY KEY,
+    dni_psicologo text NOT NULL,
+    dia_semana    smallint NOT NULL CHECK (dia_semana BETWEEN 0 AND 6),
+    hora_inicio   time NOT NULL,
+    hora_fin      time NOT NULL CHECK (hora_fin > hora_inicio),
+    duracion_slot smallint NOT NULL DEFAULT 30 CHECK (duracion_slot > 0),
+    updated_at    timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_horarios_psicologo_dni
+    ON horarios_psicologo (dni_psicologo, dia_semana);
+
+-- Intervalos en los que un psicólogo no atiende (días bloqueados, compromisos
+-- personales, eventos importados de calendarios externos).
+CREATE TABLE IF NOT EXISTS bloqueos_agenda (
+    id_bloqueo    bigserial PRIMARY KEY,
+    dni_psicologo text NOT NULL,
+    inicio        timestamp NOT NULL,
+    fin           timestamp NOT NULL CHECK (fin > inicio),
+    motivo        text,
+    origen        text NOT NULL DEFAULT 'manual',
+    created_at    timestamptz NOT NULL DEFAULT now()
+);
+
+CREATE INDEX IF NOT EXISTS idx_bloqueos_agenda_dni_inicio
+    ON bloqueos_agenda (dni_psicologo, inicio);
+
+-- Feriados de la clínica (aplican a todos los psicólogos).
+CREATE TABLE IF NOT EXISTS feriados (
+    fecha       date PRIMARY KEY,
+    descripcion text
+);
@@ -0,0 +1,18 @@
+-- Lista de espera: pacientes que quieren un turno en un día y hora preferidos.
+
+-- Una fila por preferencia (un paciente puede anotarse en varios días/horas).
+-- dia_semana: 0 = lunes ... 6 = domingo (igual que datetime.date.weekday()).
+CREATE TABLE IF NOT EXISTS lista_espera (
+    id_espera     bigserial PRIMARY KEY,
+    dni_psicologo text NOT NULL,
+    dni_paciente  text NOT NULL,
+    dia_semana    smallint NOT NULL CHECK (dia_semana BETWEEN 0 AND 6),
+    hora          time NOT NULL,
+    activo        boolean NOT NULL DEFAULT true,
+    created_at    timestamptz NOT NULL DEFAULT now()
+);
+
+-- Solo se consultan las preferencias activas de un psicólogo.
+CREATE INDEX IF NOT EXISTS idx_lista_espera_activa
+    ON lista_espera (dni_psicologo, dia_semana, hora)
+    WHERE activo;
@@ -0,0 +1,9 @@
+-- Índices para el historial de sesiones paginado por clave.
+
+-- Unión sesiones -> turnos y desempate del orden (t.fecha DESC, s.id_sesion DESC).
+CREATE INDEX IF NOT EXISTS idx_sesiones_id_turno
+    ON sesiones (id_turno, id_sesion);
+
+-- Recorrido de los turnos del psicólogo de la fecha más reciente a la más antigua.
+CREATE INDEX IF NOT EXISTS idx_turnos_psicologo_fecha_desc
+    ON turnos (dni_psicologo, fecha DESC, id_turnos);
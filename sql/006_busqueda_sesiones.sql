@@ -0,0 +1,13 @@
+-- Búsqueda de texto completo en las notas de las sesiones.
+
+-- Vector de búsqueda en español (con stemming), mantenido por la base.
+-- Los temas pesan más (A) que las notas (B) en ts_rank.
+ALTER TABLE sesiones
+    ADD COLUMN IF NOT EXISTS busqueda tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('spanish', coalesce(temas_principales_desarrollados, '')), 'A') ||
+        setweight(to_tsvector('spanish', coalesce(notas_de_la_sesion, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_sesiones_busqueda
+    ON sesiones USING gin (busqueda);
@@ -0,0 +1,18 @@
+-- Precios de sesión por psicólogo, con vigencia y excepciones.
+
+-- Una fila por regla: general (dni_paciente y obra_social nulos), para un
+-- paciente o para una obra social. Prioridad: paciente > obra social > general.
+-- Para cada fecha rige la regla con el mayor vigente_desde <= fecha.
+CREATE TABLE IF NOT EXISTS precios_sesion (
+    id_precio     bigserial PRIMARY KEY,
+    dni_psicologo text NOT NULL,
+    dni_paciente  text,
+    obra_social   text,
+    precio        numeric(12, 2) NOT NULL CHECK (precio >= 0),
+    vigente_desde date NOT NULL DEFAULT current_date,
+    created_at    timestamptz NOT NULL DEFAULT now(),
+    CHECK (dni_paciente IS NULL OR obra_social IS NULL)
+);
+
+CREATE INDEX IF NOT EXISTS idx_precios_sesion_psicologo
+    ON precios_sesion (dni_psicologo, vigente_desde);
@@ -0,0 +1,7 @@
+-- Índice para el listado y los resúmenes de ingresos de cada psicólogo.
+
+-- Cubre los GROUP BY estado / date_trunc('month', fecha) de los gráficos y el
+-- token de versión (count, max(updated_at)) con un solo recorrido del índice.
+CREATE INDEX IF NOT EXISTS idx_ingresos_psicologo_fecha
+    ON ingresos (dni_psicologo, fecha)
+    INCLUDE (estado, total_sesion, created_at, updated_at);
@@ -0,0 +1,13 @@
+-- Un psicólogo no puede tener dos turnos que empiecen en la misma fecha y hora.
+-- Evita el doble agendamiento cuando dos guardados concurrentes pasan la
+-- verificación de conflictos al mismo tiempo (guardar_serie_turnos_en_bd usa
+-- ON CONFLICT DO NOTHING sobre este índice).
+--
+-- Si ya hay duplicados la creación falla; para listarlos:
+--   SELECT dni_psicologo, fecha, hora, array_agg(id_turnos)
+--   FROM turnos GROUP BY 1, 2, 3 HAVING count(*) > 1;
+CREATE UNIQUE INDEX IF NOT EXISTS uq_turnos_psicologo_fecha_hora
+    ON turnos (dni_psicologo, fecha, hora);
+
+-- El índice único también sirve a cargar_proximos_turnos: el de sql/002 queda duplicado.
+DROP INDEX IF EXISTS idx_turnos_psicologo_fecha_hora;